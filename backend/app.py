@@ -1,13 +1,22 @@
+import time
+startup_start = time.perf_counter()
 from flask import Flask
 from flask_cors import CORS
-from db import init_db
+import atexit
+from db import init_db, close_db_connections
+from message_writer import message_writer
 from utils import setup_logging
 from dotenv import load_dotenv
 from routes.api import api_bp
+from providers import llm_providers
+from tool_manager import tool_manager
+from scheduler import scheduler
+from llm import generate_simple_response
+import os
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Before', 'X-Stream-Id', 'X-Models-Age'])
 
 # Configure logging
 setup_logging(app)
@@ -20,6 +29,24 @@ with app.app_context():
     init_db()
     app.logger.info("Database initialized.")
 
+# Close pooled SQLite connections on shutdown, after the message writer has
+# flushed (atexit runs handlers in reverse order)
+atexit.register(close_db_connections)
+atexit.register(message_writer.close)
+# Stop the tool manager's event loop and the MCP connections it holds
+atexit.register(tool_manager.close)
+atexit.register(scheduler.close)
+
+# Fetch provider model lists concurrently; /api/models serves whatever has loaded
+llm_providers.start_background_loading()
+# Start the worker processes for process-isolated tools before the first request needs them
+tool_manager.warm_process_pool()
+# Run scheduled tasks. `python app.py` starts the debug reloader, whose watcher
+# process only restarts the server, so only the server process it spawns runs them
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    scheduler.start(generate_simple_response)
+app.logger.info(f"Backend started in {(time.perf_counter() - startup_start) * 1000:.0f} ms.")
+
 
 if __name__ == '__main__':
     app.run(debug=True,host='0.0.0.0', port=5000)
@@ -0,0 +1,104 @@
+"""
+ASGI entry point for the async serving mode.
+
+The streaming endpoints (/api/generate, /api/think and /api/edit_message) run
+as async generators on the event loop using the providers' async clients, so
+one worker can hold many concurrent streams without a thread per stream.
+Every other route is served by the regular Flask app through a WSGI adapter.
+
+Run from the backend directory:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from app import app as flask_app
+from llm import generate_response_async, generate_think_response
+from message_writer import message_writer
+from routes.api import RequestError, prepare_generate, prepare_think, prepare_edit, sse_frame
+from stream_registry import stream_registry
+from utils import debug_print, iterate_in_thread
+
+def stream_chunks_async(generate_chunks, model_message=None, stream_id=None):
+    """Async counterpart of routes.api.stream_chunks."""
+    stream_handle = stream_registry.open(stream_id)
+
+    async def stream_response():
+        try:
+            yield sse_frame({'stream_id': stream_handle.id})
+            async for chunk in generate_chunks(stream_handle):
+                if stream_handle.cancelled:
+                    debug_print(True, f"Stream {stream_handle.id} stopped.")
+                    break
+                if model_message:
+                    model_message.append(chunk)
+                yield sse_frame({'response': chunk})
+        finally:
+            if model_message:
+                model_message.finish()
+            stream_registry.close(stream_handle)
+
+    return StreamingResponse(stream_response(), media_type='text/event-stream', headers={'X-Stream-Id': stream_handle.id})
+
+async def generate(request):
+    debug_print(True, "Received request for /api/generate (async)")
+    form = await request.form()
+    image_file = form.get('image')
+    image_bytes = await image_file.read() if image_file and hasattr(image_file, 'read') else None
+    try:
+        # Touches the database and the write queue, so keep it off the event loop
+        conversation_id, generation = await asyncio.to_thread(prepare_generate, form, image_bytes)
+    except RequestError as e:
+        return JSONResponse(e.body, status_code=e.status)
+
+    model_message = message_writer.start_message(conversation_id, "model")
+    return stream_chunks_async(lambda stream_handle: generate_response_async(**generation, stream_handle=stream_handle), model_message, form.get('stream_id'))
+
+async def think(request):
+    debug_print(True, "Received request for /api/think (async)")
+    form = await request.form()
+    try:
+        think_args = prepare_think(form)
+    except RequestError as e:
+        return JSONResponse(e.body, status_code=e.status)
+    # Think chains several sync generations; run them on a worker thread
+    return stream_chunks_async(lambda stream_handle: iterate_in_thread(generate_think_response(**think_args, stream_handle=stream_handle)), stream_id=form.get('stream_id'))
+
+async def edit_message(request):
+    debug_print(True, "Received request to POST /api/edit_message (async)")
+    data = await request.json()
+    try:
+        generation = await asyncio.to_thread(prepare_edit, data)
+    except RequestError as e:
+        return JSONResponse(e.body, status_code=e.status)
+    return stream_chunks_async(lambda stream_handle: generate_response_async(**generation, stream_handle=stream_handle), stream_id=data.get('stream_id'))
+
+streaming_app = Starlette(
+    routes=[
+        Route('/api/generate', generate, methods=['POST']),
+        Route('/api/think', think, methods=['POST']),
+        Route('/api/edit_message', edit_message, methods=['POST']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'], expose_headers=['X-Stream-Id']),
+    ],
+)
+STREAMING_PATHS = {route.path for route in streaming_app.routes}
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+async def application(scope, receive, send):
+    """Routes streaming endpoints to the async app and everything else to Flask."""
+    if scope['type'] == 'lifespan' or scope.get('path') in STREAMING_PATHS:
+        await streaming_app(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host='0.0.0.0', port=5000)
@@ -0,0 +1,83 @@
+"""
+Measures the history tokens and the time to prepare a request as a
+conversation grows, with the full stored history and with the context
+window manager.
+
+A conversation of --turns user/model exchanges, each message about --words
+words long, is written to a temporary database. After every --step turns a
+request is prepared both ways. Summaries are written by an in-process stub
+provider that returns the first words of what it is given, so the run makes
+no LLM calls.
+
+Usage (from the backend directory):
+    python benchmarks/context_window_benchmark.py [--turns 200] [--step 25] [--words 120]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import utils
+
+WORDS = ("model token budget summary request provider latency stream tool cache window history turn "
+         "answer question python sqlite index thread queue retry limit memory context").split()
+
+
+class StubSummarizer:
+    catalog_key = "stub"
+
+    def generate_response(self, prompt, model_name, image=None, history=None, system_message=None, stream_handle=None):
+        yield " ".join(prompt.split()[-200:])
+
+
+def message(words):
+    return " ".join(random.choice(WORDS) for _ in range(words))
+
+
+def run(turns, step, words):
+    utils.DEBUG = False
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as directory:
+        db.DATABASE = os.path.join(directory, "conversations.db")
+        db.init_db()
+        from context_window import context_window
+        from providers import llm_providers
+        llm_providers._instances["stub"] = StubSummarizer()
+        llm_providers._factories["stub"] = None
+        conversation_id = db.save_conversation("stub", "stub", "You are helpful.", "benchmark")
+        print(f"{'turns':>6} {'full tokens':>12} {'full ms':>8} {'packed tokens':>14} {'packed ms':>10}")
+        for turn in range(1, turns + 1):
+            db.add_message_to_conversation(conversation_id, "user", message(words))
+            db.add_message_to_conversation(conversation_id, "model", message(words))
+            if turn % step:
+                continue
+            prompt = message(20)
+            start = time.perf_counter()
+            _, messages = db.get_conversation(conversation_id)
+            full = sum(context_window.counter.count(m["content"]) for m in messages)
+            full_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            _, messages = db.get_conversation(conversation_id, limit=100)
+            history, system_message = context_window.build(conversation_id, messages, "You are helpful.", prompt, "stub", "stub")
+            packed_ms = (time.perf_counter() - start) * 1000
+            packed = sum(context_window.counter.count(m["content"]) for m in history) + context_window.counter.count(system_message)
+            print(f"{turn:>6} {full:>12} {full_ms:>8.1f} {packed:>14} {packed_ms:>10.1f}")
+            # Let the background summary land before the next request
+            context_window._executor.submit(lambda: None).result()
+        print(context_window.metrics())
+        db.close_db_connections()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark history packing as a conversation grows.")
+    parser.add_argument('--turns', type=int, default=200, help="User/model exchanges in the conversation.")
+    parser.add_argument('--step', type=int, default=25, help="Turns between measured requests.")
+    parser.add_argument('--words', type=int, default=120, help="Words per message.")
+    args = parser.parse_args()
+    run(args.turns, args.step, args.words)
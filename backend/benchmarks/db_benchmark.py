@@ -0,0 +1,93 @@
+"""
+Micro-benchmark for the SQLite layer in db.py.
+
+Compares the old connect-per-call pattern against the pooled connections
+used by db.py, reporting inserts/sec and reads/sec for each.
+
+Usage (from the backend directory):
+    python benchmarks/db_benchmark.py [--messages 2000] [--reads 2000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+
+
+def legacy_add_message(database, conversation_id, role, content):
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    timestamp = datetime.now().isoformat()
+    cursor.execute("INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                   (conversation_id, role, content, timestamp))
+    conn.commit()
+    conn.close()
+
+
+def legacy_get_conversation(database, conversation_id):
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,))
+    conversation = cursor.fetchone()
+    cursor.execute("SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at", (conversation_id,))
+    messages = cursor.fetchall()
+    conn.close()
+    return dict(conversation), [dict(message) for message in messages]
+
+
+def use_database(path):
+    db.close_db_connections()
+    db.DATABASE = path
+    db.init_db()
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count / elapsed:>12,.0f} ops/sec  ({elapsed:.3f}s)")
+
+
+def run(messages, reads):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, 'legacy.db')
+        pooled_db = os.path.join(tmp, 'pooled.db')
+
+        # Legacy: fresh connection per call, default rollback journal.
+        conn = sqlite3.connect(legacy_db)
+        with open(os.path.join(os.path.dirname(db.__file__), 'schema.sql')) as f:
+            conn.executescript(f.read())
+        conn.execute("INSERT INTO conversations (provider, model, created_at) VALUES ('bench', 'bench', ?)",
+                     (datetime.now().isoformat(),))
+        conn.commit()
+        conn.close()
+
+        print("before (connect per call)")
+        timed("  inserts", messages, lambda i: legacy_add_message(legacy_db, 1, "user", f"message {i}"))
+        timed("  reads (get_conversation)", reads, lambda i: legacy_get_conversation(legacy_db, 1))
+
+        use_database(pooled_db)
+        conversation_id = db.save_conversation("bench", "bench", None, "bench")
+
+        print("after (pooled, WAL)")
+        timed("  inserts", messages, lambda i: db.add_message_to_conversation(conversation_id, "user", f"message {i}"))
+        timed("  reads (get_conversation)", reads, lambda i: db.get_conversation(conversation_id))
+        db.close_db_connections()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark db.py connection handling.")
+    parser.add_argument('--messages', type=int, default=2000, help="Number of message inserts.")
+    parser.add_argument('--reads', type=int, default=2000, help="Number of conversation reads.")
+    args = parser.parse_args()
+    run(args.messages, args.reads)
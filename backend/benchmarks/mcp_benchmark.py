@@ -0,0 +1,191 @@
+"""
+Latency benchmark for MCP tool calls over HTTP and stdio.
+
+1. Start a stub MCP HTTP server exposing an `echo` tool:
+       python benchmarks/mcp_benchmark.py stub --port 8002 --delay 0.005
+
+2. Compare a new aiohttp session per call (the old McpClient behaviour) with
+   McpClient's pooled keep-alive session (from the backend directory):
+       python benchmarks/mcp_benchmark.py run --url http://127.0.0.1:8002 --calls 500 --concurrency 50
+
+3. Compare spawning a local stdio server per call with McpClient's persistent
+   subprocess (the stdio stub is started by the script itself):
+       python benchmarks/mcp_benchmark.py run-stdio --calls 200 --concurrency 50
+
+For each client the script reports the mean and p99 latency of sequential
+calls and the throughput of calls issued `--concurrency` at a time.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+async def stub_tools(request):
+    return web.json_response([{"name": "echo", "description": "Returns its parameters."}])
+
+
+async def stub_resources(request):
+    return web.json_response([])
+
+
+async def stub_execute(request):
+    params = await request.json()
+    await asyncio.sleep(request.app['delay'])
+    return web.json_response({"tool": request.match_info['name'], "params": params})
+
+
+def run_stub(port, delay):
+    app = web.Application()
+    app['delay'] = delay
+    app.router.add_get('/tools', stub_tools)
+    app.router.add_get('/resources', stub_resources)
+    app.router.add_post('/tools/{name}', stub_execute)
+    web.run_app(app, port=port)
+
+
+def run_stdio_stub():
+    """A minimal MCP server on stdin/stdout exposing the same `echo` tool."""
+    for line in sys.stdin:
+        message = json.loads(line)
+        if "id" not in message:
+            continue
+        method = message["method"]
+        if method == "initialize":
+            result = {"protocolVersion": "2024-11-05", "capabilities": {"tools": {}}, "serverInfo": {"name": "stub", "version": "1"}}
+        elif method == "tools/list":
+            result = {"tools": [{"name": "echo", "description": "Returns its parameters.", "inputSchema": {"type": "object"}}]}
+        elif method == "tools/call":
+            result = {"content": [{"type": "text", "text": json.dumps(message["params"]["arguments"])}]}
+        elif method == "ping":
+            result = {}
+        else:
+            print(json.dumps({"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32601, "message": "Method not found"}}), flush=True)
+            continue
+        print(json.dumps({"jsonrpc": "2.0", "id": message["id"], "result": result}), flush=True)
+
+
+class SessionPerCallClient:
+    """The pre-pooling McpClient.execute_tool: a new session, and connection, per call."""
+    def __init__(self, url):
+        self.url = url
+
+    async def execute_tool(self, tool_name, params):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.url}/tools/{tool_name}", json=params) as resp:
+                return await resp.json()
+
+    async def close(self):
+        pass
+
+
+class ProcessPerCallClient:
+    """The slow path for local servers: a new subprocess and handshake per call."""
+    def __init__(self, command, args):
+        self.command = command
+        self.args = args
+
+    async def execute_tool(self, tool_name, params):
+        from mcp_stdio import McpStdioProcess
+        process = McpStdioProcess("bench", self.command, self.args)
+        try:
+            await process.start()
+            return await process.call("tools/call", {"name": tool_name, "arguments": params})
+        finally:
+            await process.close()
+
+    async def close(self):
+        pass
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def sequential(client, calls):
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        await client.execute_tool("echo", {"i": i})
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def parallel(client, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await client.execute_tool("echo", {"i": i})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return time.perf_counter() - start
+
+
+async def benchmark(label, client, calls, concurrency):
+    try:
+        latencies = await sequential(client, calls)
+        elapsed = await parallel(client, calls, concurrency)
+    finally:
+        await client.close()
+    print(label)
+    print(f"  sequential   mean {sum(latencies) / len(latencies) * 1000:>7.2f} ms   p99 {percentile(latencies, 0.99) * 1000:>7.2f} ms")
+    print(f"  parallel x{concurrency:<3} {calls / elapsed:>9,.0f} calls/sec")
+
+
+async def run_all(args):
+    import utils
+    utils.DEBUG = False
+    from tool_manager import McpClient
+    await benchmark("before (session per call)", SessionPerCallClient(args.url), args.calls, args.concurrency)
+    await benchmark("after (pooled session)", McpClient({"name": "bench", "url": args.url}), args.calls, args.concurrency)
+
+
+async def run_all_stdio(args):
+    import utils
+    utils.DEBUG = False
+    from tool_manager import McpClient
+    command, stub_args = sys.executable, [os.path.abspath(__file__), 'stdio-stub']
+    await benchmark("before (process per call)", ProcessPerCallClient(command, stub_args), args.calls, args.concurrency)
+    client = McpClient({"name": "bench", "command": command, "args": stub_args})
+    await client.connect()
+    await benchmark("after (persistent process)", client, args.calls, args.concurrency)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark MCP HTTP tool-call latency.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    stub = subparsers.add_parser('stub', help="Run a stub MCP HTTP server.")
+    stub.add_argument('--port', type=int, default=8002)
+    stub.add_argument('--delay', type=float, default=0.005, help="Seconds each tool call takes.")
+
+    run = subparsers.add_parser('run', help="Time tool calls against an MCP server.")
+    run.add_argument('--url', default='http://127.0.0.1:8002')
+    run.add_argument('--calls', type=int, default=500)
+    run.add_argument('--concurrency', type=int, default=50)
+
+    run_stdio = subparsers.add_parser('run-stdio', help="Time tool calls against a local stdio MCP server.")
+    run_stdio.add_argument('--calls', type=int, default=200)
+    run_stdio.add_argument('--concurrency', type=int, default=50)
+
+    subparsers.add_parser('stdio-stub', help="Run a stub MCP server on stdin/stdout.")
+
+    args = parser.parse_args()
+    if args.command == 'stub':
+        run_stub(args.port, args.delay)
+    elif args.command == 'stdio-stub':
+        run_stdio_stub()
+    elif args.command == 'run-stdio':
+        asyncio.run(run_all_stdio(args))
+    else:
+        asyncio.run(run_all(args))
@@ -0,0 +1,158 @@
+"""
+Measures Claude prompt cache reads and writes turn by turn in a conversation
+that has outgrown its history budget and is being summarized.
+
+Each turn is packed by the context window manager and sent through ClaudeAPI
+to an in-process stub of the Anthropic client. The stub emulates the prompt
+cache: a request reads the longest prefix that ended at a breakpoint of an
+earlier request, writes up to its own last breakpoint, and caches nothing
+shorter than --min-cacheable tokens. Summaries are written by a stub provider
+that returns the last words of what it is given, so the run makes no API
+calls. The summary and the related older turns change every turn, so only
+the system message and the kept history should be read from the cache.
+
+Usage (from the backend directory):
+    python benchmarks/prompt_cache_benchmark.py [--turns 60] [--words 120] [--system-words 1200]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+
+import claude_api
+import context_window as context_window_module
+import db
+import utils
+
+WORDS = ("model token budget summary request provider latency stream tool cache window history turn "
+         "answer question python sqlite index thread queue retry limit memory context").split()
+
+
+class StubSummarizer:
+    catalog_key = "stub"
+
+    def generate_response(self, prompt, model_name, image=None, history=None, system_message=None, stream_handle=None):
+        yield " ".join(prompt.split()[-200:])
+
+
+class StubPromptCache:
+    """Stands in for client.messages with Anthropic's prefix caching rules."""
+    def __init__(self, counter, min_cacheable):
+        self.counter = counter
+        self.min_cacheable = min_cacheable
+        self.prefixes = set()
+        self.answer = ""
+        self.usage = None
+
+    def _blocks(self, system, messages):
+        blocks = []
+        for block in system if isinstance(system, list) else []:
+            blocks.append(("system", block["text"], "cache_control" in block))
+        for message in messages:
+            content = message["content"]
+            for block in content if isinstance(content, list) else [{"text": content}]:
+                blocks.append((message["role"], block["text"], "cache_control" in block))
+        return blocks
+
+    def create(self, model, max_tokens, messages, stream, system=None):
+        blocks = self._blocks(system, messages)
+        tokens = [self.counter.count(text) for _, text, _ in blocks]
+        keys = []
+        digest = hashlib.sha256()
+        for role, text, _ in blocks:
+            digest.update(json.dumps([role, text]).encode())
+            keys.append(digest.hexdigest())
+        breakpoints = [index for index, (_, _, marked) in enumerate(blocks) if marked]
+        last = breakpoints[-1] if breakpoints else -1
+        # Longest prefix, up to the last breakpoint, that an earlier request cached
+        read_until = next((index for index in range(last, -1, -1) if keys[index] in self.prefixes), -1)
+        read = sum(tokens[:read_until + 1])
+        written = 0
+        for index in breakpoints:
+            if sum(tokens[:index + 1]) >= self.min_cacheable:
+                self.prefixes.add(keys[index])
+                if index > read_until:
+                    written = sum(tokens[read_until + 1:index + 1])
+        uncached = sum(tokens) - read - written
+        self.usage = {"input": uncached, "read": read, "write": written}
+        start_usage = SimpleNamespace(input_tokens=uncached, cache_read_input_tokens=read, cache_creation_input_tokens=written, output_tokens=1)
+        end_usage = SimpleNamespace(input_tokens=None, cache_read_input_tokens=None, cache_creation_input_tokens=None,
+                                    output_tokens=self.counter.count(self.answer))
+        return iter([
+            SimpleNamespace(type="message_start", message=SimpleNamespace(usage=start_usage)),
+            SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(text=self.answer)),
+            SimpleNamespace(type="message_delta", usage=end_usage),
+        ])
+
+
+def message(words):
+    return " ".join(random.choice(WORDS) for _ in range(words))
+
+
+def run(turns, words, system_words, min_cacheable):
+    utils.DEBUG = False
+    random.seed(1)
+    claude_api.STREAM_START_DELAY = claude_api.STREAM_YIELD_DELAY = 0
+    with tempfile.TemporaryDirectory() as directory:
+        db.DATABASE = os.path.join(directory, "conversations.db")
+        db.init_db()
+        from context_window import context_window
+        from providers import llm_providers
+        llm_providers._instances["stub"] = StubSummarizer()
+        llm_providers._factories["stub"] = None
+        context_window_module.CONTEXT_SUMMARY_PROVIDER = "stub"
+
+        claude = claude_api.ClaudeAPI()
+        cache = StubPromptCache(context_window.counter, min_cacheable)
+        claude.client = SimpleNamespace(messages=cache)
+        system_message = message(system_words)
+        conversation_id = db.save_conversation("claude", "stub", system_message, "benchmark")
+
+        print(f"{'turn':>5} {'history':>8} {'uncached':>9} {'cache read':>11} {'cache write':>12}  summarized")
+        totals = {"input": 0, "read": 0, "write": 0}
+        summarized_turns = summarized_reads = 0
+        for turn in range(1, turns + 1):
+            prompt = message(words)
+            _, messages = db.get_conversation(conversation_id, limit=100)
+            history, packed_system = context_window.build(conversation_id, messages, system_message, prompt, "claude", "stub")
+            cache.answer = message(words)
+            answer = "".join(claude.generate_response(prompt, "stub", history=history, system_message=packed_system))
+            db.add_message_to_conversation(conversation_id, "user", prompt)
+            db.add_message_to_conversation(conversation_id, "model", answer)
+            summarized = bool(getattr(packed_system, "context", ""))
+            usage = cache.usage
+            for name in totals:
+                totals[name] += usage[name]
+            if summarized:
+                summarized_turns += 1
+                summarized_reads += usage["read"] > 0
+            history_tokens = sum(context_window.counter.count(m["content"]) for m in history)
+            print(f"{turn:>5} {history_tokens:>8} {usage['input']:>9} {usage['read']:>11} {usage['write']:>12}  {'yes' if summarized else ''}")
+            # Let the background summary land before the next turn
+            context_window._executor.submit(lambda: None).result()
+
+        prompt_tokens = sum(totals.values())
+        print(f"summarized turns reading from the cache: {summarized_reads}/{summarized_turns}")
+        print(f"input tokens: {totals['input']} uncached, {totals['read']} read, {totals['write']} written "
+              f"({totals['read'] / prompt_tokens:.0%} read from the cache)")
+        print(f"context window: {context_window.metrics()}")
+        print(f"prompt cache stats: {claude_api.prompt_cache_stats.metrics()}")
+        db.close_db_connections()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark Claude prompt cache reads in a summarized conversation.")
+    parser.add_argument('--turns', type=int, default=60, help="Turns to send.")
+    parser.add_argument('--words', type=int, default=120, help="Words per prompt and answer.")
+    parser.add_argument('--system-words', type=int, default=1200, help="Words in the system message.")
+    parser.add_argument('--min-cacheable', type=int, default=1024, help="Shortest prefix, in tokens, the cache stores.")
+    args = parser.parse_args()
+    run(args.turns, args.words, args.system_words, args.min_cacheable)
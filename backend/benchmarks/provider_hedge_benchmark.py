@@ -0,0 +1,95 @@
+"""
+Measures time to first token with and without hedging across two providers.
+
+Two in-process stub providers draw their time to first token from a
+log-normal distribution. With --slow-rate, a request instead stalls for
+--stall seconds, like a provider queueing under load. Concurrent requests go
+through the provider router, first with a plain failover route and then with
+the same route hedged. The percentiles compare the two, and "extra requests"
+counts the backups hedging sent.
+
+Usage (from the backend directory):
+    python benchmarks/provider_hedge_benchmark.py [--requests 400] [--concurrency 8] [--slow-rate 0.05]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import provider_router
+import utils
+from providers import llm_providers
+
+
+class StubProvider:
+    def __init__(self, median, slow_rate, stall):
+        self.median = median
+        self.slow_rate = slow_rate
+        self.stall = stall
+
+    def generate_response(self, prompt, model_name, image=None, history=None, system_message=None, stream_handle=None):
+        if random.random() < self.slow_rate:
+            delay = self.stall
+        else:
+            delay = random.lognormvariate(0, 0.3) * self.median
+        if stream_handle.wait_cancelled(delay):
+            return
+        for word in "a short stub answer".split():
+            yield word + " "
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(label, router, requests, concurrency):
+    def request(_):
+        start = time.perf_counter()
+        stream = router.generate_response("primary", model_name="stub", prompt="hello")
+        next(stream)
+        ttft = time.perf_counter() - start
+        stream.close()
+        return ttft
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        ttfts = list(executor.map(request, range(requests)))
+    counts = router.metrics()["routes"].get("primary/stub", {})
+    print(f"{label:<9} ttft p50 {percentile(ttfts, 0.5) * 1000:>7.0f} ms  p95 {percentile(ttfts, 0.95) * 1000:>7.0f} ms"
+          f"  p99 {percentile(ttfts, 0.99) * 1000:>7.0f} ms  extra requests {counts.get('hedges', 0)}")
+
+
+def run(requests, concurrency, slow_rate, stall):
+    utils.DEBUG = False
+    random.seed(1)
+    llm_providers._instances["primary"] = StubProvider(0.3, slow_rate, stall)
+    llm_providers._instances["backup"] = StubProvider(0.4, slow_rate, stall)
+    llm_providers._factories.update(primary=None, backup=None)
+    print(f"{requests} requests, {concurrency} at a time, {slow_rate:.0%} stalling for {stall:.1f} s")
+    for label, hedge in (("failover", False), ("hedged", True)):
+        route = {"provider": "primary", "model": "stub", "fallbacks": [{"provider": "backup", "model": "stub"}], "hedge": hedge}
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"routes": [route]}, f)
+        router = provider_router.ProviderRouter(f.name)
+        os.unlink(f.name)
+        # Learn the primary's usual time to first token before measuring
+        for _ in range(provider_router.LLM_HEDGE_MIN_SAMPLES):
+            router.latency.record(("primary", "stub"), random.lognormvariate(0, 0.3) * 0.3)
+        measure(label, router, requests, concurrency)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark hedged requests against plain failover.")
+    parser.add_argument('--requests', type=int, default=400, help="Requests to send.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at once.")
+    parser.add_argument('--slow-rate', type=float, default=0.05, help="Fraction of requests that stall.")
+    parser.add_argument('--stall', type=float, default=3.0, help="Seconds a stalled request takes to answer.")
+    args = parser.parse_args()
+    run(args.requests, args.concurrency, args.slow_rate, args.stall)
@@ -0,0 +1,88 @@
+"""
+Measures how many requests a provider rejects with 429 with and without the
+client-side rate governor.
+
+An in-process stub provider allows --rpm requests per minute from a token
+bucket and otherwise raises a 429 with a Retry-After. A burst of --requests
+concurrent streams runs through stream_with_retry, once with no configured
+limit and once with the governor set to the provider's rpm. The runs compare
+429s, retries spent, failures and queue wait.
+
+Usage (from the backend directory):
+    python benchmarks/rate_governor_benchmark.py [--requests 80] [--rpm 60]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import stream_retry
+import utils
+from rate_governor import RateGovernor, TokenBucket
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, wait):
+        super().__init__("rate limited")
+        self.response = type("Response", (), {"headers": {"retry-after": f"{wait:.2f}"}})()
+
+
+class StubProvider:
+    def __init__(self, rpm):
+        self.bucket = TokenBucket(rpm)
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def stream(self, sent):
+        with self.lock:
+            wait = self.bucket.reserve(1, time.monotonic())
+            if wait > 0:
+                self.bucket.refund(1, time.monotonic())
+                self.rejected += 1
+                raise RateLimited(wait)
+        time.sleep(0.05)
+        yield "ok"
+
+
+def measure(label, rpm, requests, governed):
+    stream_retry.rate_governor = RateGovernor(None)
+    stream_retry._budgets.clear()
+    if governed:
+        stream_retry.rate_governor.limits = {"stub": {"rpm": rpm}}
+    provider = StubProvider(rpm)
+
+    def request(_):
+        start = time.perf_counter()
+        output = "".join(stream_retry.stream_with_retry("stub", provider.stream, model_name="m"))
+        return output == "ok", time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as executor:
+        results = list(executor.map(request, range(requests)))
+    elapsed = time.perf_counter() - start
+    retries = stream_retry.retry_metrics()["stub"]["retries"]
+    wait = stream_retry.rate_governor.metrics()["stub/m"]["queue_wait"]
+    print(f"{label:<10} ok {sum(ok for ok, _ in results):>3}/{requests}  429s {provider.rejected:>3}  retries {retries:>3}"
+          f"  queue wait p99 {wait['p99']:>5.2f} s  total {elapsed:>5.2f} s")
+
+
+def run(requests, rpm):
+    utils.DEBUG = False
+    print(f"{requests} concurrent requests against a provider allowing {rpm} requests per minute")
+    measure("no limits", rpm, requests, False)
+    measure("governed", rpm, requests, True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the rate governor against provider 429s.")
+    parser.add_argument('--requests', type=int, default=80, help="Concurrent requests in the burst.")
+    parser.add_argument('--rpm', type=int, default=60, help="Requests per minute the stub provider allows.")
+    args = parser.parse_args()
+    run(args.requests, args.rpm)
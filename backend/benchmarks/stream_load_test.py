@@ -0,0 +1,126 @@
+"""
+Load test comparing concurrent-stream capacity of the sync and async servers.
+
+1. Start a stub OpenAI-compatible upstream that streams tokens slowly:
+       python benchmarks/stream_load_test.py stub --port 8001 --tokens 50 --delay 0.05
+
+2. Start both servers against it (from the backend directory):
+       OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python app.py
+       OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uvicorn asgi:application --port 5001
+
+3. Compare them:
+       python benchmarks/stream_load_test.py run --concurrency 200 \\
+           --url http://127.0.0.1:5000 --url http://127.0.0.1:5001
+
+For every URL the script reports completed and failed streams, the peak
+number of streams open at once and the p50/p99 time to first token.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+from aiohttp import web
+
+
+async def stub_models(request):
+    return web.json_response({"object": "list", "data": [{"id": "stub", "object": "model", "created": 0, "owned_by": "stub"}]})
+
+
+async def stub_chat_completions(request):
+    tokens = request.app['tokens']
+    delay = request.app['delay']
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+    for i in range(tokens):
+        await asyncio.sleep(delay)
+        chunk = {
+            "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+            "choices": [{"index": 0, "delta": {"content": f"token{i} "}, "finish_reason": None}],
+        }
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def run_stub(port, tokens, delay):
+    app = web.Application()
+    app['tokens'] = tokens
+    app['delay'] = delay
+    app.router.add_get('/v1/models', stub_models)
+    app.router.add_post('/v1/chat/completions', stub_chat_completions)
+    web.run_app(app, port=port)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def one_stream(session, url, form, stats):
+    start = time.perf_counter()
+    first_token = None
+    try:
+        async with session.post(f"{url}/api/generate", data=form) as response:
+            response.raise_for_status()
+            stats['open'] += 1
+            stats['peak'] = max(stats['peak'], stats['open'])
+            try:
+                async for line in response.content:
+                    line = line.strip()
+                    if first_token is None and line and 'response' in json.loads(line):
+                        first_token = time.perf_counter() - start
+            finally:
+                stats['open'] -= 1
+        stats['ttft'].append(first_token if first_token is not None else time.perf_counter() - start)
+        stats['completed'] += 1
+    except Exception as e:
+        stats['failed'] += 1
+        stats['errors'].add(str(e)[:120])
+
+
+async def load_test(url, concurrency, provider, model, timeout):
+    stats = {'open': 0, 'peak': 0, 'completed': 0, 'failed': 0, 'ttft': [], 'errors': set()}
+    form = {'prompt': 'load test', 'provider': provider, 'model': model, 'conversation_title': 'load test'}
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(one_stream(session, url, form, stats) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    print(f"{url}")
+    print(f"  completed {stats['completed']}/{concurrency}, failed {stats['failed']}, peak open streams {stats['peak']}, wall time {elapsed:.2f}s")
+    print(f"  time to first token p50 {percentile(stats['ttft'], 0.50) * 1000:.0f} ms, p99 {percentile(stats['ttft'], 0.99) * 1000:.0f} ms")
+    for error in sorted(stats['errors']):
+        print(f"  error: {error}")
+
+
+async def run_all(args):
+    for url in args.url:
+        await load_test(url.rstrip('/'), args.concurrency, args.provider, args.model, args.timeout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent-stream load test for /api/generate.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    stub = subparsers.add_parser('stub', help="Run a stub OpenAI-compatible streaming upstream.")
+    stub.add_argument('--port', type=int, default=8001)
+    stub.add_argument('--tokens', type=int, default=50, help="Tokens streamed per response.")
+    stub.add_argument('--delay', type=float, default=0.05, help="Seconds between tokens.")
+
+    run = subparsers.add_parser('run', help="Open concurrent streams against one or more servers.")
+    run.add_argument('--url', action='append', required=True, help="Server base URL; repeat to compare servers.")
+    run.add_argument('--concurrency', type=int, default=100)
+    run.add_argument('--provider', default='openai')
+    run.add_argument('--model', default='stub')
+    run.add_argument('--timeout', type=float, default=300)
+
+    args = parser.parse_args()
+    if args.command == 'stub':
+        run_stub(args.port, args.tokens, args.delay)
+    else:
+        asyncio.run(run_all(args))
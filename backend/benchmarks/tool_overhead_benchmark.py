@@ -0,0 +1,83 @@
+"""
+Measures the tool-loading overhead of a /api/generate request.
+
+Runs generate_response against an in-process stub provider that answers
+instantly and requests no tool calls, so the time measured is what the
+backend spends loading and describing the selected tools. Compares the old
+import-on-every-request loader with the cached tool registry, for 0 and 10
+selected tools.
+
+Usage (from the backend directory):
+    python benchmarks/tool_overhead_benchmark.py [--requests 50]
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tool_manager
+import utils
+from providers import llm_providers
+from response_generator import generate_response
+from tool_registry import tool_registry
+
+
+class StubProvider:
+    """Answers every prompt immediately; the tool-selection turn gets an empty call list."""
+    def generate_response(self, prompt, model_name, image=None, history=None, system_message=None, stream_handle=None):
+        yield "[]" if system_message and "tool_code" in system_message else "ok"
+
+
+def legacy_load_local_tools(tool_names):
+    """The loader used before the registry: re-imports every selected tool file."""
+    tool_instances = []
+    for tool_name in tool_names:
+        try:
+            file_path = os.path.join('../tools', f'{tool_name}.py')
+            spec = importlib.util.spec_from_file_location(tool_name, file_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            if hasattr(module, 'execute') and hasattr(module, 'get_tool_description'):
+                tool_instances.append({
+                    'name': tool_name,
+                    'description': module.get_tool_description(),
+                    'execute': module.execute,
+                    'type': 'local'
+                })
+        except Exception:
+            pass
+    return tool_instances
+
+
+def timed(label, count, tools):
+    start = time.perf_counter()
+    for _ in range(count):
+        "".join(generate_response("bench", "stub", provider_name="bench", selected_tools=tools))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed / count * 1000:>10.2f} ms/request")
+
+
+def run(requests):
+    utils.DEBUG = False
+    llm_providers._factories["bench"] = StubProvider
+    tools = sorted(entry.name for entry in tool_registry.entries() if entry.execute and entry.has_description)[:10]
+    print(f"tools: {', '.join(tools)}")
+
+    cached_loader = tool_manager.tool_manager.load_local_tools
+    for label, loader in (("before (re-import)", legacy_load_local_tools), ("after (registry)", cached_loader)):
+        tool_manager.tool_manager.load_local_tools = loader
+        print(label)
+        timed("  0 tools", requests, [])
+        timed(f"  {len(tools)} tools", requests, tools)
+    tool_manager.tool_manager.load_local_tools = cached_loader
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark per-request tool loading overhead.")
+    parser.add_argument('--requests', type=int, default=50, help="Requests per configuration.")
+    args = parser.parse_args()
+    run(args.requests)
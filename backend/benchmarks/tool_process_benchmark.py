@@ -0,0 +1,117 @@
+"""
+Measures how much CPU-heavy tools delay an unrelated stream, with the tool
+run on the tool threads or in the tool process pool.
+
+A stand-in for a streaming response emits a chunk every 5 ms on its own
+thread while rounds of concurrent tool calls parse a large HTML page with
+BeautifulSoup, like webscraper_tool does. The stream's chunk gaps show how
+long it waited on the GIL. Also compares returning a large string result
+by pickling it through the pool's pipe and through shared memory.
+
+Usage (from the backend directory):
+    python benchmarks/tool_process_benchmark.py [--calls 4] [--rounds 3] [--rows 5000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import utils
+from tool_manager import tool_manager
+from tool_policy import ToolPolicy
+from tool_sandbox import ToolProcessPool
+
+TOOL_SOURCE = '''
+from bs4 import BeautifulSoup
+
+def get_tool_description():
+    return "Parses a generated HTML page."
+
+def execute(rows, size=0):
+    if size:
+        return "x" * int(size)
+    html = "<html><body><table>" + "".join(
+        f"<tr><td class='c'>{i}</td><td><a href='/p/{i}'>item {i}</a></td></tr>" for i in range(int(rows))
+    ) + "</table></body></html>"
+    return len(BeautifulSoup(html, "html.parser").get_text())
+'''
+
+STREAM_INTERVAL = 0.005
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(label, tool, calls, rounds, rows):
+    gaps = []
+    stop = threading.Event()
+
+    def stream():
+        last = time.perf_counter()
+        while not stop.is_set():
+            time.sleep(STREAM_INTERVAL)
+            now = time.perf_counter()
+            gaps.append(now - last - STREAM_INTERVAL)
+            last = now
+
+    streamer = threading.Thread(target=stream)
+    streamer.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        tool_manager.run(tool_manager.execute_tools(
+            [{"tool_name": tool['name'], "parameters": {"rows": rows}} for _ in range(calls)], [tool]
+        ))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    streamer.join()
+    print(f"{label:<10} tools {elapsed:>6.2f} s   stream delay p50 {percentile(gaps, 0.5) * 1000:>6.2f} ms"
+          f"  p99 {percentile(gaps, 0.99) * 1000:>7.2f} ms  max {max(gaps) * 1000:>7.2f} ms")
+
+
+def measure_transfer(path, size):
+    for label, shm_min_bytes in (("pipe", 0), ("shared mem", 1)):
+        pool = ToolProcessPool(workers=1, shm_min_bytes=shm_min_bytes)
+        pool.warm([("parse_tool", path)])
+        pool.submit("parse_tool", path, {"rows": 0, "size": size}).result()
+        start = time.perf_counter()
+        for _ in range(5):
+            pool.submit("parse_tool", path, {"rows": 0, "size": size}).result()
+        print(f"{size / 1e6:.0f} MB result via {label:<10} {(time.perf_counter() - start) / 5 * 1000:>8.2f} ms")
+        pool.shutdown()
+
+
+def run(calls, rounds, rows):
+    utils.DEBUG = False
+    with tempfile.TemporaryDirectory() as tools_dir:
+        path = os.path.join(tools_dir, "parse_tool.py")
+        with open(path, "w") as f:
+            f.write(TOOL_SOURCE)
+        namespace = {}
+        exec(TOOL_SOURCE, namespace)
+        policy = dict(timeout=300, max_concurrency=0, cpu_seconds=120)
+        tool_manager._process_pool = ToolProcessPool(workers=calls)
+        tool_manager._process_pool.warm([("parse_tool", path)])
+        print(f"{rounds} rounds of {calls} concurrent calls parsing {rows} table rows")
+        for label, isolation in (("thread", "thread"), ("process", "process")):
+            tool = {'name': 'parse_tool', 'path': path, 'execute': namespace['execute'],
+                    'policy': ToolPolicy(isolation=isolation, **policy), 'type': 'local'}
+            measure(label, tool, calls, rounds, rows)
+        tool_manager._process_pool.shutdown()
+        measure_transfer(path, 50_000_000)
+    tool_manager.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark tool threads against the tool process pool.")
+    parser.add_argument('--calls', type=int, default=4, help="Concurrent tool calls per round.")
+    parser.add_argument('--rounds', type=int, default=3, help="Rounds of tool calls.")
+    parser.add_argument('--rows', type=int, default=5000, help="Table rows in the parsed page.")
+    args = parser.parse_args()
+    run(args.calls, args.rounds, args.rows)
@@ -0,0 +1,137 @@
+"""
+Measures what the local tool router saves on requests with tools selected.
+
+Replays a set of prompts through generate_response against an in-process
+stub provider that waits --latency seconds per call and counts the tokens
+(roughly four characters each) of the system message, prompt and answer.
+Each prompt is replayed with the router off and on, and the selection calls,
+time and tokens are compared. Tools are loaded from ../tools with their
+execute functions replaced by stubs, so nothing is fetched, scheduled or
+played.
+
+Prompts come from --prompts (one per line), the user messages stored in
+conversations.db with --from-db, or a built-in sample.
+
+Usage (from the backend directory):
+    python benchmarks/tool_router_benchmark.py [--latency 0.3] [--prompts FILE | --from-db [--limit 200]]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tool_manager
+import utils
+from db import DATABASE
+from providers import llm_providers
+from response_generator import generate_response
+from tool_registry import tool_registry
+from tool_router import tool_router
+
+SAMPLE_PROMPTS = [
+    "hello, how are you?",
+    "what is 12 * 7?",
+    "write a short poem about autumn",
+    "summarize https://example.com/article",
+    "who won the match yesterday?",
+    "explain recursion to a beginner",
+    "what is 1024 / 16",
+    "thanks, that was helpful",
+    "find the latest news about electric cars",
+    "translate 'good morning' to French",
+    "schedule a daily summary of the news",
+    "what is 3.5 + 4.25",
+]
+
+
+class StubProvider:
+    """Waits `latency` seconds per call and counts the tokens sent and received."""
+    latency = 0.3
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.selection_calls = 0
+        self.tokens = 0
+
+    def generate_response(self, prompt, model_name, image=None, history=None, system_message=None, stream_handle=None):
+        self.calls += 1
+        # The tool descriptions and the tool_code instructions are in the system message
+        if system_message and "tool_code" in system_message:
+            self.selection_calls += 1
+            response = '[{"tool_name": "calculator", "parameters": {"operation": "add", "a": 1, "b": 2}}]'
+        else:
+            response = "ok " * 50
+        self.tokens += (len(system_message or "") + len(prompt) + len(response)) // 4
+        time.sleep(self.latency)
+        yield response
+
+
+def load_prompts(path, from_db, limit):
+    if path:
+        with open(path, encoding='utf-8') as f:
+            prompts = [line.strip() for line in f if line.strip()]
+    elif from_db:
+        with sqlite3.connect(DATABASE) as conn:
+            rows = conn.execute(
+                "SELECT content FROM messages WHERE role = 'user' ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        prompts = [row[0] for row in rows]
+    else:
+        prompts = SAMPLE_PROMPTS
+    return prompts[:limit]
+
+
+def stub_tools(load_local_tools):
+    def load(tool_names):
+        tools = load_local_tools(tool_names)
+        for tool in tools:
+            tool['execute'] = lambda **params: "stub result"
+            tool['policy'].cache_ttl = 0
+        return tools
+    return load
+
+
+def replay(provider, prompts, tools, enabled):
+    tool_router.enabled = enabled
+    provider.reset()
+    start = time.perf_counter()
+    for prompt in prompts:
+        "".join(generate_response(prompt, "stub", provider_name="bench", selected_tools=tools))
+    return time.perf_counter() - start
+
+
+def run(prompts, latency):
+    utils.DEBUG = False
+    StubProvider.latency = latency
+    provider = StubProvider()
+    llm_providers._factories["bench"] = lambda: provider
+    tool_manager.tool_manager.load_local_tools = stub_tools(tool_manager.tool_manager.load_local_tools)
+    tools = sorted(entry.name for entry in tool_registry.entries() if entry.execute and entry.has_description)
+    print(f"{len(prompts)} prompts, {len(tools)} tools, {latency * 1000:.0f} ms per LLM call")
+
+    results = {}
+    for label, enabled in (("router off", False), ("router on", True)):
+        elapsed = replay(provider, prompts, tools, enabled)
+        results[label] = (elapsed, provider.selection_calls, provider.tokens)
+        print(f"{label:<12} {elapsed:>8.2f} s  {provider.selection_calls:>4} selection calls  {provider.tokens:>8} tokens")
+
+    off, on = results["router off"], results["router on"]
+    print(f"saved        {off[0] - on[0]:>8.2f} s  {off[1] - on[1]:>4} selection calls  {off[2] - on[2]:>8} tokens")
+    print(f"router decisions: {tool_router.metrics()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay prompts to measure the latency and tokens saved by the tool router.")
+    parser.add_argument('--latency', type=float, default=0.3, help="Seconds each stub LLM call takes.")
+    parser.add_argument('--prompts', help="File with one prompt per line.")
+    parser.add_argument('--from-db', action='store_true', help="Replay the user messages stored in conversations.db.")
+    parser.add_argument('--limit', type=int, default=200, help="Maximum number of prompts to replay.")
+    args = parser.parse_args()
+    run(load_prompts(args.prompts, args.from_db, args.limit), args.latency)
@@ -1,16 +1,65 @@
 import anthropic
+import threading
 import time
 import os
-import anthropic
-import os
 from dotenv import load_dotenv
-from typing import List, Optional, Generator
+from typing import List, Optional, Generator, AsyncGenerator
 from PIL import Image
 import io
-from utils import retry_with_exponential_backoff, STREAM_START_DELAY, STREAM_YIELD_DELAY
+from model_catalog import model_catalog
+from rate_governor import estimate_tokens, rate_governor
+from stream_retry import stream_with_retry, stream_with_retry_async
+from utils import BLUE, debug_print, retry_with_exponential_backoff, STREAM_START_DELAY, STREAM_YIELD_DELAY
 
 load_dotenv()
 
+# Mark the system message and history with prompt cache breakpoints
+CLAUDE_PROMPT_CACHE = os.getenv("CLAUDE_PROMPT_CACHE", "1") == "1"
+CACHE_CONTROL = {"type": "ephemeral"}
+# Usage fields reported by the API, by the name they are counted under
+USAGE_FIELDS = {
+    "input_tokens": "input_tokens",
+    "cache_read_input_tokens": "cache_read_tokens",
+    "cache_creation_input_tokens": "cache_write_tokens",
+    "output_tokens": "output_tokens",
+}
+
+class PromptCacheStats:
+    """Prompt cache token usage of Claude requests, per model."""
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name, usage):
+        if not usage:
+            return
+        debug_print(BLUE, f"Claude {model_name} usage: {usage.get('input_tokens', 0)} input tokens, "
+                          f"{usage.get('cache_read_tokens', 0)} read from cache, {usage.get('cache_write_tokens', 0)} written to cache, "
+                          f"{usage.get('output_tokens', 0)} output tokens.")
+        with self._lock:
+            stats = self._stats.setdefault(model_name, dict.fromkeys(("requests",) + tuple(USAGE_FIELDS.values()), 0))
+            stats["requests"] += 1
+            for name in USAGE_FIELDS.values():
+                stats[name] += usage.get(name, 0)
+
+    def metrics(self):
+        with self._lock:
+            stats = {model_name: dict(counts) for model_name, counts in self._stats.items()}
+        for counts in stats.values():
+            prompt_tokens = counts["input_tokens"] + counts["cache_read_tokens"] + counts["cache_write_tokens"]
+            counts["cache_hit_rate"] = counts["cache_read_tokens"] / prompt_tokens if prompt_tokens else 0.0
+        return stats
+
+def _read_usage(usage, counts):
+    """Copies the token counts of a message_start or message_delta usage into `counts`"""
+    for field, name in USAGE_FIELDS.items():
+        value = getattr(usage, field, None)
+        if value is not None:
+            counts[name] = value
+
+# Prompt cache usage shared by the Claude clients
+prompt_cache_stats = PromptCacheStats()
+
 class ClaudeAPI:
     def __init__(self):
         """Initialize the Claude API client with API key from environment variables."""
@@ -18,8 +67,11 @@ class ClaudeAPI:
         if not api_key:
             raise ValueError("No ANTHROPIC_API_KEY found in environment variables.")
         
-        self.client = anthropic.Anthropic(api_key=api_key)
-        self.available_models = self._list_available_models()
+        # Retries are handled by stream_retry, under a per-provider budget
+        self.client = anthropic.Anthropic(api_key=api_key, max_retries=0)
+        self.async_client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
+        # Key of this client's model list in the shared model catalog
+        self.catalog_key = "claude"
     
     @retry_with_exponential_backoff()
     def _list_available_models(self) -> List[str]:
@@ -34,7 +86,8 @@ class ClaudeAPI:
             return [model.id for model in models.data]
         except Exception as e:
             print(f"Error listing Anthropic models: {e}")
-            return []
+            # The model catalog keeps the last good list
+            raise
     
     def list_models(self) -> List[str]:
         """
@@ -43,19 +96,89 @@ class ClaudeAPI:
         Returns:
             List[str]: List of available model names
         """
-        return self.available_models
+        return model_catalog.get(self.catalog_key, self._list_available_models)
+    
+    def refresh_models(self) -> List[str]:
+        """
+        Fetches the model list from Anthropic API unless the cached one is still fresh.
+        
+        Returns:
+            List[str]: List of available model names
+        """
+        return model_catalog.ensure_fresh(self.catalog_key, self._list_available_models)
+    
+    def _build_messages(self, prompt: str, image: Optional[Image.Image], history: Optional[List[dict]], context: Optional[str] = None) -> List[dict]:
+        """
+        Builds the message list for a request.
+
+        With CLAUDE_PROMPT_CACHE, the last history message carries a cache
+        breakpoint, so the next turn of the conversation reads everything up
+        to it from the prompt cache. Conversation context that changes every
+        turn (see context_window.SystemMessage) goes in the new user message,
+        after the breakpoint.
+        
+        Returns:
+            List[dict]: Messages in Anthropic format
+        """
+        messages = []
+        # Add chat history if provided
+        if history:
+            for message in history:
+                role = "assistant" if message["role"] == "model" else message["role"]
+                messages.append({
+                    "role": role,
+                    "content": message["content"]
+                })
+            if CLAUDE_PROMPT_CACHE and messages[-1]["content"]:
+                messages[-1]["content"] = [{"type": "text", "text": messages[-1]["content"], "cache_control": CACHE_CONTROL}]
+
+        # Prepare the user message with optional image
+        user_message = {"role": "user", "content": prompt}
+        if context:
+            user_message["content"] = [{"type": "text", "text": context}, {"type": "text", "text": prompt}]
+
+        if image:
+            # Convert PIL Image to bytes
+            image_bytes = io.BytesIO()
+            image.save(image_bytes, format=image.format or "PNG")
+            user_message["attachments"] = [{"type": "image", "data": image_bytes.getvalue()}]
+
+        messages.append(user_message)
+        return messages
+
+    @staticmethod
+    def _build_system(system_message: Optional[str]):
+        """
+        Builds the system parameter from the stable part of the system message,
+        marked as a cache breakpoint with CLAUDE_PROMPT_CACHE.
+
+        Returns:
+            The system text blocks, or anthropic.NOT_GIVEN without a system message.
+        """
+        base = getattr(system_message, "base", system_message)
+        if not base:
+            return anthropic.NOT_GIVEN
+        block = {"type": "text", "text": base}
+        if CLAUDE_PROMPT_CACHE:
+            block["cache_control"] = CACHE_CONTROL
+        return [block]
     
-    @retry_with_exponential_backoff()
     def generate_response(
         self,
         prompt: str,
         model_name: str,
         image: Optional[Image.Image] = None,
         history: Optional[List[dict]] = None,
-        system_message: Optional[str] = None
+        system_message: Optional[str] = None,
+        stream_handle=None
     ) -> Generator[str, None, None]:
         """
         Generate a streaming response using the specified Anthropic model.
+
+        Failed attempts are retried by stream_with_retry; one that fails after
+        output was sent resumes with that output as an assistant prefill. The
+        system message and history are sent as a cached prefix, and the
+        request's cache usage is recorded in prompt_cache_stats.
         
         Args:
             prompt (str): The input prompt
@@ -63,52 +186,123 @@ class ClaudeAPI:
             image (Optional[Image.Image]): Optional image to include
             history (Optional[List[dict]]): Optional chat history
             system_message (Optional[str]): Optional system message
+            stream_handle (Optional): StreamHandle whose cancellation closes the stream
         
         Yields:
             str: Generated response chunks
         """
+        return stream_with_retry(
+            self.catalog_key,
+            lambda sent: self._stream(prompt, model_name, image, history, system_message, stream_handle, sent),
+            stream_handle, resumable=True,
+            model_name=model_name, tokens=estimate_tokens(prompt, system_message, history)
+        )
+
+    def _stream(self, prompt, model_name, image, history, system_message, stream_handle, sent=None):
+        """Streams a single attempt, raising on failure; `sent` is output to continue from"""
+        messages = self._build_messages(prompt, image, history, getattr(system_message, "context", None))
+        skip_space = self._add_prefill(messages, sent)
+
+        # Create streaming response
+        time.sleep(STREAM_START_DELAY)
+        stream = self.client.messages.create(
+            model=model_name,
+            max_tokens=4096,
+            system=self._build_system(system_message),
+            messages=messages,
+            stream=True,
+        )
+        rate_governor.observe(self.catalog_key, model_name, stream)
+        if stream_handle:
+            stream_handle.on_cancel(stream.close)
+        
+        # Yield response chunks
+        usage = {}
         try:
-            messages = []
-            # Add system message if provided
-            if system_message:
-                messages.append({"role": "assistant", "content": system_message})
-            
-            # Add chat history if provided
-            if history:
-                for message in history:
-                    role = "assistant" if message["role"] == "model" else message["role"]
-                    messages.append({
-                        "role": role,
-                        "content": message["content"]
-                    })
-            
-            # Prepare the user message with optional image
-            user_message = {"role": "user", "content": prompt}
-            
-            if image:
-                # Convert PIL Image to bytes
-                image_bytes = io.BytesIO()
-                image.save(image_bytes, format=image.format or "PNG")
-                user_message["attachments"] = [{"type": "image", "data": image_bytes.getvalue()}]
-            
-            messages.append(user_message)
-            
-            # Create streaming response
-            time.sleep(STREAM_START_DELAY)
-            stream = self.client.messages.create(
-                model=model_name,
-                max_tokens=4096,
-                messages=messages,
-                stream=True,
-            )
-            
-            # Yield response chunks
             for event in stream:
+                if stream_handle and stream_handle.cancelled:
+                    break
                 if event.type == "message_start":
-                    continue
+                    _read_usage(event.message.usage, usage)
+                elif event.type == "message_delta":
+                    _read_usage(event.usage, usage)
                 elif event.type == "content_block_delta":
-                    yield event.delta.text
+                    text = event.delta.text
+                    if skip_space:
+                        text = text.lstrip()
+                        skip_space = not text
+                    if text:
+                        yield text
                     time.sleep(STREAM_YIELD_DELAY)
-                
-        except Exception as e:
-            yield f"Error generating response: {e}"
+        finally:
+            prompt_cache_stats.record(model_name, usage)
+
+    @staticmethod
+    def _add_prefill(messages: List[dict], sent: Optional[str]) -> bool:
+        """
+        Appends the output already sent as an assistant turn for the model to continue.
+
+        The API rejects a prefill ending in whitespace, so trailing whitespace is
+        trimmed. Returns whether the continuation's leading whitespace should be
+        dropped, since the client has already received it.
+        """
+        if not sent:
+            return False
+        prefill = sent.rstrip()
+        messages.append({"role": "assistant", "content": prefill})
+        return prefill != sent
+
+    async def generate_response_async(
+        self,
+        prompt: str,
+        model_name: str,
+        image: Optional[Image.Image] = None,
+        history: Optional[List[dict]] = None,
+        system_message: Optional[str] = None,
+        stream_handle=None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Async counterpart of generate_response used by the ASGI server. Takes the
+        same arguments.
+        
+        Yields:
+            str: Generated response chunks
+        """
+        async for chunk in stream_with_retry_async(
+            self.catalog_key,
+            lambda sent: self._stream_async(prompt, model_name, image, history, system_message, stream_handle, sent),
+            stream_handle, resumable=True,
+            model_name=model_name, tokens=estimate_tokens(prompt, system_message, history)
+        ):
+            yield chunk
+
+    async def _stream_async(self, prompt, model_name, image, history, system_message, stream_handle, sent=None):
+        messages = self._build_messages(prompt, image, history, getattr(system_message, "context", None))
+        skip_space = self._add_prefill(messages, sent)
+        stream = await self.async_client.messages.create(
+            model=model_name,
+            max_tokens=4096,
+            system=self._build_system(system_message),
+            messages=messages,
+            stream=True,
+        )
+        rate_governor.observe(self.catalog_key, model_name, stream)
+        usage = {}
+        try:
+            async for event in stream:
+                if stream_handle and stream_handle.cancelled:
+                    break
+                if event.type == "message_start":
+                    _read_usage(event.message.usage, usage)
+                elif event.type == "message_delta":
+                    _read_usage(event.usage, usage)
+                elif event.type == "content_block_delta":
+                    text = event.delta.text
+                    if skip_space:
+                        text = text.lstrip()
+                        skip_space = not text
+                    if text:
+                        yield text
+        finally:
+            prompt_cache_stats.record(model_name, usage)
+            await stream.close()
@@ -0,0 +1,357 @@
+"""
+Token-budgeted conversation history.
+
+prepare_generate used to send up to HISTORY_LIMIT stored messages to every
+provider, so each turn of a long conversation cost more tokens and time than
+the last, until the request overflowed the model's window. ContextWindow.build
+packs the history into CONTEXT_HISTORY_BUDGET tokens, less whatever the
+model's window cannot spare after the prompt, the system message and
+CONTEXT_OUTPUT_RESERVE:
+
+  - the newest turns (a user message and the replies to it) are kept whole
+    while they fit
+  - up to CONTEXT_RELEVANT_TURNS older turns sharing the most words with the
+    prompt are kept too, if they fit in what is left
+  - everything older is replaced by the conversation's rolling summary,
+    stored in conversation_summaries
+
+The kept turns are sent as the history, and they start at the same turn from
+one request to the next until they no longer fit. They are then repacked into
+CONTEXT_HISTORY_REFILL of the budget, leaving room for the next few turns.
+Providers that cache prompt prefixes can therefore reuse the system message
+and history of the previous turn. The summary and the related older turns
+change with every prompt, so they are not part of that prefix. They follow
+the system message as a SystemMessage, which reads as the full text, but lets
+a provider send the context after the cached prefix.
+
+A summary is brought up to date in the background once at least
+CONTEXT_SUMMARY_BATCH dropped messages are not covered by it yet. Each update
+summarizes the previous summary plus the newly dropped messages, so its cost
+does not grow with the conversation; requests made meanwhile use the summary
+already stored.
+
+Tokens are counted with tiktoken when it is installed (the model's own
+encoding for OpenAI models, cl100k_base as a close approximation for the
+rest) and estimated at four characters a token otherwise. Counts are cached,
+so a long conversation is not re-tokenized on every turn.
+"""
+
+import functools
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from db import delete_conversation_summary, get_conversation_summary, get_messages_between, store_conversation_summary
+from ollama_api import OLLAMA_NUM_CTX
+from providers import llm_providers
+from stream_retry import ERROR_PREFIX
+from tool_router import tokenize
+from utils import BLUE, GREEN, MAGENTA, debug_print
+
+try:
+    import tiktoken
+except ImportError:  # Optional; token counts are estimated without it
+    tiktoken = None
+
+# Most tokens of history (including the summary) sent with a request
+CONTEXT_HISTORY_BUDGET = int(os.getenv("CONTEXT_HISTORY_BUDGET", "6000"))
+# Tokens of the model's window left free for the answer
+CONTEXT_OUTPUT_RESERVE = int(os.getenv("CONTEXT_OUTPUT_RESERVE", "2048"))
+# Older turns kept for sharing words with the prompt
+CONTEXT_RELEVANT_TURNS = int(os.getenv("CONTEXT_RELEVANT_TURNS", "2"))
+# Share of the history budget the newest turns are repacked into when they outgrow it
+CONTEXT_HISTORY_REFILL = float(os.getenv("CONTEXT_HISTORY_REFILL", "0.6"))
+# Uncovered dropped messages that trigger a summary update
+CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "6"))
+# Target length of a summary, in words
+CONTEXT_SUMMARY_WORDS = int(os.getenv("CONTEXT_SUMMARY_WORDS", "250"))
+# Provider and model that write summaries; the conversation's own when unset
+CONTEXT_SUMMARY_PROVIDER = os.getenv("CONTEXT_SUMMARY_PROVIDER", "")
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "")
+# Most dropped messages read for one summary update
+SUMMARY_MAX_MESSAGES = 200
+# Token counts cached by text
+TOKEN_COUNT_CACHE = 8192
+# Per-message formatting tokens added by the chat APIs
+MESSAGE_OVERHEAD = 4
+# Conversations whose first kept message is remembered
+CUTOFF_CACHE = 1024
+
+# Context windows of each provider's models, in tokens
+PROVIDER_CONTEXT_WINDOWS = {
+    "claude": 200000,
+    "gemini": 1000000,
+    "openai": 128000,
+    "groq": 32768,
+    "ollama": OLLAMA_NUM_CTX,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+SUMMARY_PROMPT = """Summarize the conversation below in at most {words} words, for your own reference when it continues. Keep names, facts, decisions, open questions and anything the user asked to remember. Reply with the summary only.
+
+Summary so far:
+{summary}
+
+Messages to add:
+{messages}"""
+
+class SystemMessage(str):
+    """
+    A system message followed by conversation context. It reads as the full
+    text, while `base` and `context` keep the parts apart so a provider with
+    prompt caching can send the context, which changes every turn, after the
+    cached prefix.
+    """
+    def __new__(cls, base, context):
+        message = super().__new__(cls, "\n\n".join(part for part in (base, context) if part))
+        message.base = base or ""
+        message.context = context or ""
+        return message
+
+def extend_system_message(system_message, text):
+    """Appends `text` to the base of a system message, keeping any conversation context after it"""
+    base = getattr(system_message, "base", system_message)
+    extended = f"{base}\n\n{text}" if base else text
+    context = getattr(system_message, "context", "")
+    return SystemMessage(extended, context) if context else extended
+
+def transcript(messages):
+    return "\n".join(f"{'User' if message['role'] == 'user' else 'Assistant'}: {message['content']}" for message in messages)
+
+@functools.lru_cache(maxsize=64)
+def _encoding(provider_name, model_name):
+    """The tiktoken encoding used to count a model's tokens, or None to estimate them"""
+    if tiktoken is None:
+        return None
+    if provider_name.startswith("openai"):
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            pass
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The encoding file is downloaded on first use
+        debug_print(MAGENTA, f"tiktoken encoding unavailable, estimating tokens: {e}")
+        return None
+
+class TokenCounter:
+    """Token counts per text and encoding, with an LRU cache."""
+    def __init__(self, max_entries=TOKEN_COUNT_CACHE):
+        self.max_entries = max_entries
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text, provider_name=None, model_name=None):
+        if not text:
+            return 0
+        encoding = _encoding(provider_name or "", model_name or "")
+        key = (encoding.name if encoding else "estimate", text)
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                return tokens
+        if encoding is None:
+            tokens = len(text) // 4 + 1
+        else:
+            tokens = len(encoding.encode(text, disallowed_special=()))
+        with self._lock:
+            self._counts[key] = tokens
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+@functools.lru_cache(maxsize=TOKEN_COUNT_CACHE)
+def _words(text):
+    return frozenset(tokenize(text))
+
+def group_turns(messages):
+    """Splits messages into turns, each starting at a user message"""
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+class ContextWindow:
+    def __init__(self, history_budget=CONTEXT_HISTORY_BUDGET):
+        self.history_budget = history_budget
+        self.counter = TokenCounter()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+        self._summarizing = set()
+        # Conversation id to the id of the first message kept in its history
+        self._cutoffs = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "history_tokens": 0, "max_history_tokens": 0, "dropped_turns": 0,
+                       "history_repacks": 0, "summaries_written": 0, "summary_errors": 0}
+
+    def window(self, provider_name):
+        return PROVIDER_CONTEXT_WINDOWS.get(provider_name.split(":")[0], DEFAULT_CONTEXT_WINDOW)
+
+    def budget(self, provider_name, model_name, prompt, system_message):
+        """Tokens available for the history of a request"""
+        room = (self.window(provider_name) - CONTEXT_OUTPUT_RESERVE
+                - self.counter.count(prompt, provider_name, model_name)
+                - self.counter.count(system_message, provider_name, model_name))
+        return max(0, min(self.history_budget, room))
+
+    def _turn_tokens(self, turn, provider_name, model_name):
+        return sum(self.counter.count(message["content"], provider_name, model_name) + MESSAGE_OVERHEAD for message in turn)
+
+    def build(self, conversation_id, messages, system_message, prompt, provider_name, model_name):
+        """
+        Packs a conversation's stored messages into the history budget.
+
+        Args:
+            conversation_id (Optional[int]): Conversation whose summary is used and updated.
+            messages (list): Messages in chronological order, with their "id" when stored.
+            system_message (Optional[str]): The conversation's system message.
+            prompt (str): The new user prompt.
+            provider_name (str): Provider the request goes to.
+            model_name (str): Model the request goes to.
+
+        Returns:
+            tuple: The newest turns as role/content dicts and the system message,
+                as a SystemMessage carrying the rolling summary and related
+                older turns when older turns were dropped.
+        """
+        budget = self.budget(provider_name, model_name, prompt, system_message)
+        summary = get_conversation_summary(conversation_id) if conversation_id else None
+        turns = group_turns(messages)
+        costs = [self._turn_tokens(turn, provider_name, model_name) for turn in turns]
+
+        summary_tokens = summary["tokens"] if summary else 0
+        cutoff = self._cutoff(conversation_id, turns, costs, budget - summary_tokens)
+        used = sum(costs[cutoff:])
+        if cutoff and summary:
+            used += summary_tokens
+
+        relevant = []
+        if cutoff and CONTEXT_RELEVANT_TURNS > 0:
+            prompt_words = _words(prompt)
+            scored = []
+            for index in range(cutoff):
+                overlap = len(prompt_words & frozenset().union(*(_words(message["content"]) for message in turns[index])))
+                if overlap:
+                    scored.append((overlap, index))
+            for _, index in sorted(scored, reverse=True)[:CONTEXT_RELEVANT_TURNS]:
+                if used + costs[index] <= budget:
+                    relevant.append(index)
+                    used += costs[index]
+
+        history = [{"role": message["role"], "content": message["content"]} for turn in turns[cutoff:] for message in turn]
+        context = []
+        if cutoff and summary:
+            context.append(f"Summary of the earlier conversation:\n{summary['summary']}")
+        if relevant:
+            context.append("Earlier messages related to the new prompt:\n" + transcript(message for index in sorted(relevant) for message in turns[index]))
+        if context:
+            system_message = SystemMessage(system_message, "\n\n".join(context))
+
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["history_tokens"] += used
+            self._stats["max_history_tokens"] = max(self._stats["max_history_tokens"], used)
+            self._stats["dropped_turns"] += cutoff
+
+        if conversation_id and cutoff:
+            dropped = [message for turn in turns[:cutoff] for message in turn if "id" in message]
+            covered_until = summary["covered_until"] if summary else 0
+            uncovered = [message for message in dropped if message["id"] > covered_until]
+            if len(uncovered) >= CONTEXT_SUMMARY_BATCH:
+                self._schedule_summary(conversation_id, dropped[-1]["id"], provider_name, model_name)
+        return history, system_message
+
+    def _cutoff(self, conversation_id, turns, costs, room):
+        """
+        Index of the first turn sent as history. The previous request's first
+        turn is kept while everything from it on fits in `room`, so the history
+        only shifts when it must; it is then repacked into CONTEXT_HISTORY_REFILL
+        of the room.
+        """
+        with self._lock:
+            previous = self._cutoffs.get(conversation_id) if conversation_id else None
+        if previous is not None:
+            start = next((index for index, turn in enumerate(turns) if turn[0].get("id", previous) >= previous), len(turns))
+            if sum(costs[start:]) <= room:
+                return start
+        if sum(costs) <= room:
+            cutoff = 0
+        else:
+            cutoff = len(turns)
+            used = 0
+            for index in reversed(range(len(turns))):
+                # The newest turn is kept whenever it fits at all
+                limit = room * CONTEXT_HISTORY_REFILL if cutoff < len(turns) else room
+                if used + costs[index] > limit:
+                    break
+                cutoff = index
+                used += costs[index]
+            if previous is not None:
+                with self._lock:
+                    self._stats["history_repacks"] += 1
+        first_id = turns[cutoff][0].get("id") if cutoff < len(turns) else None
+        if conversation_id and first_id is not None:
+            with self._lock:
+                self._cutoffs[conversation_id] = first_id
+                self._cutoffs.move_to_end(conversation_id)
+                while len(self._cutoffs) > CUTOFF_CACHE:
+                    self._cutoffs.popitem(last=False)
+        return cutoff
+
+    def _schedule_summary(self, conversation_id, until_id, provider_name, model_name):
+        with self._lock:
+            if conversation_id in self._summarizing:
+                return
+            self._summarizing.add(conversation_id)
+        self._executor.submit(self._summarize, conversation_id, until_id, provider_name, model_name)
+
+    def _summarize(self, conversation_id, until_id, provider_name, model_name):
+        """Folds the messages up to `until_id` into the conversation's stored summary"""
+        try:
+            provider_name = CONTEXT_SUMMARY_PROVIDER or provider_name
+            model_name = CONTEXT_SUMMARY_MODEL or model_name
+            provider = llm_providers.get(provider_name)
+            summary = get_conversation_summary(conversation_id)
+            covered_until = summary["covered_until"] if summary else 0
+            messages = get_messages_between(conversation_id, covered_until, until_id, SUMMARY_MAX_MESSAGES)
+            if provider is None or not messages:
+                return
+            prompt = SUMMARY_PROMPT.format(words=CONTEXT_SUMMARY_WORDS, summary=summary["summary"] if summary else "(none)", messages=transcript(messages))
+            text = "".join(provider.generate_response(prompt=prompt, model_name=model_name)).strip()
+            if not text or text.startswith(ERROR_PREFIX):
+                raise RuntimeError(text or "empty summary")
+            store_conversation_summary(conversation_id, text, messages[-1]["id"], self.counter.count(text, provider_name, model_name))
+            with self._lock:
+                self._stats["summaries_written"] += 1
+            debug_print(GREEN, f"Summarized conversation {conversation_id} up to message {messages[-1]['id']}.")
+        except Exception as e:
+            with self._lock:
+                self._stats["summary_errors"] += 1
+            debug_print(MAGENTA, f"Error summarizing conversation {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._summarizing.discard(conversation_id)
+
+    def message_edited(self, conversation_id, message_id):
+        """Drops a summary that includes an edited message; it is rebuilt from the new text"""
+        with self._lock:
+            self._cutoffs.pop(conversation_id, None)
+        summary = get_conversation_summary(conversation_id)
+        if summary and message_id <= summary["covered_until"]:
+            delete_conversation_summary(conversation_id)
+            debug_print(BLUE, f"Dropped the summary of conversation {conversation_id} after an edit.")
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        history_tokens = stats.pop("history_tokens")
+        stats["avg_history_tokens"] = history_tokens / stats["requests"] if stats["requests"] else 0.0
+        stats["budget"] = self.history_budget
+        stats["tokenizer"] = "tiktoken" if tiktoken is not None else "estimate"
+        return stats
+
+# Context window manager shared by the generate routes
+context_window = ContextWindow()
@@ -1,168 +1,466 @@
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from utils import debug_print
 DATABASE = 'conversations.db'
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Number of long-lived connections kept open by the pool. Flask serves each
+# request on its own thread, so connections are shared through the pool
+# instead of being bound to a thread.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = 30
 
-import os
+# Pragmas applied to every pooled connection. WAL lets readers run while a
+# writer commits and synchronous=NORMAL is durable enough in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+class ConnectionPool:
+    """A bounded pool of long-lived SQLite connections."""
+    def __init__(self, database, size=POOL_SIZE):
+        self.database = database
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=POOL_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        """Returns an idle connection, opening a new one while the pool is below its size."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+        return self._idle.get(timeout=POOL_TIMEOUT)
+
+    def release(self, conn):
+        """Returns a connection to the pool, discarding any uncommitted work."""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        """Closes every connection opened by the pool."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._idle = queue.LifoQueue()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE)
+                debug_print(True, f"Opened SQLite pool for {DATABASE} (size={_pool.size})")
+    return _pool
+
+def close_db_connections():
+    """Closes all pooled connections. The pool is recreated on the next use."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+@contextmanager
+def db_connection(commit=False):
+    """
+    Borrows a pooled connection for the duration of a `with` block.
+
+    The connection is always handed back to the pool. When `commit` is True the
+    work is committed on success; any exception rolls it back.
+    """
+    pool = _get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+        if commit:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+def _list_migrations():
+    """Returns (version, path) pairs for the numbered .sql files in MIGRATIONS_DIR."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        if filename.endswith('.sql'):
+            version = int(filename.split('_', 1)[0])
+            migrations.append((version, os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+def run_migrations(conn):
+    """
+    Upgrades the database in place, tracking the applied version in PRAGMA user_version.
+
+    Each migration runs in its own transaction together with the version bump,
+    so an interrupted upgrade is retried on the next start.
+    """
+    current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, path in _list_migrations():
+        if version <= current_version:
+            continue
+        with open(path, 'r') as f:
+            script = f.read()
+        debug_print(True, f"Applying migration {os.path.basename(path)}")
+        # Table rebuilds need foreign keys off; the pragma is a no-op inside a transaction.
+        conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA foreign_keys=ON")
+        current_version = version
+    return current_version
 
 def init_db():
-    conn = get_db_connection()
     schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
     with open(schema_path, 'r') as f:
-        conn.executescript(f.read())
-    conn.close()
+        schema = f.read()
+    with db_connection() as conn:
+        conn.executescript(schema)
+        version = run_migrations(conn)
+    debug_print(True, f"Database schema at version {version}")
 
 def save_conversation(provider, model, system_message, title):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     timestamp = datetime.now().isoformat()
-    cursor.execute("INSERT INTO conversations (provider, model, system_message, created_at, title) VALUES (?, ?, ?, ?, ?)",
-                   (provider, model, system_message, timestamp, title))
-    conversation_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return conversation_id
+    with db_connection(commit=True) as conn:
+        cursor = conn.execute("INSERT INTO conversations (provider, model, system_message, created_at, title) VALUES (?, ?, ?, ?, ?)",
+                              (provider, model, system_message, timestamp, title))
+        return cursor.lastrowid
 
 def add_message_to_conversation(conversation_id, role, content):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     timestamp = datetime.now().isoformat()
-    cursor.execute("INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
-                   (conversation_id, role, content, timestamp))
-    conn.commit()
-    conn.close()
-
-def get_conversation(conversation_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,))
-    conversation = cursor.fetchone()
-    if conversation:
-        cursor.execute("SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at", (conversation_id,))
-        messages = cursor.fetchall()
-        conn.close()
-        return dict(conversation), [dict(message) for message in messages]
-    conn.close()
-    return None, None
-
-def list_conversations():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, provider, model, created_at FROM conversations ORDER BY created_at DESC")
-    conversations = cursor.fetchall()
-    conn.close()
+    with db_connection(commit=True) as conn:
+        conn.execute("INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                     (conversation_id, role, content, timestamp))
+
+def get_conversation(conversation_id, limit=None, before=None):
+    """
+    Returns a conversation and its messages in chronological order.
+
+    Messages are paginated by keyset on (created_at, id): `before` is a message
+    id and only older messages are returned, and `limit` keeps the newest
+    `limit` of them. With no arguments the whole history is returned.
+    """
+    with db_connection() as conn:
+        conversation = conn.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if not conversation:
+            return None, None
+        query = "SELECT * FROM messages WHERE conversation_id = ?"
+        params = [conversation_id]
+        if before is not None:
+            query += " AND (created_at, id) < (SELECT created_at, id FROM messages WHERE id = ?)"
+            params.append(before)
+        if limit is None:
+            query += " ORDER BY created_at, id"
+        else:
+            query = f"SELECT * FROM ({query} ORDER BY created_at DESC, id DESC LIMIT ?) ORDER BY created_at, id"
+            params.append(limit)
+        messages = conn.execute(query, params).fetchall()
+    return dict(conversation), [dict(message) for message in messages]
+
+def list_conversations(limit=None, before=None):
+    """
+    Lists conversations newest first.
+
+    Paginated by keyset on (created_at, id): pass the id of the last
+    conversation of a page as `before` to fetch the next one.
+    """
+    query = "SELECT id, provider, model, created_at FROM conversations"
+    params = []
+    if before is not None:
+        query += " WHERE (created_at, id) < (SELECT created_at, id FROM conversations WHERE id = ?)"
+        params.append(before)
+    query += " ORDER BY created_at DESC, id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    with db_connection() as conn:
+        conversations = conn.execute(query, params).fetchall()
     return [dict(conversation) for conversation in conversations]
 
 def save_system_message(name, content):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     timestamp = datetime.now().isoformat()
-    cursor.execute("INSERT INTO system_messages (name, content, created_at) VALUES (?, ?, ?)", (name, content, timestamp))
-    system_message_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return system_message_id
+    with db_connection(commit=True) as conn:
+        cursor = conn.execute("INSERT INTO system_messages (name, content, created_at) VALUES (?, ?, ?)", (name, content, timestamp))
+        return cursor.lastrowid
 
 def save_simple_response(prompt, response):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     timestamp = datetime.now().isoformat()
-    cursor.execute("INSERT INTO simple_responses (prompt, response, created_at) VALUES (?, ?, ?)", (prompt, response, timestamp))
-    simple_response_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return simple_response_id
+    with db_connection(commit=True) as conn:
+        cursor = conn.execute("INSERT INTO simple_responses (prompt, response, created_at) VALUES (?, ?, ?)", (prompt, response, timestamp))
+        return cursor.lastrowid
 
 def list_simple_responses():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, prompt, response, created_at FROM simple_responses ORDER BY created_at DESC")
-    simple_responses = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        simple_responses = conn.execute("SELECT id, prompt, response, created_at FROM simple_responses ORDER BY created_at DESC").fetchall()
     return [dict(response) for response in simple_responses]
 
 def delete_simple_response(simple_response_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM simple_responses WHERE id = ?", (simple_response_id,))
-    conn.commit()
-    conn.close()
+    with db_connection(commit=True) as conn:
+        conn.execute("DELETE FROM simple_responses WHERE id = ?", (simple_response_id,))
 
 def delete_all_simple_responses():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM simple_responses")
-    conn.commit()
-    conn.close()
+    with db_connection(commit=True) as conn:
+        conn.execute("DELETE FROM simple_responses")
 
 def get_system_message(system_message_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM system_messages WHERE id = ?", (system_message_id,))
-    system_message = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        system_message = conn.execute("SELECT * FROM system_messages WHERE id = ?", (system_message_id,)).fetchone()
     if system_message:
         return dict(system_message)
     return None
 
 def list_system_messages():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, provider, model, created_at FROM conversations ORDER BY created_at DESC")
-    conversations = cursor.fetchall()
-    cursor.execute("SELECT id, name, content, created_at FROM system_messages ORDER BY created_at DESC")
-    system_messages = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        system_messages = conn.execute("SELECT id, name, content, created_at FROM system_messages ORDER BY created_at DESC").fetchall()
     return [dict(system_message) for system_message in system_messages]
 
 def delete_system_message(system_message_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM system_messages WHERE id = ?", (system_message_id,))
-    conn.commit()
-    conn.close()
+    with db_connection(commit=True) as conn:
+        conn.execute("DELETE FROM system_messages WHERE id = ?", (system_message_id,))
 
 def delete_all_system_messages():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM system_messages")
-    conn.commit()
-    conn.close()
+    with db_connection(commit=True) as conn:
+        conn.execute("DELETE FROM system_messages")
 
 def delete_conversation(conversation_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
-    cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
-    conn.commit()
+    with db_connection(commit=True) as conn:
+        # Messages are removed by ON DELETE CASCADE
+        conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
 
 def delete_all_conversations():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM conversations")
-    cursor.execute("DELETE FROM messages")
-    conn.commit()
-    conn.close()
+    with db_connection(commit=True) as conn:
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM conversations")
 
 def update_message(message_id, edited_content):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE messages SET content = ? WHERE id = ?", (edited_content, message_id))
-    conn.commit()
-    conn.close()
-    return cursor.rowcount > 0
+    with db_connection(commit=True) as conn:
+        cursor = conn.execute("UPDATE messages SET content = ? WHERE id = ?", (edited_content, message_id))
+        return cursor.rowcount > 0
 
 def get_conversation_id_from_message(message_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT conversation_id FROM messages WHERE id = ?", (message_id,))
-    message = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        message = conn.execute("SELECT conversation_id FROM messages WHERE id = ?", (message_id,)).fetchone()
     if message:
         return message['conversation_id']
     return None
+
+def _fts_query(text):
+    """Turns free text into an FTS5 query matching all of its terms, ignoring FTS5 operators."""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+def search_conversations(text, limit=20, offset=0):
+    """
+    Full-text search over message content and conversation titles.
+
+    Returns matches ordered by bm25 rank, each with the conversation it belongs
+    to and a highlighted snippet. Both indexes are cut to the requested page
+    before merging so only `limit + offset` rows per index are ranked.
+    """
+    query = _fts_query(text)
+    if not query:
+        return []
+    window = limit + offset
+    with db_connection() as conn:
+        results = conn.execute("""
+            SELECT * FROM (
+                SELECT m.conversation_id, m.id AS message_id, m.role, c.title, m.created_at,
+                       snippet(messages_fts, 0, '[', ']', '...', 16) AS snippet,
+                       messages_fts.rank AS rank
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                JOIN conversations c ON c.id = m.conversation_id
+                WHERE messages_fts MATCH ?
+                ORDER BY messages_fts.rank LIMIT ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT c.id AS conversation_id, NULL AS message_id, NULL AS role, c.title, c.created_at,
+                       snippet(conversations_fts, 0, '[', ']', '...', 16) AS snippet,
+                       conversations_fts.rank AS rank
+                FROM conversations_fts
+                JOIN conversations c ON c.id = conversations_fts.rowid
+                WHERE conversations_fts MATCH ?
+                ORDER BY conversations_fts.rank LIMIT ?
+            )
+            ORDER BY rank LIMIT ? OFFSET ?
+        """, (query, window, query, window, limit, offset)).fetchall()
+    return [dict(result) for result in results]
+
+def write_messages(messages):
+    """
+    Persists a batch of queued messages in a single transaction.
+
+    Messages without an id are inserted and get their new id assigned once the
+    transaction commits; the others have their content updated.
+    """
+    inserted = []
+    with db_connection(commit=True) as conn:
+        for message in messages:
+            if message.id is None:
+                cursor = conn.execute("INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                                      (message.conversation_id, message.role, message.content, message.created_at))
+                inserted.append((message, cursor.lastrowid))
+            else:
+                conn.execute("UPDATE messages SET content = ? WHERE id = ?", (message.content, message.id))
+    for message, message_id in inserted:
+        message.id = message_id
+
+def get_cached_response(key, created_after, now):
+    """Returns the cached response for `key` if it was stored after `created_after`, marking it as used."""
+    with db_connection(commit=True) as conn:
+        row = conn.execute("SELECT response FROM response_cache WHERE key = ? AND created_at > ?", (key, created_after)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE response_cache SET last_used_at = ? WHERE key = ?", (now, key))
+    return row["response"]
+
+def store_cached_response(key, response, now, created_after, max_entries):
+    """
+    Stores a response in the cache, then drops expired entries and the least
+    recently used ones beyond `max_entries`. Returns the number of entries dropped.
+    """
+    with db_connection(commit=True) as conn:
+        conn.execute("INSERT OR REPLACE INTO response_cache (key, response, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                     (key, response, now, now))
+        evicted = conn.execute("DELETE FROM response_cache WHERE created_at <= ?", (created_after,)).rowcount
+        evicted += conn.execute("""
+            DELETE FROM response_cache WHERE key IN (
+                SELECT key FROM response_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,)).rowcount
+    return evicted
+
+def clear_response_cache():
+    with db_connection(commit=True) as conn:
+        conn.execute("DELETE FROM response_cache")
+
+def get_spilled_tool_result(key, now):
+    """Returns (tool_name, result_json, expires_at) of an unexpired spilled tool result, removing it from the spill store."""
+    with db_connection(commit=True) as conn:
+        row = conn.execute("SELECT tool_name, result, expires_at FROM tool_cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+    return row["tool_name"], row["result"], row["expires_at"]
+
+def spill_tool_results(entries, now):
+    """Stores (key, tool_name, result_json, expires_at) rows evicted from memory and drops expired ones."""
+    with db_connection(commit=True) as conn:
+        conn.executemany("INSERT OR REPLACE INTO tool_cache (key, tool_name, result, expires_at) VALUES (?, ?, ?, ?)", entries)
+        conn.execute("DELETE FROM tool_cache WHERE expires_at <= ?", (now,))
+
+def add_scheduled_task(prompt, schedule, jitter, catch_up, next_fire_at):
+    timestamp = datetime.now().isoformat()
+    with db_connection(commit=True) as conn:
+        cursor = conn.execute(
+            "INSERT INTO scheduled_tasks (prompt, schedule, jitter, catch_up, next_fire_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (prompt, schedule, jitter, catch_up, next_fire_at, timestamp)
+        )
+        return cursor.lastrowid
+
+def get_scheduled_task(task_id):
+    with db_connection() as conn:
+        task = conn.execute("SELECT * FROM scheduled_tasks WHERE id = ?", (task_id,)).fetchone()
+    return dict(task) if task else None
+
+def find_scheduled_task(prompt, schedule):
+    with db_connection() as conn:
+        task = conn.execute("SELECT * FROM scheduled_tasks WHERE prompt = ? AND schedule = ?", (prompt, schedule)).fetchone()
+    return dict(task) if task else None
+
+def list_scheduled_tasks():
+    with db_connection() as conn:
+        tasks = conn.execute("SELECT * FROM scheduled_tasks ORDER BY next_fire_at").fetchall()
+    return [dict(task) for task in tasks]
+
+def delete_scheduled_task(task_id):
+    """Deletes a scheduled task and returns whether it existed."""
+    with db_connection(commit=True) as conn:
+        return conn.execute("DELETE FROM scheduled_tasks WHERE id = ?", (task_id,)).rowcount > 0
+
+def claim_scheduled_run(task_id, fire_at, next_fire_at):
+    """
+    Moves a task from its due fire time to the next one and returns whether
+    this caller won the run; another process that already claimed it has
+    changed next_fire_at, so the update matches no row.
+    """
+    with db_connection(commit=True) as conn:
+        cursor = conn.execute(
+            "UPDATE scheduled_tasks SET next_fire_at = ? WHERE id = ? AND next_fire_at = ?",
+            (next_fire_at, task_id, fire_at)
+        )
+        return cursor.rowcount > 0
+
+def disable_scheduled_task(task_id, last_status):
+    with db_connection(commit=True) as conn:
+        conn.execute("UPDATE scheduled_tasks SET enabled = 0, last_status = ? WHERE id = ?", (last_status, task_id))
+
+def record_scheduled_run(task_id, last_run_at, last_status):
+    with db_connection(commit=True) as conn:
+        conn.execute("UPDATE scheduled_tasks SET last_run_at = ?, last_status = ? WHERE id = ?", (last_run_at, last_status, task_id))
+
+def get_conversation_summary(conversation_id):
+    with db_connection() as conn:
+        summary = conn.execute("SELECT * FROM conversation_summaries WHERE conversation_id = ?", (conversation_id,)).fetchone()
+    return dict(summary) if summary else None
+
+def store_conversation_summary(conversation_id, summary, covered_until, tokens):
+    """Stores a conversation's summary unless one covering more messages was stored meanwhile."""
+    timestamp = datetime.now().isoformat()
+    with db_connection(commit=True) as conn:
+        conn.execute("""
+            INSERT INTO conversation_summaries (conversation_id, summary, covered_until, tokens, updated_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(conversation_id) DO UPDATE SET
+                summary = excluded.summary, covered_until = excluded.covered_until, tokens = excluded.tokens, updated_at = excluded.updated_at
+            WHERE excluded.covered_until > conversation_summaries.covered_until
+        """, (conversation_id, summary, covered_until, tokens, timestamp))
+
+def delete_conversation_summary(conversation_id):
+    with db_connection(commit=True) as conn:
+        conn.execute("DELETE FROM conversation_summaries WHERE conversation_id = ?", (conversation_id,))
+
+def get_messages_between(conversation_id, after_id, until_id, limit):
+    """Returns up to the newest `limit` messages with after_id < id <= until_id, in chronological order."""
+    with db_connection() as conn:
+        messages = conn.execute("""
+            SELECT * FROM (
+                SELECT * FROM messages WHERE conversation_id = ? AND id > ? AND id <= ? ORDER BY id DESC LIMIT ?
+            ) ORDER BY id
+        """, (conversation_id, after_id, until_id, limit)).fetchall()
+    return [dict(message) for message in messages]
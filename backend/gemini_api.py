@@ -2,11 +2,14 @@ import time
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-from typing import List, Optional, Generator
+from typing import List, Optional, Generator, AsyncGenerator
 from PIL import Image
 import io
 import json
 import base64
+from model_catalog import model_catalog
+from rate_governor import estimate_tokens
+from stream_retry import stream_with_retry, stream_with_retry_async
 from utils import retry_with_exponential_backoff, STREAM_START_DELAY, STREAM_YIELD_DELAY
 
 load_dotenv()
@@ -18,7 +21,8 @@ class GeminiAPI:
         if not api_key:
             raise ValueError("No GEMINI_API_KEY found in environment variables.")
         genai.configure(api_key=api_key)
-        self.available_models = self._list_available_models()
+        # Key of this client's model list in the shared model catalog
+        self.catalog_key = "gemini"
 
     @retry_with_exponential_backoff()
     def _list_available_models(self) -> List[str]:
@@ -38,10 +42,59 @@ class GeminiAPI:
         Returns:
             List[str]: A list of available model names.
         """
-        return self.available_models
+        return model_catalog.get(self.catalog_key, self._list_available_models)
 
-    @retry_with_exponential_backoff()
-    def generate_response(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None) -> Generator[str, None, None]:
+    def refresh_models(self) -> List[str]:
+        """
+        Fetches the model list from Gemini API unless the cached one is still fresh.
+
+        Returns:
+            List[str]: A list of available model names.
+        """
+        return model_catalog.ensure_fresh(self.catalog_key, self._list_available_models)
+
+    def _build_contents(self, prompt: str, image: Optional[Image.Image], history: Optional[List[dict]]) -> List[dict]:
+        """Builds the request contents from the history, prompt and optional image."""
+        contents = []
+        if history:
+            for message in history:
+                if message["role"] == "model":
+                    contents.append({"role": "user", "parts": [message["content"]]})
+                elif message["role"] == "user":
+                    contents.append({"role": "user", "parts": [message["content"]]})
+                else:
+                    contents.append({"role": message["role"], "parts": [message["content"]]})
+
+
+        parts = []
+        if prompt:
+            parts.append(prompt)
+        if image:
+            mime_type = "image/jpeg"
+
+            if image.format and image.format.lower() == "png":
+                image = image.convert("RGB")
+
+            image_buffer = io.BytesIO()
+            image.save(image_buffer, format="JPEG")
+            image_bytes = image_buffer.getvalue()
+
+            mime_type = "image/jpeg"
+
+            image_part = {
+                "mime_type": mime_type,
+                "data": base64.b64encode(image_bytes).decode('utf-8')
+            }
+            parts.append(image_part)
+
+        if parts:
+            contents.append({"role": "user", "parts": parts})
+
+        if not contents:
+            contents.append({"role": "user", "parts": [""]})
+        return contents
+
+    def generate_response(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None, stream_handle=None) -> Generator[str, None, None]:
         """
         Generates a response using the specified Gemini model, yielding chunks of the response.
 
@@ -51,56 +104,51 @@ class GeminiAPI:
             image (Optional[Image.Image]): An optional image to include in the prompt.
             history (Optional[List[dict]]): An optional list of previous chat messages.
             system_message (Optional[str]): An optional system message to include in the prompt.
+            stream_handle (Optional): StreamHandle whose cancellation stops the stream.
+
+        Yields:
+            str: The generated response chunks from Gemini.
+        """
+        return stream_with_retry(
+            self.catalog_key, lambda sent: self._stream(prompt, model_name, image, history, system_message, stream_handle), stream_handle,
+            model_name=model_name, tokens=estimate_tokens(prompt, system_message, history)
+        )
+
+    def _stream(self, prompt, model_name, image, history, system_message, stream_handle):
+        """Streams a single attempt of generate_response, raising on failure"""
+        model = genai.GenerativeModel(model_name=model_name, system_instruction=system_message)
+        contents = self._build_contents(prompt, image, history)
+        response_stream = model.generate_content(
+            contents=contents,
+            stream=True,
+        )
+        for chunk in response_stream:
+            if stream_handle and stream_handle.cancelled:
+                break
+            yield chunk.text
+
+    async def generate_response_async(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None, stream_handle=None) -> AsyncGenerator[str, None]:
+        """
+        Async counterpart of generate_response used by the ASGI server. Takes the
+        same arguments.
 
         Yields:
             str: The generated response chunks from Gemini.
         """
-        try:
-            model = genai.GenerativeModel(model_name=model_name, system_instruction=system_message)
-           
-            contents = []
-            if history:
-                for message in history:
-                    if message["role"] == "model":
-                        contents.append({"role": "user", "parts": [message["content"]]})
-                    elif message["role"] == "user":
-                        contents.append({"role": "user", "parts": [message["content"]]})
-                    else:
-                        contents.append({"role": message["role"], "parts": [message["content"]]})
-
-            
-            parts = []
-            if prompt:
-                parts.append(prompt)
-            if image:
-                mime_type = "image/jpeg"
-                
-                if image.format and image.format.lower() == "png":
-                    image = image.convert("RGB")
-                
-                image_buffer = io.BytesIO()
-                image.save(image_buffer, format="JPEG")
-                image_bytes = image_buffer.getvalue()
-                
-                mime_type = "image/jpeg"
-                
-                image_part = {
-                    "mime_type": mime_type,
-                    "data": base64.b64encode(image_bytes).decode('utf-8')
-                }
-                parts.append(image_part)
-            
-            if parts:
-                contents.append({"role": "user", "parts": parts})
-            
-            if not contents:
-                contents.append({"role": "user", "parts": [""]})
-                                        
-            response_stream = model.generate_content(
-                contents=contents,
-                stream=True,
-            )
-            for chunk in response_stream:
-                yield chunk.text
-        except Exception as e:
-            yield f"Error generating response: {e}"
+        async for chunk in stream_with_retry_async(
+            self.catalog_key, lambda sent: self._stream_async(prompt, model_name, image, history, system_message, stream_handle), stream_handle,
+            model_name=model_name, tokens=estimate_tokens(prompt, system_message, history)
+        ):
+            yield chunk
+
+    async def _stream_async(self, prompt, model_name, image, history, system_message, stream_handle):
+        model = genai.GenerativeModel(model_name=model_name, system_instruction=system_message)
+        contents = self._build_contents(prompt, image, history)
+        response_stream = await model.generate_content_async(
+            contents=contents,
+            stream=True,
+        )
+        async for chunk in response_stream:
+            if stream_handle and stream_handle.cancelled:
+                break
+            yield chunk.text
@@ -1,11 +1,14 @@
 import time
 import os
 from dotenv import load_dotenv
-from typing import List, Optional, Generator
+from typing import List, Optional, Generator, AsyncGenerator
 from PIL import Image
 import io
 import json
-from groq import Groq
+from groq import Groq, AsyncGroq
+from model_catalog import model_catalog
+from rate_governor import estimate_tokens, rate_governor
+from stream_retry import stream_with_retry, stream_with_retry_async
 from utils import retry_with_exponential_backoff, STREAM_START_DELAY, STREAM_YIELD_DELAY
 
 load_dotenv()
@@ -16,8 +19,11 @@ class GroqAPI:
         api_key = os.getenv("GROQ_API_KEY")
         if not api_key:
             raise ValueError("No GROQ_API_KEY found in environment variables.")
-        self.client = Groq(api_key=api_key)
-        self.available_models = self._list_available_models()
+        # Retries are handled by stream_retry, under a per-provider budget
+        self.client = Groq(api_key=api_key, max_retries=0)
+        self.async_client = AsyncGroq(api_key=api_key, max_retries=0)
+        # Key of this client's model list in the shared model catalog
+        self.catalog_key = "groq"
 
     @retry_with_exponential_backoff()
     def _list_available_models(self) -> List[str]:
@@ -32,7 +38,8 @@ class GroqAPI:
             return [model.id for model in models.data]
         except Exception as e:
             print(f"Error listing Groq models: {e}")
-            return []
+            # The model catalog keeps the last good list
+            raise
 
     def list_models(self) -> List[str]:
         """
@@ -41,10 +48,41 @@ class GroqAPI:
         Returns:
             List[str]: A list of available model names.
         """
-        return self.available_models
+        return model_catalog.get(self.catalog_key, self._list_available_models)
 
-    @retry_with_exponential_backoff()
-    def generate_response(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None) -> Generator[str, None, None]:
+    def refresh_models(self) -> List[str]:
+        """
+        Fetches the model list from Groq API unless the cached one is still fresh.
+
+        Returns:
+            List[str]: A list of available model names.
+        """
+        return model_catalog.ensure_fresh(self.catalog_key, self._list_available_models)
+
+    def _build_messages(self, prompt: str, image: Optional[Image.Image], history: Optional[List[dict]], system_message: Optional[str]) -> List[dict]:
+        """Builds the chat messages for a request."""
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        if history:
+            for message in history:
+                if message["role"] == "model":
+                    messages.append({"role": "assistant", "content": message["content"]})
+                else:
+                    messages.append({"role": message["role"], "content": message["content"]})
+
+        if image:
+            # Convert PIL Image to bytes
+            image_bytes = io.BytesIO()
+            image.save(image_bytes, format=image.format if image.format else "PNG")
+            image_bytes = image_bytes.getvalue()
+
+            messages.append({"role": "user", "content": prompt, "images": [image_bytes]})
+        else:
+            messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def generate_response(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None, stream_handle=None) -> Generator[str, None, None]:
         """
         Generates a response using the specified Groq model, yielding chunks of the response.
 
@@ -54,39 +92,66 @@ class GroqAPI:
             image (Optional[Image.Image]): An optional image to include in the prompt.
             history (Optional[List[dict]]): An optional list of previous chat messages.
             system_message (Optional[str]): An optional system message to include in the prompt.
+            stream_handle (Optional): StreamHandle whose cancellation closes the stream.
 
         Yields:
             str: The generated response chunks from Groq.
         """
+        return stream_with_retry(
+            self.catalog_key, lambda sent: self._stream(prompt, model_name, image, history, system_message, stream_handle, sent), stream_handle, resumable=True,
+            model_name=model_name, tokens=estimate_tokens(prompt, system_message, history)
+        )
+
+    def _stream(self, prompt, model_name, image, history, system_message, stream_handle, sent=None):
+        """Streams a single attempt of generate_response, raising on failure"""
+        messages = self._build_messages(prompt, image, history, system_message)
+        if sent:
+            # Groq continues a trailing assistant message, so a resumed stream picks up where it stopped
+            messages.append({"role": "assistant", "content": sent})
+        response_stream = self.client.chat.completions.create(
+            model=model_name,
+            messages=messages,
+            stream=True,
+        )
+        rate_governor.observe(self.catalog_key, model_name, response_stream)
+        if stream_handle:
+            stream_handle.on_cancel(response_stream.close)
+        for chunk in response_stream:
+            if stream_handle and stream_handle.cancelled:
+                break
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def generate_response_async(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None, stream_handle=None) -> AsyncGenerator[str, None]:
+        """
+        Async counterpart of generate_response used by the ASGI server. Takes the
+        same arguments.
+
+        Yields:
+            str: The generated response chunks from Groq.
+        """
+        async for chunk in stream_with_retry_async(
+            self.catalog_key, lambda sent: self._stream_async(prompt, model_name, image, history, system_message, stream_handle, sent), stream_handle, resumable=True,
+            model_name=model_name, tokens=estimate_tokens(prompt, system_message, history)
+        ):
+            yield chunk
+
+    async def _stream_async(self, prompt, model_name, image, history, system_message, stream_handle, sent=None):
+        messages = self._build_messages(prompt, image, history, system_message)
+        if sent:
+            # Groq continues a trailing assistant message, so a resumed stream picks up where it stopped
+            messages.append({"role": "assistant", "content": sent})
+        response_stream = await self.async_client.chat.completions.create(
+            model=model_name,
+            messages=messages,
+            stream=True,
+        )
+        rate_governor.observe(self.catalog_key, model_name, response_stream)
         try:
-            messages = []
-            if system_message:
-                messages.append({"role": "system", "content": system_message})
-            if history:
-                for message in history:
-                    if message["role"] == "model":
-                        messages.append({"role": "assistant", "content": message["content"]})
-                    else:
-                        messages.append({"role": message["role"], "content": message["content"]})
-            
-            if image:
-                # Convert PIL Image to bytes
-                image_bytes = io.BytesIO()
-                image.save(image_bytes, format=image.format if image.format else "PNG")
-                image_bytes = image_bytes.getvalue()
-                
-                messages.append({"role": "user", "content": prompt, "images": [image_bytes]})
-            else:
-                messages.append({"role": "user", "content": prompt})
-            
-            response_stream = self.client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                stream=True,
-            )
-            for chunk in response_stream:
+            async for chunk in response_stream:
+                if stream_handle and stream_handle.cancelled:
+                    break
                 if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
-        except Exception as e:
-            yield f"Error generating response: {e}"
-
+        finally:
+            await response_stream.close()
@@ -0,0 +1,247 @@
+"""
+Persistent stdio transport for local MCP servers.
+
+Each configured server is started once as a subprocess that speaks
+newline-delimited JSON-RPC 2.0 on stdin/stdout. Requests are multiplexed by
+id, so any number of calls can be in flight at once; a reader task resolves
+each one when its response arrives. Requests the server sends us are not
+matched against ours: pings are answered and anything else is rejected with
+"method not found", and notifications are ignored. A health check pings the server
+periodically, and a server that exits or stops answering is restarted with
+backoff on the next call.
+
+Everything here runs on the tool manager's event loop.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+from typing import Any, Dict, List, Optional
+from utils import BLUE, GREEN, MAGENTA, debug_print
+
+MCP_PROTOCOL_VERSION = "2024-11-05"
+MCP_STDIO_REQUEST_TIMEOUT = float(os.getenv("MCP_STDIO_REQUEST_TIMEOUT", "30"))
+MCP_STDIO_START_TIMEOUT = float(os.getenv("MCP_STDIO_START_TIMEOUT", "20"))
+MCP_HEALTH_INTERVAL = float(os.getenv("MCP_HEALTH_INTERVAL", "30"))
+MCP_MAX_RESTART_DELAY = 30
+# Largest single JSON-RPC message accepted from a server
+MCP_STDIO_LINE_LIMIT = 16 * 1024 * 1024
+# JSON-RPC error code for a method the receiver does not implement
+METHOD_NOT_FOUND = -32601
+
+class McpError(Exception):
+    """A JSON-RPC error returned by an MCP server, or a server that is not running."""
+
+class McpStdioProcess:
+    def __init__(self, name: str, command: str, args: Optional[List[str]] = None, env: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.command = command
+        self.args = args or []
+        self.env = env or {}
+        self.server_info: Dict[str, Any] = {}
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._health_task: Optional[asyncio.Task] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        # Consecutive failed starts and crashes, used for the restart backoff
+        self._failures = 0
+        self._closed = False
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self):
+        """Starts the server if it is not running and performs the MCP initialize handshake"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.running:
+                return
+            if self._closed:
+                raise McpError(f"MCP server {self.name} is closed")
+            if self._failures:
+                delay = min(2 ** (self._failures - 1), MCP_MAX_RESTART_DELAY)
+                debug_print(MAGENTA, f"Restarting MCP server {self.name} in {delay}s (attempt {self._failures}).")
+                await asyncio.sleep(delay)
+            failures = self._failures
+            try:
+                await self._spawn()
+                result = await self.request("initialize", {
+                    "protocolVersion": MCP_PROTOCOL_VERSION,
+                    "capabilities": {},
+                    "clientInfo": {"name": "aoeii-backend", "version": "1.0"},
+                }, timeout=MCP_STDIO_START_TIMEOUT)
+                await self.notify("notifications/initialized")
+            except Exception:
+                await self._terminate()
+                # Counted once, whether or not the reader already saw the process exit
+                self._failures = failures + 1
+                raise
+            self.server_info = (result or {}).get("serverInfo", {})
+            self._failures = 0
+            if self._health_task is None or self._health_task.done():
+                self._health_task = asyncio.create_task(self._health_check())
+            debug_print(GREEN, f"MCP server {self.name} started (pid {self._process.pid}).")
+
+    async def _spawn(self):
+        self._process = await asyncio.create_subprocess_exec(
+            self.command, *self.args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={**os.environ, **self.env},
+            limit=MCP_STDIO_LINE_LIMIT,
+        )
+        self._tasks = [
+            asyncio.create_task(self._read_responses(self._process)),
+            asyncio.create_task(self._read_stderr(self._process)),
+        ]
+
+    async def _read_responses(self, process):
+        """Resolves pending requests from the server's stdout until it exits"""
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    debug_print(MAGENTA, f"MCP server {self.name} wrote a non JSON-RPC line: {line[:200]!r}")
+                    continue
+                if "method" in message:
+                    # A request or notification from the server, not a response to one of ours
+                    if "id" in message:
+                        self._answer_server_request(process, message)
+                    continue
+                future = self._pending.pop(message.get("id"), None) if "id" in message else None
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    error = message["error"]
+                    future.set_exception(McpError(f"{error.get('message', 'Unknown error')} (code {error.get('code')})"))
+                else:
+                    future.set_result(message.get("result"))
+        except Exception as e:
+            debug_print(MAGENTA, f"Error reading from MCP server {self.name}: {e}")
+        finally:
+            if self._process is process:
+                # Exited on its own rather than through _terminate()
+                debug_print(MAGENTA, f"MCP server {self.name} exited.")
+                self._process = None
+                self._failures += 1
+            self._fail_pending(McpError(f"MCP server {self.name} exited"))
+
+    def _answer_server_request(self, process, message: Dict[str, Any]):
+        """
+        Answers a ping from the server and rejects any other request. Written
+        without waiting for drain, so the reader never blocks on a server that
+        is not reading its stdin.
+        """
+        method = message.get("method")
+        reply = {"jsonrpc": "2.0", "id": message["id"]}
+        if method == "ping":
+            reply["result"] = {}
+        else:
+            debug_print(MAGENTA, f"MCP server {self.name} sent an unsupported request: {method}")
+            reply["error"] = {"code": METHOD_NOT_FOUND, "message": f"Method not found: {method}"}
+        try:
+            process.stdin.write(json.dumps(reply).encode() + b"\n")
+        except Exception as e:
+            debug_print(MAGENTA, f"Error replying to MCP server {self.name}: {e}")
+
+    async def _read_stderr(self, process):
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            debug_print(BLUE, f"[{self.name}] {line.decode(errors='replace').rstrip()}")
+
+    def _fail_pending(self, error):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _write(self, message: Dict[str, Any]):
+        if not self.running:
+            raise McpError(f"MCP server {self.name} is not running")
+        self._process.stdin.write(json.dumps(message).encode() + b"\n")
+        await self._process.stdin.drain()
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None, timeout: float = MCP_STDIO_REQUEST_TIMEOUT) -> Any:
+        """Sends a JSON-RPC request and waits for its response"""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        try:
+            await self._write(message)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def notify(self, method: str, params: Optional[Dict[str, Any]] = None):
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        await self._write(message)
+
+    async def call(self, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """Sends a request, first restarting the server if it has exited"""
+        if not self.running:
+            await self.start()
+        return await self.request(method, params)
+
+    async def _health_check(self):
+        """Pings the server periodically and restarts it when it has exited or stopped answering"""
+        while not self._closed:
+            await asyncio.sleep(MCP_HEALTH_INTERVAL)
+            if self.running:
+                try:
+                    await self.request("ping", timeout=MCP_STDIO_START_TIMEOUT)
+                    continue
+                except McpError:
+                    # Servers without ping answer "method not found", which still proves they are alive
+                    if self.running:
+                        continue
+                except asyncio.TimeoutError:
+                    debug_print(MAGENTA, f"MCP server {self.name} did not answer its health check.")
+                    await self._terminate()
+                    self._failures += 1
+            try:
+                await self.start()
+            except Exception as e:
+                debug_print(MAGENTA, f"Error restarting MCP server {self.name}: {e}")
+
+    async def _terminate(self):
+        process, self._process = self._process, None
+        if process is not None and process.returncode is None:
+            try:
+                process.stdin.close()
+                await asyncio.wait_for(process.wait(), 2)
+            except (asyncio.TimeoutError, OSError):
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    # It exited after the wait timed out
+                    pass
+                await process.wait()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._fail_pending(McpError(f"MCP server {self.name} stopped"))
+
+    async def close(self):
+        """Stops the health check and the server process"""
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await self._terminate()
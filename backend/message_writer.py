@@ -0,0 +1,179 @@
+"""
+Write-behind persistence for conversation messages.
+
+Request handlers enqueue messages and return immediately; a single background
+thread groups whatever is pending into one transaction. Streamed model
+responses are checkpointed while they are generated, so a disconnect or a
+stop keeps the text produced so far.
+"""
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from db import write_messages
+from utils import MAGENTA, debug_print
+
+MAX_BATCH_SIZE = 200
+# Longest time a queued write waits for other writes to join its batch
+BATCH_WINDOW = 0.02
+# A streamed response is checkpointed every N chunks or M seconds
+CHECKPOINT_CHUNKS = int(os.getenv("CHECKPOINT_CHUNKS", "50"))
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "1.0"))
+FLUSH_TIMEOUT = 10
+
+_STOP = object()
+
+class PendingMessage:
+    """A message owned by the writer. `id` is set once it has been inserted."""
+    def __init__(self, conversation_id, role, content=""):
+        self.conversation_id = conversation_id
+        self.role = role
+        self.content = content
+        self.created_at = datetime.now().isoformat()
+        self.id = None
+
+class StreamedMessage(PendingMessage):
+    """A model response that is checkpointed while it streams."""
+    def __init__(self, writer, conversation_id, role):
+        super().__init__(conversation_id, role)
+        self._writer = writer
+        self._chunks = []
+        self._unsaved_chunks = 0
+        self._last_checkpoint = time.monotonic()
+
+    def append(self, chunk):
+        """Adds a chunk, enqueueing a checkpoint when enough text or time has accumulated."""
+        self._chunks.append(chunk)
+        self._unsaved_chunks += 1
+        now = time.monotonic()
+        if self._unsaved_chunks >= CHECKPOINT_CHUNKS or now - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self._checkpoint(now)
+
+    def finish(self):
+        """Enqueues the final content. Safe to call more than once."""
+        if self._unsaved_chunks or self.id is None:
+            self._checkpoint(time.monotonic())
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def _checkpoint(self, now):
+        self.content = self.text
+        self._unsaved_chunks = 0
+        self._last_checkpoint = now
+        self._writer.enqueue(self)
+
+class MessageWriter:
+    """Background thread that batches message inserts and updates."""
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.messages_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, message):
+        self.start()
+        self._queue.put(message)
+
+    def add_message(self, conversation_id, role, content):
+        """Queues a complete message for insertion and returns it."""
+        message = PendingMessage(conversation_id, role, content)
+        self.enqueue(message)
+        return message
+
+    def start_message(self, conversation_id, role):
+        """Returns a StreamedMessage to append response chunks to."""
+        return StreamedMessage(self, conversation_id, role)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Blocks until everything queued before this call has been written."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        """Writes all pending messages and stops the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def metrics(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "messages_written": self.messages_written,
+            "batches_written": self.batches_written,
+            "write_errors": self.write_errors,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_seconds * 1000, 3),
+        }
+
+    def _collect_batch(self, first):
+        """Drains the queue into an ordered batch, coalescing repeated writes of a message."""
+        batch = {}
+        events = []
+        stop = False
+        item = first
+        deadline = time.monotonic() + BATCH_WINDOW
+        while True:
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                events.append(item)
+            else:
+                batch[id(item)] = item
+            if stop or len(batch) >= MAX_BATCH_SIZE:
+                break
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+        return list(batch.values()), events, stop
+
+    def _write_individually(self, messages):
+        for message in messages:
+            try:
+                write_messages([message])
+                self.messages_written += 1
+            except Exception as e:
+                self.write_errors += 1
+                debug_print(MAGENTA, f"Error writing message for conversation {message.conversation_id}: {e}")
+
+    def _run(self):
+        while True:
+            messages, events, stop = self._collect_batch(self._queue.get())
+            if messages:
+                start = time.perf_counter()
+                try:
+                    write_messages(messages)
+                    self.messages_written += len(messages)
+                    self.batches_written += 1
+                    self.last_batch_size = len(messages)
+                    self.last_batch_seconds = time.perf_counter() - start
+                except Exception as e:
+                    # One bad row (e.g. its conversation was deleted) must not drop the whole batch
+                    debug_print(MAGENTA, f"Error writing batch of {len(messages)} messages, retrying one by one: {e}")
+                    self._write_individually(messages)
+            for event in events:
+                event.set()
+            if stop:
+                break
+
+# Process-wide writer used by the API routes
+message_writer = MessageWriter()
@@ -0,0 +1,24 @@
+-- Secondary indexes for the ordered lookups in db.py and an enforced
+-- ON DELETE CASCADE from messages to conversations. SQLite cannot alter a
+-- foreign key in place, so the messages table is rebuilt.
+
+DELETE FROM messages WHERE conversation_id NOT IN (SELECT id FROM conversations);
+
+CREATE TABLE messages_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
+);
+
+INSERT INTO messages_new (id, conversation_id, role, content, created_at)
+    SELECT id, conversation_id, role, content, created_at FROM messages;
+
+DROP TABLE messages;
+ALTER TABLE messages_new RENAME TO messages;
+
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created ON messages(conversation_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations(created_at);
+CREATE INDEX IF NOT EXISTS idx_simple_responses_created ON simple_responses(created_at);
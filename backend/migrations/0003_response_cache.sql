@@ -0,0 +1,12 @@
+-- Exact-match cache of complete LLM responses, used by response_cache.py when
+-- RESPONSE_CACHE is enabled. Times are Unix timestamps; last_used_at drives
+-- LRU eviction and created_at the TTL.
+
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache(last_used_at);
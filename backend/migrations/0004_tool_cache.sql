@@ -0,0 +1,12 @@
+-- Spill store for tool results evicted from the in-memory cache in
+-- tool_cache.py (used when TOOL_CACHE_SPILL is enabled). Results are JSON;
+-- expires_at is a Unix timestamp.
+
+CREATE TABLE IF NOT EXISTS tool_cache (
+    key TEXT PRIMARY KEY,
+    tool_name TEXT NOT NULL,
+    result TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_tool_cache_expires ON tool_cache(expires_at);
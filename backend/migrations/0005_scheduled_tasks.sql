@@ -0,0 +1,18 @@
+-- Recurring prompts run by the in-process scheduler in scheduler.py, which
+-- replaces the crontab + curl jobs task_tool used to install. schedule is a
+-- cron expression; next_fire_at and last_run_at are Unix timestamps, and
+-- next_fire_at is the cron time before jitter. catch_up is skip, once or all.
+
+CREATE TABLE IF NOT EXISTS scheduled_tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt TEXT NOT NULL,
+    schedule TEXT NOT NULL,
+    jitter REAL NOT NULL DEFAULT 0,
+    catch_up TEXT NOT NULL DEFAULT 'once',
+    next_fire_at REAL NOT NULL,
+    last_run_at REAL,
+    last_status TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduled_tasks_next_fire ON scheduled_tasks(next_fire_at);
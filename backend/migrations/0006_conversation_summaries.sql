@@ -0,0 +1,13 @@
+-- Rolling summaries of the older part of each conversation, used by
+-- context_window.py in place of the turns that no longer fit the history
+-- token budget. covered_until is the id of the newest message the summary
+-- includes and tokens its own token count.
+
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    conversation_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL,
+    covered_until INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
+);
@@ -0,0 +1,5 @@
+-- Scheduled tasks the scheduler has switched off, such as one whose stored
+-- schedule no longer parses; last_status says why. Disabled tasks are kept
+-- so they can be listed and removed, but never run.
+
+ALTER TABLE scheduled_tasks ADD COLUMN enabled INTEGER NOT NULL DEFAULT 1;
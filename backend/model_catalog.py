@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+import time
+from utils import GREEN, MAGENTA, debug_print
+
+# Seconds a fetched model list is served before it is refreshed in the background
+MODEL_CACHE_TTL = float(os.getenv("MODEL_CACHE_TTL", "3600"))
+# Snapshot of the catalog, loaded at boot so model lists are available before any provider answers
+MODEL_CACHE_PATH = os.getenv("MODEL_CACHE_PATH", "model_cache.json")
+
+class ModelCatalog:
+    """
+    Model lists of every provider, shared by the provider classes.
+
+    Lists are served from memory. Once an entry is older than the TTL it is
+    still returned while a background thread fetches a new one
+    (stale-while-revalidate). Every successful fetch is written to an on-disk
+    snapshot that is read back on the first lookup after a restart.
+    """
+    def __init__(self, path=MODEL_CACHE_PATH, ttl=MODEL_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._entries = None
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        # Serializes snapshot writes, which share one temporary file
+        self._save_lock = threading.Lock()
+
+    def _load_snapshot(self):
+        entries = {}
+        try:
+            with open(self.path) as f:
+                for key, entry in json.load(f).items():
+                    entries[key] = {"models": list(entry["models"]), "fetched_at": float(entry["fetched_at"])}
+            debug_print(GREEN, f"Loaded model catalog snapshot with {len(entries)} providers.")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            debug_print(MAGENTA, f"Ignoring unreadable model catalog snapshot: {e}")
+        return entries
+
+    def _save_snapshot(self, entries):
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            debug_print(MAGENTA, f"Error saving model catalog snapshot: {e}")
+
+    def _get_entry(self, key):
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load_snapshot()
+            return self._entries.get(key)
+
+    def _is_stale(self, entry):
+        return entry is None or time.time() - entry["fetched_at"] >= self.ttl
+
+    def refresh(self, key, fetch):
+        """Fetches the model list for `key` now and stores it. Errors keep the previous list."""
+        try:
+            models = list(fetch())
+        except Exception as e:
+            debug_print(MAGENTA, f"Error refreshing {key} models: {e}")
+            entry = self._get_entry(key)
+            return entry["models"] if entry else []
+        self._get_entry(key)
+        with self._lock:
+            self._entries[key] = {"models": models, "fetched_at": time.time()}
+        with self._save_lock:
+            with self._lock:
+                snapshot = dict(self._entries)
+            self._save_snapshot(snapshot)
+        return models
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(key, fetch)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"model-catalog-{key}", daemon=True).start()
+
+    def get(self, key, fetch):
+        """
+        Returns the cached model list for `key` without blocking.
+
+        A missing or stale entry is fetched in the background; until then the
+        stale list, or an empty one, is returned.
+        """
+        entry = self._get_entry(key)
+        if self._is_stale(entry):
+            self._refresh_in_background(key, fetch)
+        return entry["models"] if entry else []
+
+    def ensure_fresh(self, key, fetch):
+        """Returns the model list for `key`, fetching it first if it is missing or stale."""
+        entry = self._get_entry(key)
+        if self._is_stale(entry):
+            return self.refresh(key, fetch)
+        return entry["models"]
+
+    def age(self, key):
+        """Returns the age in seconds of the list for `key`, or None if it was never fetched."""
+        entry = self._get_entry(key)
+        return time.time() - entry["fetched_at"] if entry else None
+
+# Catalog shared by all providers
+model_catalog = ModelCatalog()
@@ -1,15 +1,26 @@
+import os
 import time
 import ollama
-from typing import List, Optional, Generator
+from typing import List, Optional, Generator, AsyncGenerator
 from PIL import Image
 import io
 import json
+from model_catalog import model_catalog
+from rate_governor import estimate_tokens
+from stream_retry import stream_with_retry, stream_with_retry_async
 from utils import retry_with_exponential_backoff, STREAM_START_DELAY, STREAM_YIELD_DELAY
 
+# Context window requested from Ollama. Kept fixed because Ollama reloads a
+# model whenever num_ctx changes; context_window.py packs requests to fit it.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "16384"))
+
 class OllamaAPI:
     def __init__(self):
-        self.available_models = self._list_available_models()
-        self._current_stream = None
+        self.async_client = ollama.AsyncClient()
+        # Key of this client's model list in the shared model catalog
+        self.catalog_key = "ollama"
+        # Active chat streams keyed by stream id; stop_stream removes one to end it
+        self._active_streams = {}
 
     @retry_with_exponential_backoff()
     def _list_available_models(self) -> List[str]:
@@ -25,7 +36,8 @@ class OllamaAPI:
             return [model.model for model in models['models']]
         except Exception as e:
             print(f"Error listing Ollama models: {e}")
-            return []
+            # The model catalog keeps the last good list
+            raise
 
 
     def list_models(self) -> List[str]:
@@ -35,14 +47,45 @@ class OllamaAPI:
         Returns:
             List[str]: A list of available model names.
         """
-        return self.available_models
+        return model_catalog.get(self.catalog_key, self._list_available_models)
 
-    def stop_stream(self):
-        """Stops the current stream."""
-        self._current_stream = None
+    def refresh_models(self) -> List[str]:
+        """
+        Fetches the model list from Ollama API unless the cached one is still fresh.
 
-    @retry_with_exponential_backoff()
-    def generate_response(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None) -> Generator[str, None, None]:
+        Returns:
+            List[str]: A list of available model names.
+        """
+        return model_catalog.ensure_fresh(self.catalog_key, self._list_available_models)
+
+    def stop_stream(self, stream_id):
+        """Stops the stream with the given id."""
+        self._active_streams.pop(stream_id, None)
+
+    def _build_messages(self, prompt: str, image: Optional[Image.Image], history: Optional[List[dict]], system_message: Optional[str]) -> List[dict]:
+        """Builds the chat messages for a request."""
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        if history:
+            for message in history:
+                if message["role"] == "model":
+                    messages.append({"role": "assistant", "content": message["content"]})
+                else:
+                    messages.append({"role": message["role"], "content": message["content"]})
+
+        if image:
+            # Convert PIL Image to bytes
+            image_bytes = io.BytesIO()
+            image.save(image_bytes, format=image.format if image.format else "PNG")
+            image_bytes = image_bytes.getvalue()
+
+            messages.append({"role": "user", "content": prompt, "images": [image_bytes]})
+        else:
+            messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def generate_response(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None, stream_handle=None) -> Generator[str, None, None]:
         """
         Generates a response using the specified Ollama model, yielding chunks of the response.
 
@@ -52,37 +95,55 @@ class OllamaAPI:
             image (Optional[Image.Image]): An optional image to include in the prompt.
             history (Optional[List[dict]]): An optional list of previous chat messages.
             system_message (Optional[str]): An optional system message to include in the prompt.
+            stream_handle (Optional): StreamHandle whose cancellation stops the stream.
 
         Yields:
             str: The generated response chunks from Ollama.
         """
+        return stream_with_retry(
+            self.catalog_key, lambda sent: self._stream(prompt, model_name, image, history, system_message, stream_handle), stream_handle,
+            model_name=model_name, tokens=estimate_tokens(prompt, system_message, history)
+        )
+
+    def _stream(self, prompt, model_name, image, history, system_message, stream_handle):
+        """Streams a single attempt of generate_response, raising on failure"""
+        messages = self._build_messages(prompt, image, history, system_message)
+        stream_id = stream_handle.id if stream_handle else id(messages)
+        response_stream = ollama.chat(model=model_name, messages=messages, stream=True, options={"num_ctx": OLLAMA_NUM_CTX})
+        self._active_streams[stream_id] = response_stream
+        if stream_handle:
+            stream_handle.on_cancel(lambda: self.stop_stream(stream_id))
         try:
-            messages = []
-            if system_message:
-                messages.append({"role": "system", "content": system_message})
-            if history:
-                for message in history:
-                    if message["role"] == "model":
-                        messages.append({"role": "assistant", "content": message["content"]})
-                    else:
-                        messages.append({"role": message["role"], "content": message["content"]})
-            
-            if image:
-                # Convert PIL Image to bytes
-                image_bytes = io.BytesIO()
-                image.save(image_bytes, format=image.format if image.format else "PNG")
-                image_bytes = image_bytes.getvalue()
-                
-                messages.append({"role": "user", "content": prompt, "images": [image_bytes]})
-            else:
-                messages.append({"role": "user", "content": prompt})
-            
-            # Extract just the model name
-            self._current_stream = ollama.chat(model=model_name, messages=messages, stream=True, options={"num_ctx": 16834})
-            for chunk in self._current_stream:
-                if self._current_stream is None:
+            for chunk in response_stream:
+                if stream_id not in self._active_streams:
                     break
                 yield chunk['message']['content']
-            self._current_stream = None
-        except Exception as e:
-            yield f"Error generating response: {e}"
+        finally:
+            # Closing the generator drops the HTTP connection so Ollama stops generating
+            self._active_streams.pop(stream_id, None)
+            response_stream.close()
+
+    async def generate_response_async(self, prompt: str, model_name: str, image: Optional[Image.Image] = None, history: Optional[List[dict]] = None, system_message: Optional[str] = None, stream_handle=None) -> AsyncGenerator[str, None]:
+        """
+        Async counterpart of generate_response used by the ASGI server. Takes the
+        same arguments.
+
+        Yields:
+            str: The generated response chunks from Ollama.
+        """
+        async for chunk in stream_with_retry_async(
+            self.catalog_key, lambda sent: self._stream_async(prompt, model_name, image, history, system_message, stream_handle), stream_handle,
+            model_name=model_name, tokens=estimate_tokens(prompt, system_message, history)
+        ):
+            yield chunk
+
+    async def _stream_async(self, prompt, model_name, image, history, system_message, stream_handle):
+        messages = self._build_messages(prompt, image, history, system_message)
+        response_stream = await self.async_client.chat(model=model_name, messages=messages, stream=True, options={"num_ctx": OLLAMA_NUM_CTX})
+        try:
+            async for chunk in response_stream:
+                if stream_handle and stream_handle.cancelled:
+                    break
+                yield chunk['message']['content']
+        finally:
+            await response_stream.aclose()
@@ -0,0 +1,397 @@
+"""
+Failover chains and hedged requests across the llm_providers registry.
+
+Routes are read from the JSON file at LLM_ROUTING_FILE (llm_routing.json in
+the backend directory by default). Without it, every request goes straight to
+the requested provider as before:
+
+    {
+        "routes": [
+            {
+                "provider": "groq",
+                "model": "llama-3.3-70b-versatile",
+                "fallbacks": [
+                    {"provider": "gemini", "model": "gemini-1.5-flash"},
+                    {"provider": "openai", "model": "gpt-4o-mini"}
+                ],
+                "hedge": true
+            }
+        ]
+    }
+
+A route matches requests for its provider and, if given, its model. The
+requested (provider, model) is tried first and then each fallback in order.
+An attempt that fails before its first chunk, after its own retries in
+stream_retry, moves on to the next pair. Once a chunk has been sent the answer
+stays with that provider.
+
+With "hedge" set, a backup request goes to the next pair in the chain if the
+current one has produced nothing after its usual time to first token. That is
+the LLM_HEDGE_PERCENTILE (or the route's "hedge_percentile") of its recent
+times, or LLM_HEDGE_DELAY until LLM_HEDGE_MIN_SAMPLES have been recorded.
+Whichever streams first is used and the other is cancelled. A request hedges
+at most once.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from providers import llm_providers
+from stream_registry import StreamHandle
+from stream_retry import ERROR_PREFIX
+from utils import BLUE, GREEN, MAGENTA, debug_print, iterate_in_thread
+
+LLM_ROUTING_FILE = os.getenv("LLM_ROUTING_FILE", "llm_routing.json")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+# Hedge delay until enough times to first token have been recorded
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2"))
+# Shortest hedge delay, however fast a provider has been
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.25"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Recent times to first token kept per (provider, model)
+TTFT_SAMPLES = 200
+# Longest wait for an attempt's next event before checking for cancellation
+POLL_INTERVAL = 0.5
+
+_DONE = object()
+
+class Route:
+    """A fallback chain, optionally hedged, for requests to one provider and model."""
+    def __init__(self, config):
+        self.provider = config["provider"]
+        self.model = config.get("model")
+        self.fallbacks = [(fallback["provider"], fallback["model"]) for fallback in config.get("fallbacks", [])]
+        self.hedge = bool(config.get("hedge", False))
+        self.hedge_percentile = float(config.get("hedge_percentile", LLM_HEDGE_PERCENTILE))
+        self.label = f"{self.provider}/{self.model or '*'}"
+
+    def matches(self, provider_name, model_name):
+        return provider_name == self.provider and self.model in (None, model_name)
+
+    def chain(self, provider_name, model_name):
+        """The requested pair followed by the fallbacks, skipping repeats"""
+        chain = [(provider_name, model_name)]
+        for pair in self.fallbacks:
+            if pair not in chain:
+                chain.append(pair)
+        return chain
+
+class LatencyTracker:
+    """Recent times to first token per (provider, model)."""
+    def __init__(self, size=TTFT_SAMPLES):
+        self.size = size
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.size)
+            samples.append(seconds)
+
+    def percentile(self, key, fraction):
+        """Returns the percentile and the number of samples it is based on"""
+        with self._lock:
+            ordered = sorted(self._samples.get(key, ()))
+        if not ordered:
+            return None, 0
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], len(ordered)
+
+    def hedge_delay(self, key, fraction):
+        value, count = self.percentile(key, fraction)
+        if count < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, value)
+
+    def metrics(self):
+        with self._lock:
+            keys = list(self._samples)
+        metrics = {}
+        for key in keys:
+            p50, count = self.percentile(key, 0.5)
+            p99, _ = self.percentile(key, 0.99)
+            metrics["/".join(key)] = {"samples": count, "ttft_p50": p50, "ttft_p99": p99}
+        return metrics
+
+class Attempt:
+    """One request in a route's chain, with its own StreamHandle so it can be cancelled alone."""
+    def __init__(self, provider_name, model_name, provider, stream_handle, number):
+        self.provider_name = provider_name
+        self.model_name = model_name
+        self.provider = provider
+        self.handle = StreamHandle(f"{stream_handle.id}/{number}" if stream_handle else f"attempt-{number}")
+        if stream_handle:
+            stream_handle.on_cancel(self.handle.cancel)
+        self.started = time.monotonic()
+        self.stream = None
+        self.task = None
+        self.finished = False
+
+    @property
+    def key(self):
+        return (self.provider_name, self.model_name)
+
+    @property
+    def label(self):
+        return f"{self.provider_name}/{self.model_name}"
+
+class ProviderRouter:
+    def __init__(self, routing_file=LLM_ROUTING_FILE):
+        self.routes = []
+        self.latency = LatencyTracker()
+        self._counts = {}
+        self._lock = threading.Lock()
+        if routing_file and os.path.exists(routing_file):
+            self.load(routing_file)
+
+    def load(self, routing_file):
+        """Replaces the routes with those in a routing file; invalid routes are skipped"""
+        try:
+            with open(routing_file) as f:
+                configs = json.load(f).get("routes", [])
+        except Exception as e:
+            debug_print(MAGENTA, f"Error loading LLM routing file {routing_file}: {e}")
+            return
+        routes = []
+        for config in configs:
+            try:
+                routes.append(Route(config))
+            except (KeyError, TypeError, ValueError) as e:
+                debug_print(MAGENTA, f"Skipping invalid LLM route {config}: {e}")
+        self.routes = routes
+        debug_print(GREEN, f"Loaded {len(routes)} LLM routes from {routing_file}.")
+
+    def find_route(self, provider_name, model_name):
+        for route in self.routes:
+            if route.matches(provider_name, model_name):
+                return route
+        return None
+
+    def _count(self, route, event):
+        with self._lock:
+            counts = self._counts.setdefault(route.label, {"requests": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0, "failed": 0})
+            counts[event] += 1
+
+    def _chain(self, route, provider_name, model_name):
+        """(provider name, model, provider) for each pair of the chain whose provider is available"""
+        chain = []
+        for name, model in route.chain(provider_name, model_name):
+            provider = llm_providers.get(name)
+            if provider is None:
+                debug_print(MAGENTA, f"LLM route {route.label}: provider {name} is unavailable, skipping it.")
+                continue
+            chain.append((name, model, provider))
+        return chain
+
+    def _hedge_deadline(self, route, pending, remaining, hedged):
+        """When to hedge the only pending attempt, or None if this request should not hedge"""
+        if not route.hedge or hedged or not remaining or len(pending) != 1:
+            return None
+        return pending[0].started + self.latency.hedge_delay(pending[0].key, route.hedge_percentile)
+
+    def _first_output(self, route, winner, pending):
+        """Records the winning attempt's time to first token and cancels the others"""
+        now = time.monotonic()
+        self.latency.record(winner.key, now - winner.started)
+        if winner is not pending[0]:
+            self._count(route, "hedge_wins")
+        for attempt in pending:
+            if attempt is not winner:
+                # Cut short, so the real time is at least this long
+                self.latency.record(attempt.key, now - attempt.started)
+                debug_print(BLUE, f"LLM route {route.label}: {winner.label} answered first, cancelling {attempt.label}.")
+                attempt.handle.cancel()
+                if attempt.task is not None:
+                    attempt.task.cancel()
+
+    def _failed(self, route, attempt, error, pending, remaining):
+        debug_print(MAGENTA, f"LLM route {route.label}: {attempt.label} failed before answering: {error}")
+        pending.remove(attempt)
+        if not pending and remaining:
+            self._count(route, "failovers")
+            debug_print(BLUE, f"LLM route {route.label}: failing over to {remaining[0][0]}/{remaining[0][1]}.")
+
+    def generate_response(self, provider_name, model_name, stream_handle=None, **kwargs):
+        """
+        Streams a response from the requested provider or, when a route
+        matches, from its failover chain. Takes the keyword arguments of the
+        providers' generate_response.
+
+        Yields:
+            str: Response chunks from whichever provider answered.
+        """
+        route = self.find_route(provider_name, model_name)
+        if route is None:
+            return llm_providers.get(provider_name).generate_response(model_name=model_name, stream_handle=stream_handle, **kwargs)
+        return self._route(route, self._chain(route, provider_name, model_name), kwargs, stream_handle)
+
+    def _start(self, target, kwargs, stream_handle, events, number):
+        name, model, provider = target
+        attempt = Attempt(name, model, provider, stream_handle, number)
+        attempt.stream = provider.generate_response(model_name=model, stream_handle=attempt.handle, **kwargs)
+        threading.Thread(target=self._pump, args=(attempt, events), name=f"llm-attempt-{name}", daemon=True).start()
+        return attempt
+
+    @staticmethod
+    def _pump(attempt, events):
+        """Moves an attempt's chunks onto the shared queue until it ends or is cancelled"""
+        try:
+            for chunk in attempt.stream:
+                if attempt.handle.cancelled:
+                    break
+                events.put((attempt, chunk))
+        except Exception as e:
+            events.put((attempt, f"{ERROR_PREFIX}: {e}"))
+        finally:
+            attempt.stream.close()
+            events.put((attempt, _DONE))
+
+    def _route(self, route, chain, kwargs, stream_handle):
+        self._count(route, "requests")
+        events = queue.Queue()
+        remaining = list(chain)
+        started = []
+        pending = []
+        hedged = False
+        error = f"{ERROR_PREFIX}: no provider of route {route.label} is available"
+        try:
+            while pending or remaining:
+                if not pending:
+                    pending.append(self._start(remaining.pop(0), kwargs, stream_handle, events, len(started)))
+                    started.append(pending[-1])
+                deadline = self._hedge_deadline(route, pending, remaining, hedged)
+                timeout = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, max(0.0, deadline - time.monotonic()))
+                try:
+                    attempt, chunk = events.get(timeout=timeout)
+                except queue.Empty:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        hedged = True
+                        self._count(route, "hedges")
+                        debug_print(BLUE, f"LLM route {route.label}: no answer from {pending[0].label}, hedging with {remaining[0][0]}/{remaining[0][1]}.")
+                        pending.append(self._start(remaining.pop(0), kwargs, stream_handle, events, len(started)))
+                        started.append(pending[-1])
+                    continue
+                if attempt not in pending:
+                    continue
+                if stream_handle and stream_handle.cancelled:
+                    return
+                if chunk is _DONE or chunk.startswith(ERROR_PREFIX):
+                    attempt.finished = chunk is _DONE
+                    error = f"{ERROR_PREFIX}: {attempt.label} returned no output" if chunk is _DONE else chunk
+                    self._failed(route, attempt, error, pending, remaining)
+                    continue
+                self._first_output(route, attempt, pending)
+                yield chunk
+                while True:
+                    winner, chunk = events.get()
+                    if winner is not attempt:
+                        continue
+                    if chunk is _DONE:
+                        attempt.finished = True
+                        return
+                    yield chunk
+            self._count(route, "failed")
+            yield error
+        finally:
+            for attempt in started:
+                if not attempt.finished:
+                    attempt.handle.cancel()
+
+    async def generate_response_async(self, provider_name, model_name, stream_handle=None, **kwargs):
+        """Async counterpart of generate_response used by the ASGI server."""
+        route = self.find_route(provider_name, model_name)
+        if route is None:
+            async for chunk in self._open_async(llm_providers.get(provider_name), model_name, stream_handle, kwargs):
+                yield chunk
+            return
+        async for chunk in self._route_async(route, self._chain(route, provider_name, model_name), kwargs, stream_handle):
+            yield chunk
+
+    @staticmethod
+    def _open_async(provider, model_name, stream_handle, kwargs):
+        if hasattr(provider, 'generate_response_async'):
+            return provider.generate_response_async(model_name=model_name, stream_handle=stream_handle, **kwargs)
+        return iterate_in_thread(provider.generate_response(model_name=model_name, stream_handle=stream_handle, **kwargs))
+
+    def _start_async(self, target, kwargs, stream_handle, events, number):
+        name, model, provider = target
+        attempt = Attempt(name, model, provider, stream_handle, number)
+        attempt.stream = self._open_async(provider, model, attempt.handle, kwargs)
+        attempt.task = asyncio.ensure_future(self._pump_async(attempt, events))
+        return attempt
+
+    @staticmethod
+    async def _pump_async(attempt, events):
+        try:
+            async for chunk in attempt.stream:
+                events.put_nowait((attempt, chunk))
+        except Exception as e:
+            events.put_nowait((attempt, f"{ERROR_PREFIX}: {e}"))
+        finally:
+            await attempt.stream.aclose()
+            events.put_nowait((attempt, _DONE))
+
+    async def _route_async(self, route, chain, kwargs, stream_handle):
+        self._count(route, "requests")
+        events = asyncio.Queue()
+        remaining = list(chain)
+        started = []
+        pending = []
+        hedged = False
+        error = f"{ERROR_PREFIX}: no provider of route {route.label} is available"
+        try:
+            while pending or remaining:
+                if not pending:
+                    pending.append(self._start_async(remaining.pop(0), kwargs, stream_handle, events, len(started)))
+                    started.append(pending[-1])
+                deadline = self._hedge_deadline(route, pending, remaining, hedged)
+                timeout = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, max(0.0, deadline - time.monotonic()))
+                try:
+                    attempt, chunk = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        hedged = True
+                        self._count(route, "hedges")
+                        debug_print(BLUE, f"LLM route {route.label}: no answer from {pending[0].label}, hedging with {remaining[0][0]}/{remaining[0][1]}.")
+                        pending.append(self._start_async(remaining.pop(0), kwargs, stream_handle, events, len(started)))
+                        started.append(pending[-1])
+                    continue
+                if attempt not in pending:
+                    continue
+                if stream_handle and stream_handle.cancelled:
+                    return
+                if chunk is _DONE or chunk.startswith(ERROR_PREFIX):
+                    attempt.finished = chunk is _DONE
+                    error = f"{ERROR_PREFIX}: {attempt.label} returned no output" if chunk is _DONE else chunk
+                    self._failed(route, attempt, error, pending, remaining)
+                    continue
+                self._first_output(route, attempt, pending)
+                yield chunk
+                while True:
+                    winner, chunk = await events.get()
+                    if winner is not attempt:
+                        continue
+                    if chunk is _DONE:
+                        attempt.finished = True
+                        return
+                    yield chunk
+            self._count(route, "failed")
+            yield error
+        finally:
+            for attempt in started:
+                if not attempt.finished:
+                    attempt.handle.cancel()
+                    attempt.task.cancel()
+
+    def metrics(self):
+        with self._lock:
+            counts = {label: dict(route_counts) for label, route_counts in self._counts.items()}
+        return {"routes": counts, "latency": self.latency.metrics()}
+
+# Router shared by all generations
+provider_router = ProviderRouter()
@@ -1,81 +1,126 @@
 import os
-from utils import BLUE, MAGENTA, debug_print
+import threading
+import time
+from utils import BLUE, GREEN, MAGENTA, debug_print
 from claude_api import ClaudeAPI
 from gemini_api import GeminiAPI
 from ollama_api import OllamaAPI
 from openai_api import OpenAIAPI
 from groq_api import GroqAPI
 
-# Initialize the Gemini API
-gemini_api = GeminiAPI()
-debug_print(BLUE, "Gemini API initialized.")
-
-# Initialize the Ollama API
-try:
-    ollama_api = OllamaAPI()
-    debug_print(BLUE, "Ollama API initialized.")
-except Exception as e:
-    debug_print(MAGENTA, f"Error initializing Ollama API: {e}")
-    ollama_api = None
-
-# Initialize the OpenAI API
-try:
-    openai_api = OpenAIAPI()
-    debug_print(BLUE, "OpenAI API initialized.")
-except Exception as e:
+def create_openai_api():
+    """Creates the OpenAI client, falling back to an OpenAI compatible endpoint."""
     try:
+        return OpenAIAPI()
+    except Exception:
         openai_compatible_api = OpenAIAPI(base_url=os.getenv("OPENAI_COMPATIBLE_BASE_URL"))
         debug_print(BLUE, "OpenAI Compatible API initialized.")
-    except Exception as e:
-        debug_print(MAGENTA, f"Error initializing OpenAI API: {e}")
-        openai_api = None
-        openai_compatible_api = None
-    else:
-        openai_api = openai_compatible_api
-
-# Initialize the Claude API
-try:
-    claude_api = ClaudeAPI()
-    debug_print(BLUE, "Claude API initialized.")
-except Exception as e:
-    debug_print(MAGENTA, f"Error initializing Claude API: {e}")
-    claude_api = None
-
-# Initialize the Groq API
-groq_api = None
-try:
-    groq_api = GroqAPI()
-    debug_print(BLUE, "Groq API initialized.")
-except Exception as e:
-    debug_print(MAGENTA, f"Error initializing Groq API: {e}")
-    groq_api = None
-
-# Dictionary to hold available LLM providers
-llm_providers = {
-    "gemini": gemini_api,
+        return openai_compatible_api
+
+# Factories for every supported provider, keyed by provider name
+PROVIDER_FACTORIES = {
+    "gemini": GeminiAPI,
+    "ollama": OllamaAPI,
+    "openai": create_openai_api,
+    "claude": ClaudeAPI,
+    "groq": GroqAPI,
+}
+
+# Names that share the instance of another provider
+PROVIDER_ALIASES = {
+    "openai_compatible": "openai",
 }
 
-if ollama_api:
-    llm_providers["ollama"] = ollama_api
-else:
-    debug_print(True, "Ollama API not available, setting empty model list.")
+class ProviderRegistry:
+    """
+    Creates LLM providers lazily on first use.
+
+    Model lists are fetched concurrently in the background by
+    start_background_loading(), so a slow or unreachable provider no longer
+    delays startup; until its list arrives it simply reports no models.
+    """
+    def __init__(self, factories, aliases=None):
+        self._factories = factories
+        self._aliases = aliases or {}
+        self._instances = {}
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._loading_started = False
+
+    def _resolve(self, name):
+        return self._aliases.get(name, name)
+
+    def get(self, name, default=None):
+        """Returns the provider instance, creating it on first use. Unavailable providers return `default`."""
+        name = self._resolve(name)
+        if name not in self._factories or name in self._failed:
+            return default
+        provider = self._instances.get(name)
+        if provider is not None:
+            return provider
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            if name in self._failed:
+                return default
+            start = time.perf_counter()
+            try:
+                provider = self._factories[name]()
+            except Exception as e:
+                debug_print(MAGENTA, f"Error initializing {name} API: {e}")
+                self._failed.add(name)
+                return default
+            self._instances[name] = provider
+            debug_print(BLUE, f"{name} API initialized in {(time.perf_counter() - start) * 1000:.0f} ms.")
+            return provider
+
+    def __getitem__(self, name):
+        provider = self.get(name)
+        if provider is None:
+            raise KeyError(name)
+        return provider
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def names(self):
+        """Returns every configured provider name, including aliases."""
+        return list(self._factories) + list(self._aliases)
+
+    def _load_models(self, name):
+        start = time.perf_counter()
+        provider = self.get(name)
+        if provider is None:
+            return
+        try:
+            models = provider.refresh_models()
+            debug_print(GREEN, f"Loaded {len(models)} {name} models in {(time.perf_counter() - start) * 1000:.0f} ms.")
+        except Exception as e:
+            debug_print(MAGENTA, f"Error loading {name} models: {e}")
+
+    def start_background_loading(self):
+        """Fetches every provider's model list concurrently without blocking the caller."""
+        with self._lock:
+            if self._loading_started:
+                return
+            self._loading_started = True
+        start = time.perf_counter()
+        # Daemon threads, so an unreachable provider never blocks shutdown
+        loaders = [threading.Thread(target=self._load_models, args=(name,), name=f"provider-loader-{name}", daemon=True)
+                   for name in self._factories]
+        for loader in loaders:
+            loader.start()
 
-if openai_api:
-    llm_providers["openai"] = openai_api
-    llm_providers["openai_compatible"] = openai_api
-else:
-    debug_print(True, "OpenAI API not available, setting empty model list.")
+        def report_cold_start():
+            for loader in loaders:
+                loader.join()
+            debug_print(GREEN, f"All provider model lists loaded in {(time.perf_counter() - start) * 1000:.0f} ms.")
 
-if claude_api:
-    llm_providers["claude"] = claude_api
-else:
-    debug_print(True, "Claude API not available, setting empty model list.")
+        threading.Thread(target=report_cold_start, name="provider-loader-report", daemon=True).start()
 
-if groq_api:
-    llm_providers["groq"] = groq_api
-else:
-    debug_print(True, "Groq API not available, setting empty model list.")
+# Registry of available LLM providers
+llm_providers = ProviderRegistry(PROVIDER_FACTORIES, PROVIDER_ALIASES)
 
 # Default LLM provider and model
 selected_provider = "gemini"
-selected_model = "gemini-1.5-flash"
\ No newline at end of file
+selected_model = "gemini-1.5-flash"
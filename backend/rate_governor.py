@@ -0,0 +1,397 @@
+"""
+Client-side rate limits per (provider, model).
+
+Before this, nothing tracked request or token rates, so the first sign of a
+limit was a 429 from the provider. Now every streamed attempt in stream_retry
+first takes a permit from the governor of its provider and model, which
+enforces:
+
+  - rpm: requests per minute, a token bucket refilled continuously
+  - tpm: tokens per minute, reserved from the prompt's estimated size plus
+    LLM_OUTPUT_TOKEN_ESTIMATE and corrected from the actual output afterwards
+  - max_in_flight: requests streaming at once
+
+Limits come from the JSON file at LLM_LIMITS_FILE (llm_limits.json in the
+backend directory by default), keyed by "provider" or "provider/model". The
+more specific key wins:
+
+    {"groq": {"rpm": 30, "tpm": 6000}, "ollama": {"max_in_flight": 1}}
+
+Providers also report limits, which tighten the configured ones:
+  - The x-ratelimit-* headers of OpenAI and Groq and the
+    anthropic-ratelimit-* headers of Claude set the limits and the remaining
+    allowance. Only per-minute limits feed the buckets: Groq's request
+    headers count requests per day, so they only pause the key once the
+    day's allowance runs out.
+  - A 429's Retry-After pauses the key until then.
+
+Requests wait in arrival order. A request that would wait longer than
+LLM_GOVERNOR_MAX_WAIT fails at once instead of sending a request that would
+only be rejected.
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from utils import GREEN, MAGENTA, debug_print
+
+LLM_LIMITS_FILE = os.getenv("LLM_LIMITS_FILE", "llm_limits.json")
+# Longest a request waits for its turn before failing
+LLM_GOVERNOR_MAX_WAIT = float(os.getenv("LLM_GOVERNOR_MAX_WAIT", "30"))
+# Output tokens reserved per request until the real count is known
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "500"))
+# Recent queue waits kept per governor for the metrics
+WAIT_SAMPLES = 500
+# Longest wait between cancellation checks while queued
+POLL_INTERVAL = 0.5
+
+LIMIT_FIELDS = ("rpm", "tpm", "max_in_flight")
+
+# (limit, remaining, reset) header names of the request and token limits, per provider family
+RATE_LIMIT_HEADERS = {
+    "rpm": [
+        ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        ("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+    ],
+    "tpm": [
+        ("x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+        ("anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+    ],
+}
+
+# Request limit headers that count requests per day rather than per minute, per provider
+PER_DAY_REQUEST_HEADERS = {
+    "groq": ("x-ratelimit-limit-requests",),
+}
+
+class RateLimitWaitExceeded(Exception):
+    """Raised when a request would have to wait longer than allowed for its turn."""
+
+def estimate_tokens(*parts):
+    """Rough token count of strings and message lists, at about four characters a token"""
+    chars = 0
+    for part in parts:
+        if isinstance(part, str):
+            chars += len(part)
+        elif isinstance(part, (list, tuple)):
+            chars += sum(len(str(message.get("content", ""))) if isinstance(message, dict) else len(str(message)) for message in part)
+    return chars // 4 + 1
+
+def parse_reset(value):
+    """Seconds until a rate limit resets, from "1m30s"-style durations or an RFC 3339 time"""
+    value = value.strip()
+    units = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if units and "".join(number + unit for number, unit in units) == value:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * scale[unit] for number, unit in units)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return max(0.0, reset.timestamp() - time.time())
+
+class TokenBucket:
+    """Allowance of `per_minute` units refilled continuously. Reservations may run it into debt."""
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Takes `amount` and returns the seconds until the bucket is out of debt again"""
+        self._refill(now)
+        self.level -= min(amount, self.per_minute)
+        return 0.0 if self.level >= 0 else -self.level * 60 / self.per_minute
+
+    def refund(self, amount, now):
+        """Gives back part of a reservation; a negative amount charges more"""
+        self._refill(now)
+        self.level = min(self.per_minute, self.level + amount)
+
+    def set_limit(self, per_minute, now):
+        self._refill(now)
+        self.per_minute = per_minute
+        self.level = min(self.level, per_minute)
+
+    def set_remaining(self, remaining, now):
+        self._refill(now)
+        self.level = min(self.level, remaining)
+
+class _Waiter:
+    """A request queued for an in-flight slot, woken from any thread"""
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+class Permit:
+    """An in-flight slot and the tokens reserved for one request."""
+    def __init__(self, governor, reserved_tokens):
+        self.governor = governor
+        self.reserved_tokens = reserved_tokens
+        self._released = False
+
+    def release(self, used_tokens=None):
+        """Frees the slot and corrects the token reservation to `used_tokens` when known"""
+        if self._released:
+            return
+        self._released = True
+        self.governor._release(self.reserved_tokens, used_tokens)
+
+class Governor:
+    """Rate limits and the queue of one (provider, model)."""
+    def __init__(self, label, limits, per_day_headers=()):
+        self.label = label
+        # Limit headers whose window is a day; they never set the per-minute buckets
+        self.per_day_headers = per_day_headers
+        self.max_in_flight = int(limits.get("max_in_flight", 0))
+        self.requests = TokenBucket(limits["rpm"]) if limits.get("rpm") else None
+        self.tokens = TokenBucket(limits["tpm"]) if limits.get("tpm") else None
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.rejected = 0
+        self._waiters = deque()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._lock = threading.Lock()
+
+    def _enter(self, loop=None):
+        """Takes an in-flight slot, or returns a waiter queued for the next free one"""
+        with self._lock:
+            if not self._waiters and (self.max_in_flight <= 0 or self.in_flight < self.max_in_flight):
+                self.in_flight += 1
+                return None
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter):
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._lock:
+            self.in_flight -= 1
+            while self._waiters and (self.max_in_flight <= 0 or self.in_flight < self.max_in_flight):
+                self.in_flight += 1
+                self._waiters.popleft().grant()
+
+    def _reserve(self, tokens, max_wait):
+        """Reserves one request and `tokens` tokens, returning the wait until they are available"""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self.paused_until - now)
+            if self.requests:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens:
+                delay = max(delay, self.tokens.reserve(tokens, now))
+            if delay <= max_wait:
+                return delay
+            if self.requests:
+                self.requests.refund(1, now)
+            if self.tokens:
+                self.tokens.refund(tokens, now)
+            self.rejected += 1
+        self._release_slot()
+        raise RateLimitWaitExceeded(f"{self.label} is rate limited for another {delay:.0f}s")
+
+    def _record_wait(self, seconds):
+        with self._lock:
+            self._waits.append(seconds)
+
+    def _release(self, reserved_tokens, used_tokens):
+        if self.tokens and used_tokens is not None:
+            with self._lock:
+                self.tokens.refund(reserved_tokens - used_tokens, time.monotonic())
+        self._release_slot()
+
+    def acquire(self, tokens, stream_handle=None, max_wait=LLM_GOVERNOR_MAX_WAIT):
+        """
+        Waits for this request's turn and returns its Permit, or None if the
+        stream was cancelled while waiting.
+
+        Raises:
+            RateLimitWaitExceeded: If the wait would be longer than `max_wait`.
+        """
+        start = time.monotonic()
+        waiter = self._enter()
+        if waiter is not None:
+            while not waiter.event.wait(POLL_INTERVAL):
+                if stream_handle and stream_handle.cancelled:
+                    self._abandon(waiter)
+                    return None
+                if time.monotonic() - start > max_wait:
+                    self._abandon(waiter)
+                    with self._lock:
+                        self.rejected += 1
+                    raise RateLimitWaitExceeded(f"{self.label} has too many requests in flight")
+        delay = self._reserve(tokens, max_wait - (time.monotonic() - start))
+        if delay > 0:
+            if not stream_handle:
+                time.sleep(delay)
+            elif stream_handle.wait_cancelled(delay):
+                self._release_slot()
+                return None
+        self._record_wait(time.monotonic() - start)
+        return Permit(self, tokens)
+
+    async def acquire_async(self, tokens, stream_handle=None, max_wait=LLM_GOVERNOR_MAX_WAIT):
+        """Async counterpart of acquire."""
+        start = time.monotonic()
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), max_wait)
+            except asyncio.TimeoutError:
+                self._abandon(waiter)
+                with self._lock:
+                    self.rejected += 1
+                raise RateLimitWaitExceeded(f"{self.label} has too many requests in flight") from None
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        delay = self._reserve(tokens, max_wait - (time.monotonic() - start))
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self._release_slot()
+            raise
+        if stream_handle and stream_handle.cancelled:
+            self._release_slot()
+            return None
+        self._record_wait(time.monotonic() - start)
+        return Permit(self, tokens)
+
+    def learn(self, headers, retry_after=None):
+        """Applies the limits reported in a provider's response headers, and a 429's Retry-After"""
+        now = time.monotonic()
+        with self._lock:
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if not headers:
+                return
+            for field, families in RATE_LIMIT_HEADERS.items():
+                for limit_name, remaining_name, reset_name in families:
+                    try:
+                        limit = headers.get(limit_name)
+                        remaining = headers.get(remaining_name)
+                        reset = headers.get(reset_name)
+                        per_minute = limit_name not in self.per_day_headers
+                        if limit is not None and per_minute:
+                            self._learn_limit(field, float(limit), now)
+                        if remaining is not None:
+                            remaining = float(remaining)
+                            bucket = self.requests if field == "rpm" else self.tokens
+                            if bucket is not None and per_minute:
+                                bucket.set_remaining(remaining, now)
+                            if remaining <= 0 and reset is not None:
+                                self.paused_until = max(self.paused_until, now + parse_reset(reset))
+                    except (TypeError, ValueError):
+                        continue
+
+    def _learn_limit(self, field, limit, now):
+        if limit <= 0:
+            return
+        if field == "rpm":
+            if self.requests is None:
+                self.requests = TokenBucket(limit)
+            elif limit < self.requests.per_minute:
+                self.requests.set_limit(limit, now)
+        else:
+            if self.tokens is None:
+                self.tokens = TokenBucket(limit)
+            elif limit < self.tokens.per_minute:
+                self.tokens.set_limit(limit, now)
+
+    def metrics(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            metrics = {
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "rejected": self.rejected,
+                "paused_for": max(0.0, self.paused_until - time.monotonic()),
+                "limits": {
+                    "rpm": self.requests.per_minute if self.requests else None,
+                    "tpm": self.tokens.per_minute if self.tokens else None,
+                    "max_in_flight": self.max_in_flight or None,
+                },
+            }
+        metrics["queue_wait"] = {
+            "count": len(waits),
+            "p50": waits[len(waits) // 2] if waits else 0.0,
+            "p99": waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0,
+            "max": waits[-1] if waits else 0.0,
+        }
+        return metrics
+
+class RateGovernor:
+    """The governors of every (provider, model), created on first use from the limits file."""
+    def __init__(self, limits_file=LLM_LIMITS_FILE):
+        self.limits = {}
+        self._governors = {}
+        self._lock = threading.Lock()
+        if limits_file and os.path.exists(limits_file):
+            self.load(limits_file)
+
+    def load(self, limits_file):
+        try:
+            with open(limits_file) as f:
+                limits = json.load(f)
+        except Exception as e:
+            debug_print(MAGENTA, f"Error loading LLM limits file {limits_file}: {e}")
+            return
+        self.limits = {key: {field: value for field, value in entry.items() if field in LIMIT_FIELDS}
+                       for key, entry in limits.items() if isinstance(entry, dict)}
+        debug_print(GREEN, f"Loaded LLM rate limits for {', '.join(self.limits) or 'no providers'} from {limits_file}.")
+
+    def get(self, provider_name, model_name=None):
+        """Returns the governor shared by all requests to one provider and model"""
+        key = (provider_name, model_name)
+        with self._lock:
+            governor = self._governors.get(key)
+            if governor is None:
+                limits = dict(self.limits.get(provider_name, {}))
+                limits.update(self.limits.get(f"{provider_name}/{model_name}", {}))
+                per_day_headers = PER_DAY_REQUEST_HEADERS.get(provider_name.split(":")[0], ())
+                governor = self._governors[key] = Governor(f"{provider_name}/{model_name or '*'}", limits, per_day_headers)
+            return governor
+
+    def observe(self, provider_name, model_name, response_stream):
+        """Learns limits from the headers of a provider SDK stream's HTTP response"""
+        headers = getattr(getattr(response_stream, "response", None), "headers", None)
+        if headers:
+            self.get(provider_name, model_name).learn(headers)
+
+    def metrics(self):
+        with self._lock:
+            governors = dict(self._governors)
+        return {governor.label: governor.metrics() for governor in governors.values()}
+
+# Governors shared by all provider requests
+rate_governor = RateGovernor()
@@ -0,0 +1,136 @@
+"""
+Exact-match cache of complete LLM responses.
+
+Disabled unless RESPONSE_CACHE is set. Requests are keyed on a hash of the
+normalized (provider, model, system message, history, prompt, tools) tuple;
+a hit is replayed as a chunked stream so callers see the same generator
+interface as a live generation. Requests offering tools are only cached when
+every tool declares a cache_ttl, and their entries are only served for the
+shortest of those TTLs, so tools with side effects or live data always run.
+Entries live in the response_cache table and are evicted by TTL and least
+recent use.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from db import get_cached_response, store_cached_response
+from stream_retry import ERROR_PREFIX
+from utils import GREEN, MAGENTA, debug_print
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+# Characters per chunk when a cached response is replayed
+REPLAY_CHUNK_SIZE = 64
+
+class ResponseCache:
+    def __init__(self, enabled=RESPONSE_CACHE_ENABLED, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+
+    def make_key(self, provider_name, model_name, system_message, history, prompt, selected_tools):
+        """
+        Returns a stable hash of the request, or None when it cannot be cached.
+
+        History entries are reduced to their role and content so ids and
+        timestamps do not change the key, and tools are sorted.
+        """
+        if not self.enabled:
+            return None
+        normalized = {
+            "provider": provider_name,
+            "model": model_name,
+            "system_message": system_message or "",
+            "history": [[message.get("role"), message.get("content")] for message in history or []],
+            "prompt": prompt or "",
+            "tools": sorted(selected_tools or []),
+        }
+        encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key, max_age=None):
+        """Returns the cached response text for `key`, or None on a miss or when it is older than `max_age` seconds."""
+        now = time.time()
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        try:
+            response = get_cached_response(key, now - ttl, now)
+        except Exception as e:
+            debug_print(MAGENTA, f"Error reading response cache: {e}")
+            response = None
+        with self._lock:
+            if response is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return response
+
+    def put(self, key, response):
+        """Stores a complete response unless it is empty."""
+        if not response:
+            return
+        now = time.time()
+        try:
+            evicted = store_cached_response(key, response, now, now - self.ttl, self.max_entries)
+        except Exception as e:
+            debug_print(MAGENTA, f"Error writing response cache: {e}")
+            return
+        with self._lock:
+            self._stores += 1
+            self._evictions += evicted
+        debug_print(GREEN, f"Cached response {key[:12]} ({len(response)} chars).")
+
+    def replay(self, response):
+        """Yields a cached response in chunks, like a provider stream."""
+        for start in range(0, len(response), REPLAY_CHUNK_SIZE):
+            yield response[start:start + REPLAY_CHUNK_SIZE]
+
+    def record(self, key, chunks, stream_handle=None):
+        """
+        Passes a provider stream through, storing the full text once it
+        completes. Cancelled streams and those that yielded a provider
+        error are not stored.
+        """
+        parts = []
+        failed = False
+        for chunk in chunks:
+            parts.append(chunk)
+            failed = failed or chunk.startswith(ERROR_PREFIX)
+            yield chunk
+        if not failed and not (stream_handle and stream_handle.cancelled):
+            self.put(key, "".join(parts))
+
+    async def record_async(self, key, chunks, stream_handle=None):
+        """Async counterpart of record for the ASGI server."""
+        parts = []
+        failed = False
+        async for chunk in chunks:
+            parts.append(chunk)
+            failed = failed or chunk.startswith(ERROR_PREFIX)
+            yield chunk
+        if not failed and not (stream_handle and stream_handle.cancelled):
+            await asyncio.to_thread(self.put, key, "".join(parts))
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "stores": self._stores,
+                "evictions": self._evictions,
+            }
+
+# Cache shared by every generation path
+response_cache = ResponseCache()
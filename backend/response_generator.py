@@ -1,11 +1,16 @@
 from utils import BLUE, GREEN, MAGENTA, debug_print
 from providers import llm_providers
-from tool_manager import load_tools, generate_tool_descriptions, parse_tool_calls, execute_tools
+from provider_router import provider_router
+from tool_manager import load_tools, generate_tool_descriptions, execute_tools, execute_streamed_tool_calls, response_cache_ttl, route_candidates
+from tool_router import ROUTE_CALL, ROUTE_NONE, tool_router
+import asyncio
 import json
 import os
 from db import save_simple_response
+from response_cache import response_cache
+from context_window import extend_system_message
 
-def generate_response(prompt, model_name, image=None, history=None, provider_name=None, system_message=None, selected_tools=None, base_url=None):
+def generate_response(prompt, model_name, image=None, history=None, provider_name=None, system_message=None, selected_tools=None, base_url=None, stream_handle=None):
     """
     Generate a response using the specified LLM provider and model, with optional tool integration.
 
@@ -18,6 +23,7 @@ def generate_response(prompt, model_name, image=None, history=None, provider_nam
         system_message (Optional): Optional system message for context.
         selected_tools (list): List of tools to use.
         base_url (Optional): Base URL for API requests.
+        stream_handle (Optional): StreamHandle used to cancel the generation.
 
     Returns:
         str: The response generated by the LLM or error message.
@@ -37,18 +43,107 @@ def generate_response(prompt, model_name, image=None, history=None, provider_nam
     if selected_tools:
         tool_instances = load_tools(selected_tools)
 
-    tool_descriptions = generate_tool_descriptions(tool_instances)
+    # Tools that may have side effects or return live data must run on every request
+    max_age = 0 if image else response_cache_ttl(tool_instances)
+    cache_key = response_cache.make_key(provider_name, model_name, system_message, history, prompt, selected_tools) if max_age > 0 else None
+    if cache_key:
+        cached = response_cache.get(cache_key, max_age)
+        if cached is not None:
+            debug_print(GREEN, "Replaying cached response.")
+            return response_cache.replay(cached)
 
     if tool_instances:
-        tool_response, prompt = process_tools_with_llm(
-            provider, model_name, prompt, tool_descriptions, system_message, tool_instances
-        )
+        prompt = process_tools(provider, model_name, prompt, system_message, tool_instances, stream_handle)
 
-    response = provider.generate_response(prompt=prompt, model_name=model_name, image=image, history=history, system_message=system_message)
+    # Goes to the failover chain when a route in the LLM routing file matches
+    response = provider_router.generate_response(provider_name, prompt=prompt, model_name=model_name, image=image, history=history, system_message=system_message, stream_handle=stream_handle)
+    if cache_key:
+        response = response_cache.record(cache_key, response, stream_handle)
     debug_print(GREEN, "Response generated successfully.")
     return response
 
-def process_tools_with_llm(provider, model_name, prompt, tool_descriptions, system_message, tool_instances):
+async def generate_response_async(prompt, model_name, image=None, history=None, provider_name=None, system_message=None, selected_tools=None, base_url=None, stream_handle=None):
+    """
+    Async counterpart of generate_response used by the ASGI server.
+
+    Tool selection and execution run on a worker thread; the final generation
+    streams through the provider's generate_response_async when it has one,
+    or through the failover chain of a matching LLM route.
+
+    Yields:
+        str: Chunks of the response generated by the LLM or an error message.
+    """
+    debug_print(BLUE, f"Generating async response with provider: {provider_name}, model: {model_name}, tools: {selected_tools}")
+
+    provider = llm_providers.get(provider_name)
+    if not provider:
+        debug_print(MAGENTA, "Error: LLM provider not found")
+        yield "Error: LLM provider not found"
+        return
+
+    if not model_name:
+        debug_print(MAGENTA, "Error: No model selected for the provider.")
+        yield "Error: No model selected for the provider."
+        return
+
+    tool_instances = []
+    if selected_tools:
+        tool_instances = await asyncio.to_thread(load_tools, selected_tools)
+
+    # Tools that may have side effects or return live data must run on every request
+    max_age = 0 if image else response_cache_ttl(tool_instances)
+    cache_key = response_cache.make_key(provider_name, model_name, system_message, history, prompt, selected_tools) if max_age > 0 else None
+    if cache_key:
+        cached = await asyncio.to_thread(response_cache.get, cache_key, max_age)
+        if cached is not None:
+            debug_print(GREEN, "Replaying cached response.")
+            for chunk in response_cache.replay(cached):
+                yield chunk
+            return
+
+    if tool_instances:
+        prompt = await asyncio.to_thread(
+            process_tools, provider, model_name, prompt, system_message, tool_instances, stream_handle
+        )
+
+    response = provider_router.generate_response_async(provider_name, prompt=prompt, model_name=model_name, image=image, history=history, system_message=system_message, stream_handle=stream_handle)
+    if cache_key:
+        response = response_cache.record_async(cache_key, response, stream_handle)
+    async for chunk in response:
+        yield chunk
+    debug_print(GREEN, "Async response generated successfully.")
+
+def process_tools(provider, model_name, prompt, system_message, tool_instances, stream_handle=None):
+    """
+    Run the tools a prompt needs, asking the local tool router before the selection LLM call.
+
+    Args:
+        provider: The LLM provider instance.
+        model_name (str): The model to use.
+        prompt (str): The input prompt for the LLM.
+        system_message (str): Optional system message.
+        tool_instances (list): List of tool instances.
+        stream_handle (Optional): StreamHandle used to cancel the generation.
+
+    Returns:
+        str: The prompt for the final response, including any tool results.
+    """
+    decision = tool_router.route(prompt, route_candidates(tool_instances))
+    if decision.action == ROUTE_NONE:
+        return prompt
+    if decision.action == ROUTE_CALL:
+        return tool_results_prompt(execute_tools(decision.calls, tool_instances), prompt)
+    if decision.ranked:
+        # Tools whose routes matched part of the prompt are listed first
+        tool_instances = sorted(tool_instances, key=lambda tool: tool['name'] not in decision.ranked)
+
+    tool_descriptions = generate_tool_descriptions(tool_instances)
+    tool_response, prompt = process_tools_with_llm(
+        provider, model_name, prompt, tool_descriptions, system_message, tool_instances, stream_handle
+    )
+    return prompt
+
+def process_tools_with_llm(provider, model_name, prompt, tool_descriptions, system_message, tool_instances, stream_handle=None):
     """
     Use the LLM to generate tool calls and process their results.
 
@@ -59,11 +154,14 @@ def process_tools_with_llm(provider, model_name, prompt, tool_descriptions, syst
         tool_descriptions (str): Descriptions of the available tools.
         system_message (str): Optional system message.
         tool_instances (list): List of tool instances.
+        stream_handle (Optional): StreamHandle used to cancel the generation.
 
     Returns:
         tuple: Updated tool response and prompt.
     """
-    tool_prompt = f"""
+    # The tool instructions go in the system message, so the prompt is the only
+    # part that changes between calls and providers can cache the rest
+    tool_system_message = f"""
         You have access to the following tools. Use one or more as needed:
         {tool_descriptions}
 
@@ -80,31 +178,27 @@ def process_tools_with_llm(provider, model_name, prompt, tool_descriptions, syst
                 "parameters": {{ "param2": "value2" }}
             }}
         ]
-
-        Now, respond to the following prompt:
-        {prompt}
     """
-    tool_response_generator = provider.generate_response(tool_prompt, model_name, None, None, system_message)
-    tool_response = "".join(tool_response_generator)
+    if system_message:
+        # Conversation context stays after the tools, outside the cacheable prefix
+        tool_system_message = extend_system_message(system_message, tool_system_message)
+    tool_response_generator = provider.generate_response(prompt, model_name, None, None, tool_system_message, stream_handle=stream_handle)
+    # Each tool starts as soon as its call has streamed in, while the model is still writing the rest
+    tool_response, tool_results = execute_streamed_tool_calls(tool_response_generator, tool_instances)
     debug_print(MAGENTA,tool_response)
 
-    try:
-        tool_calls = parse_tool_calls(tool_response)
-        tool_results = execute_tools(tool_calls, tool_instances)
-
-        tool_results_str = json.dumps(tool_results, indent=4)
-        prompt = f"""
-            The following tools were called:
-            {tool_results_str}
+    return tool_response, tool_results_prompt(tool_results, prompt)
 
-            Now, respond to the following prompt:
-            {prompt}
-        """
-    except json.JSONDecodeError:
-        debug_print(MAGENTA, "Error decoding tool response.")
-        prompt = f"Error decoding tool response. Now, respond to the following prompt: {prompt}"
+def tool_results_prompt(tool_results, prompt):
+    """Builds the prompt for the final response from the tool results and the original prompt"""
+    tool_results_str = json.dumps(tool_results, indent=4)
+    return f"""
+        The following tools were called:
+        {tool_results_str}
 
-    return tool_response, prompt
+        Now, respond to the following prompt:
+        {prompt}
+    """
 
 def generate_simple_response(prompt):
     """
@@ -130,7 +224,7 @@ def generate_simple_response(prompt):
         prompt=prompt,
         model_name=model_name,
         provider_name=provider_name,
-        selected_modes=tools,
+        selected_tools=tools,
         history=None,
         system_message=None
     ):
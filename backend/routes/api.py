@@ -1,26 +1,56 @@
 from flask import Blueprint, request, jsonify, Response
 from llm import generate_response, generate_think_response, generate_simple_response, llm_providers, selected_model, selected_provider
-from db import get_conversation, save_conversation, add_message_to_conversation, list_conversations, list_system_messages, get_system_message, save_system_message, delete_system_message, delete_all_system_messages, delete_conversation, delete_all_conversations, list_simple_responses, delete_simple_response, delete_all_simple_responses
-from utils import debug_print, streaming, stop_stream_global
+from db import update_message, get_conversation_id_from_message, get_conversation, save_conversation, list_conversations, list_system_messages, get_system_message, save_system_message, delete_system_message, delete_all_system_messages, delete_conversation, delete_all_conversations, list_simple_responses, delete_simple_response, delete_all_simple_responses, search_conversations
+from utils import debug_print
 from tools import list_tools, list_all_modes
+from message_writer import message_writer
+from model_catalog import model_catalog
+from response_cache import response_cache
+from stream_registry import stream_registry
+from tool_cache import tool_cache
+from tool_router import tool_router
+from scheduler import scheduler
+from stream_retry import retry_metrics
+from provider_router import provider_router
+from rate_governor import rate_governor
+from context_window import context_window
+from claude_api import prompt_cache_stats
 import json
+import os
 from PIL import Image
 import io
 
 api_bp = Blueprint('api', __name__)
 
-@api_bp.route('/models', methods=['GET'])
-def list_models():
-   debug_print(True, "Received request for /api/models")
-   provider_name = request.args.get('provider', selected_provider)
-   models = llm_providers.get(provider_name).list_models() if llm_providers.get(provider_name) else []
-   return jsonify(models)
-
-@api_bp.route('/generate', methods=['POST'])
-def generate():
-    debug_print(True, "Received request for /api/generate")
-    global selected_provider, selected_model
-    data = request.form
+# Page sizes for the keyset-paginated conversation endpoints. The conversation
+# list is paged by default; a conversation's messages only with a `limit`
+DEFAULT_CONVERSATIONS_PAGE = 100
+MAX_PAGE_SIZE = 1000
+# Number of most recent messages loaded as history for /generate
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "100"))
+
+def get_page_args(default_limit=None):
+    """Reads the `limit` and `before` pagination arguments from the query string."""
+    limit = request.args.get('limit', default_limit, type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    before = request.args.get('before', None, type=int)
+    return limit, before
+
+class RequestError(Exception):
+    """Raised by the prepare_* helpers with the JSON body and status to return."""
+    def __init__(self, body, status=400):
+        super().__init__(body)
+        self.body = body
+        self.status = status
+
+def prepare_generate(data, image_bytes=None):
+    """
+    Validates a /generate form, sets up its conversation and queues the user turn.
+
+    Shared by the Flask route and the ASGI server. Returns the conversation id
+    and the keyword arguments for generate_response.
+    """
     prompt = data.get('prompt')
     model_name = data.get('model')
     provider_name = data.get('provider')
@@ -28,7 +58,6 @@ def generate():
         model_name = selected_model
     if not provider_name:
         provider_name = selected_provider
-    image_file = request.files.get('image')
     history_str = data.get('history')
     system_message = data.get('system_message')
     conversation_id = data.get('conversation_id')
@@ -45,16 +74,16 @@ def generate():
     else:
         selected_modes = []
 
-    debug_print(True, f"Request: prompt='{prompt}', model='{model_name}', provider='{provider_name}', image={'present' if image_file else 'not present'}, history='{history_str}', system_message='{system_message}', conversation_id='{conversation_id}', selected_modes='{selected_modes}'")
+    debug_print(True, f"Request: prompt='{prompt}', model='{model_name}', provider='{provider_name}', image={'present' if image_bytes else 'not present'}, history='{history_str}', system_message='{system_message}', conversation_id='{conversation_id}', selected_modes='{selected_modes}'")
 
     image = None
-    if image_file:
+    if image_bytes:
         try:
-            image = Image.open(io.BytesIO(image_file.read()))
+            image = Image.open(io.BytesIO(image_bytes))
             debug_print(True, "Image loaded successfully.")
         except Exception as e:
             debug_print(True, f"Error loading image: {e}")
-            return jsonify({"response": f"Error al cargar la imagen: {e}"}), 400
+            raise RequestError({"response": f"Error al cargar la imagen: {e}"})
 
     history = None
     if history_str:
@@ -63,20 +92,21 @@ def generate():
             debug_print(True, "Chat history loaded successfully.")
         except json.JSONDecodeError:
             debug_print(True, "Error decoding chat history")
-            return jsonify({"response": "Error decoding chat history"}), 400
+            raise RequestError({"response": "Error decoding chat history"})
 
     if not prompt:
         debug_print(True, "Error: Prompt is required")
-        return jsonify({"response": "Prompt is required"}), 400
+        raise RequestError({"response": "Prompt is required"})
 
     if conversation_id:
         conversation_id = int(conversation_id)
-        conversation, messages = get_conversation(conversation_id)
+        message_writer.flush()
+        conversation, messages = get_conversation(conversation_id, limit=HISTORY_LIMIT)
         if conversation:
-            system_message = conversation['system_message']
-            history = []
-            for message in messages:
-                history.append({"role": message['role'], "content": message['content']})
+            # Recent and relevant turns that fit the token budget, with older ones summarized
+            history, system_message = context_window.build(
+                conversation_id, messages, conversation['system_message'], prompt, provider_name, model_name
+            )
             debug_print(True, f"Retrieved conversation {conversation_id} from database.")
         else:
             debug_print(True, f"Conversation {conversation_id} not found.")
@@ -88,20 +118,134 @@ def generate():
         conversation_id = save_conversation(provider_name, model_name, system_message, conversation_title)
         debug_print(True, f"Created new conversation with id {conversation_id}")
 
-    add_message_to_conversation(conversation_id, "user", prompt)
+    message_writer.add_message(conversation_id, "user", prompt)
+
+    return conversation_id, {
+        "prompt": prompt,
+        "model_name": model_name,
+        "image": image,
+        "history": history,
+        "provider_name": provider_name,
+        "system_message": system_message,
+        "selected_tools": selected_modes,
+        "base_url": base_url,
+    }
+
+def prepare_think(data):
+    """Validates a /think form. Returns the keyword arguments for generate_think_response."""
+    prompt = data.get('prompt')
+    model_name = data.get('model')
+    provider_name = data.get('provider')
+    if not model_name:
+        model_name = selected_model
+    if not provider_name:
+        provider_name = selected_provider
+    depth = int(data.get('think_depth', 0))
+
+    debug_print(True, f"Request: prompt='{prompt}', model='{model_name}', provider='{provider_name}', depth='{depth}'")
+
+    if not prompt:
+        debug_print(True, "Error: Prompt is required")
+        raise RequestError({"response": "Prompt is required"})
+
+    return {"prompt": prompt, "depth": depth, "model_name": model_name, "provider_name": provider_name}
+
+def prepare_edit(data):
+    """Applies an /edit_message request. Returns the keyword arguments for generate_response."""
+    message_id = data.get('message_id')
+    edited_content = data.get('edited_content')
+
+    if not message_id or not edited_content:
+        debug_print(True, "Error: Message ID and edited content are required")
+        raise RequestError({"message": "Message ID and edited content are required"})
+
+    # Update the message in the database
+    message_writer.flush()
+    success = update_message(message_id, edited_content)
+
+    if not success:
+        debug_print(True, f"Error: Message {message_id} not found")
+        raise RequestError({"message": f"Message {message_id} not found"}, 404)
+
+    # Get the conversation ID
+    conversation_id = get_conversation_id_from_message(message_id)
+
+    # Get the conversation history
+    context_window.message_edited(conversation_id, int(message_id))
+    conversation, messages = get_conversation(conversation_id, limit=HISTORY_LIMIT)
+    history, system_message = context_window.build(
+        conversation_id, messages, conversation['system_message'], edited_content, conversation['provider'], conversation['model']
+    )
+
+    return {
+        "prompt": edited_content,
+        "model_name": conversation['model'],
+        "image": None,
+        "history": history,
+        "provider_name": conversation['provider'],
+        "system_message": system_message,
+        "selected_tools": [],
+    }
+
+def sse_frame(data):
+    return f" {json.dumps(data)}\n\n"
+
+def stream_chunks(generate_chunks, model_message=None, stream_id=None):
+    """
+    Streams response chunks as SSE frames under a new cancellable stream.
+
+    The first frame carries the stream id used by /api/stop/<stream_id>; it is
+    also sent in the X-Stream-Id header. The id is the client's `stream_id`
+    when it sent a usable one. `generate_chunks` receives the
+    StreamHandle and is only called once the response starts streaming.
+    Chunks are appended to `model_message` when one is given.
+    """
+    stream_handle = stream_registry.open(stream_id)
 
     def stream_response():
-        global streaming
-        full_response = ""
-        for chunk in generate_response(prompt, model_name, image, history, provider_name, system_message, selected_modes, base_url):
-            if not streaming:
-                debug_print(True, "Streaming stopped.")
-                break
-            full_response += chunk
-            yield f" {json.dumps({'response': chunk})}\n\n"
-        add_message_to_conversation(conversation_id, "model", full_response)
-
-    return Response(stream_response(), mimetype='text/event-stream')
+        try:
+            yield sse_frame({'stream_id': stream_handle.id})
+            for chunk in generate_chunks(stream_handle):
+                if stream_handle.cancelled:
+                    debug_print(True, f"Stream {stream_handle.id} stopped.")
+                    break
+                if model_message:
+                    model_message.append(chunk)
+                yield sse_frame({'response': chunk})
+        finally:
+            if model_message:
+                model_message.finish()
+            # Also cancels the upstream request when the client disconnected
+            stream_registry.close(stream_handle)
+
+    response = Response(stream_response(), mimetype='text/event-stream')
+    response.headers['X-Stream-Id'] = stream_handle.id
+    return response
+
+@api_bp.route('/models', methods=['GET'])
+def list_models():
+   debug_print(True, "Received request for /api/models")
+   provider_name = request.args.get('provider', selected_provider)
+   provider = llm_providers.get(provider_name)
+   response = jsonify(provider.list_models() if provider else [])
+   # Age of the cached model list in seconds; absent until the first fetch completes
+   age = model_catalog.age(provider.catalog_key) if provider else None
+   if age is not None:
+      response.headers['X-Models-Age'] = f"{age:.0f}"
+   return response
+
+@api_bp.route('/generate', methods=['POST'])
+def generate():
+    debug_print(True, "Received request for /api/generate")
+    image_file = request.files.get('image')
+    try:
+        conversation_id, generation = prepare_generate(request.form, image_file.read() if image_file else None)
+    except RequestError as e:
+        return jsonify(e.body), e.status
+
+    # Checkpointed while streaming and finished even if the client disconnects
+    model_message = message_writer.start_message(conversation_id, "model")
+    return stream_chunks(lambda stream_handle: generate_response(**generation, stream_handle=stream_handle), model_message, request.form.get('stream_id'))
 
 @api_bp.route('/generate_simple', methods=['POST'])
 def generate_simple():
@@ -136,44 +280,67 @@ def delete_all_simple_responses_route():
     debug_print(True, "Response: All simple responses deleted")
     return jsonify({"message": "All simple responses deleted"})
 
+@api_bp.route('/tasks', methods=['GET'])
+def list_tasks_route():
+    debug_print(True, "Received request for /api/tasks")
+    return jsonify(scheduler.list_tasks())
 
-@api_bp.route('/think', methods=['POST'])
-def think_route():
-    debug_print(True, "Received request for /api/think")
-    global selected_provider, selected_model
-    data = request.form
+@api_bp.route('/tasks', methods=['POST'])
+def add_task_route():
+    debug_print(True, "Received request to POST /api/tasks")
+    data = request.get_json() or {}
     prompt = data.get('prompt')
-    model_name = data.get('model')
-    provider_name = data.get('provider')
-    if not model_name:
-        model_name = selected_model
-    if not provider_name:
-        provider_name = selected_provider
-    depth = int(data.get('think_depth', 0))
-
-    debug_print(True, f"Request: prompt='{prompt}', model='{model_name}', provider='{provider_name}', depth='{depth}'")
-
-    if not prompt:
-        debug_print(True, "Error: Prompt is required")
-        return jsonify({"response": "Prompt is required"}), 400
+    schedule = data.get('schedule')
+    if not prompt or not schedule:
+        return jsonify({"error": "prompt and schedule are required"}), 400
+    options = {key: data[key] for key in ('jitter', 'catch_up') if key in data}
+    try:
+        task = scheduler.add_task(prompt, schedule, **options)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    debug_print(True, f"Response: Task {task['id']} scheduled")
+    return jsonify(task), 201
+
+@api_bp.route('/tasks/<int:task_id>', methods=['DELETE'])
+def delete_task_route(task_id):
+    debug_print(True, f"Received request to DELETE /api/tasks/{task_id}")
+    if not scheduler.remove_task(task_id):
+        return jsonify({"error": "Task not found"}), 404
+    debug_print(True, f"Response: Task {task_id} deleted")
+    return jsonify({"message": f"Task {task_id} deleted"})
 
-    def stream_response():
-        global streaming
-        full_response = ""
-        for chunk in generate_think_response(prompt,  depth, model_name, provider_name):
-            if not streaming:
-                debug_print(True, "Streaming stopped.")
-                break
-            full_response += chunk
-            yield f" {json.dumps({'response': chunk})}\n\n"
 
-    return Response(stream_response(), mimetype='text/event-stream')
+@api_bp.route('/think', methods=['POST'])
+def think_route():
+    debug_print(True, "Received request for /api/think")
+    try:
+        think_args = prepare_think(request.form)
+    except RequestError as e:
+        return jsonify(e.body), e.status
+    return stream_chunks(lambda stream_handle: generate_think_response(**think_args, stream_handle=stream_handle), stream_id=request.form.get('stream_id'))
 
 @api_bp.route('/conversations', methods=['GET'])
 def list_conversations_route():
     debug_print(True, "Received request for /api/conversations")
-    conversations = list_conversations()
-    return jsonify(conversations)
+    limit, before = get_page_args(DEFAULT_CONVERSATIONS_PAGE)
+    conversations = list_conversations(limit=limit, before=before)
+    response = jsonify(conversations)
+    if len(conversations) == limit:
+        response.headers['X-Next-Before'] = str(conversations[-1]['id'])
+    return response
+
+@api_bp.route('/search', methods=['GET'])
+def search_route():
+    debug_print(True, "Received request for /api/search")
+    query = request.args.get('q', '').strip()
+    if not query:
+        debug_print(True, "Error: Query is required")
+        return jsonify({"message": "Query is required"}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    results = search_conversations(query, limit=limit, offset=offset)
+    next_offset = offset + limit if len(results) == limit else None
+    return jsonify({"results": results, "next_offset": next_offset})
 
 @api_bp.route('/system_messages', methods=['GET'])
 def list_system_messages_route():
@@ -233,9 +400,12 @@ def save_system_message_route():
 @api_bp.route('/conversations/<int:conversation_id>', methods=['GET'])
 def get_conversation_route(conversation_id):
     debug_print(True, f"Received request for /api/conversations/{conversation_id}")
-    conversation, messages = get_conversation(conversation_id)
+    limit, before = get_page_args()
+    message_writer.flush()
+    conversation, messages = get_conversation(conversation_id, limit=limit, before=before)
     if conversation:
-        return jsonify({"conversation": conversation, "messages": messages})
+        next_before = messages[0]['id'] if limit is not None and len(messages) == limit else None
+        return jsonify({"conversation": conversation, "messages": messages, "next_before": next_before})
     debug_print(True, f"Response: Conversation {conversation_id} not found")
     return jsonify({"message": "Conversation not found"}), 404
 
@@ -253,49 +423,42 @@ def delete_all_conversations_route():
     debug_print(True, "Response: All conversations deleted")
     return jsonify({"message": "All conversations deleted"})
 
+@api_bp.route('/metrics', methods=['GET'])
+def metrics_route():
+    debug_print(True, "Received request for /api/metrics")
+    return jsonify({
+        "message_writer": message_writer.metrics(),
+        "active_streams": stream_registry.active_count(),
+        "response_cache": response_cache.metrics(),
+        "tool_cache": tool_cache.metrics(),
+        "tool_router": tool_router.metrics(),
+        "llm_retries": retry_metrics(),
+        "llm_routes": provider_router.metrics(),
+        "llm_rate_limits": rate_governor.metrics(),
+        "context_window": context_window.metrics(),
+        "claude_prompt_cache": prompt_cache_stats.metrics(),
+    })
+
+@api_bp.route('/stop/<stream_id>', methods=['POST'])
+def stop_stream_route(stream_id):
+    debug_print(True, f"Received request to /api/stop/{stream_id}")
+    if not stream_registry.cancel(stream_id):
+        debug_print(True, f"Response: Stream {stream_id} not found")
+        return jsonify({"message": "Stream not found"}), 404
+    return jsonify({"message": f"Stream {stream_id} stopped"})
+
 @api_bp.route('/stop', methods=['POST'])
-def stop_stream_route():
-    global streaming
-    stop_stream_global()
-    debug_print(True, "Received request to /api/stop")
-    return jsonify({"message": "Streaming stopped"})
+def stop_without_stream_id_route():
+    # Stopping every stream would cancel other clients' generations too
+    debug_print(True, "Received request to /api/stop without a stream id")
+    return jsonify({"error": "Pass the stream id: POST /api/stop/<stream_id>"}), 400
 
 @api_bp.route('/edit_message', methods=['POST'])
 def edit_message_route():
     debug_print(True, "Received request to POST /api/edit_message")
-    data = request.get_json()
-    message_id = data.get('message_id')
-    edited_content = data.get('edited_content')
-
-    if not message_id or not edited_content:
-        debug_print(True, "Error: Message ID and edited content are required")
-        return jsonify({"message": "Message ID and edited content are required"}), 400
-
-    # Update the message in the database
-    success = update_message(message_id, edited_content)
-
-    if not success:
-        debug_print(True, f"Error: Message {message_id} not found")
-        return jsonify({"message": f"Message {message_id} not found"}), 404
-
-    # Get the conversation ID
-    conversation_id = get_conversation_id_from_message(message_id)
-
-    # Get the conversation history
-    conversation, messages = get_conversation(conversation_id)
-    history = []
-    for message in messages:
-        history.append({"role": message['role'], "content": message['content']})
-
-    # Generate the response
-    def stream_response():
-        global streaming
-        full_response = ""
-        for chunk in generate_response(edited_content, conversation['model'], None, history, conversation['provider'], conversation['system_message'], []):
-            if not streaming:
-                debug_print(True, "Streaming stopped.")
-                break
-            full_response += chunk
-            yield f" {json.dumps({'response': chunk})}\n\n"
-
-    return Response(stream_response(), mimetype='text/event-stream')
+    try:
+        data = request.get_json()
+        generation = prepare_edit(data)
+    except RequestError as e:
+        return jsonify(e.body), e.status
+    return stream_chunks(lambda stream_handle: generate_response(**generation, stream_handle=stream_handle), stream_id=data.get('stream_id'))
@@ -0,0 +1,338 @@
+"""
+In-process scheduler for recurring prompts.
+
+Tasks are stored in the scheduled_tasks table with a cron expression and run
+through generate_simple_response on a small thread pool, replacing the
+crontab lines that curl'ed /api/generate_simple. task_tool and
+remove_task_tool manage them through the `scheduler` singleton below, and
+/api/tasks exposes the same operations over HTTP.
+
+Each task has:
+  - jitter: up to that many seconds of random delay after each cron time, so
+    tasks sharing a schedule do not all hit the provider at once. The delay
+    is derived from the task id and cron time, so it is the same in every
+    process.
+  - catch_up: what to do with runs missed while the server was down or busy
+    by more than SCHEDULER_MISFIRE_GRACE seconds:
+        skip - drop them and wait for the next cron time
+        once - run once now (default)
+        all  - run every missed time, up to SCHEDULER_MAX_CATCH_UP
+At most SCHEDULER_MAX_CONCURRENT tasks run at once and a task is never run
+while its previous run is still going. Runs are claimed with a conditional
+UPDATE, so several server processes sharing the database run each one once.
+A task whose stored schedule no longer parses is disabled rather than retried
+on every poll.
+
+On start, the crontab lines the old task_tool installed are moved into
+scheduled_tasks and removed from the crontab, unless SCHEDULER_IMPORT_CRONTAB
+is 0.
+"""
+
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from db import add_scheduled_task, claim_scheduled_run, delete_scheduled_task, disable_scheduled_task, find_scheduled_task, get_scheduled_task, list_scheduled_tasks, record_scheduled_run
+from utils import BLUE, GREEN, MAGENTA, debug_print
+
+SCHEDULER_MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", "2"))
+SCHEDULER_DEFAULT_JITTER = float(os.getenv("SCHEDULER_JITTER", "30"))
+SCHEDULER_DEFAULT_CATCH_UP = os.getenv("SCHEDULER_CATCH_UP", "once")
+# Seconds a run may start after its time before it counts as missed
+SCHEDULER_MISFIRE_GRACE = float(os.getenv("SCHEDULER_MISFIRE_GRACE", "300"))
+SCHEDULER_MAX_CATCH_UP = int(os.getenv("SCHEDULER_MAX_CATCH_UP", "10"))
+# Longest sleep between checks, so tasks added by other processes are noticed
+SCHEDULER_POLL_INTERVAL = 60
+
+# Move the crontab lines installed by the old task_tool into the scheduler on start
+SCHEDULER_IMPORT_CRONTAB = os.getenv("SCHEDULER_IMPORT_CRONTAB", "1") == "1"
+
+CATCH_UP_POLICIES = ("skip", "once", "all")
+
+# A crontab line installed by the old task_tool: a schedule, then a curl of /api/generate_simple
+LEGACY_CRONTAB_LINE = re.compile(
+    r"^\s*(?P<schedule>@\w+|(?:\S+\s+){4}\S+)\s+curl -X POST http://127\.0\.0\.1:5000/api/generate_simple "
+    r"-H \"Content-Type: application/json\" -d '\{ \"prompt\": \"(?P<prompt>.*)\" \}'\s*$"
+)
+
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+MONTH_NAMES = {name: number for number, name in enumerate("jan feb mar apr may jun jul aug sep oct nov dec".split(), 1)}
+DAY_NAMES = {name: number for number, name in enumerate("sun mon tue wed thu fri sat".split())}
+
+class CronSchedule:
+    """A five-field cron expression (minute hour day-of-month month day-of-week) or an @macro."""
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = MACROS.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression {expression!r}: expected 5 fields")
+        self.minutes = self._parse(fields[0], 0, 59)
+        self.hours = self._parse(fields[1], 0, 23)
+        self.days = self._parse(fields[2], 1, 31)
+        self.months = self._parse(fields[3], 1, 12, MONTH_NAMES)
+        # 7 is also Sunday
+        self.weekdays = {day % 7 for day in self._parse(fields[4], 0, 7, DAY_NAMES)}
+        # Like cron, when both day fields are restricted a day matching either one fires
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, low, high, names=None):
+        values = set()
+        for part in field.lower().split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/", 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"Invalid step in cron field {field!r}")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_text, end_text = part.split("-", 1)
+                start, end = CronSchedule._value(start_text, names), CronSchedule._value(end_text, names)
+            else:
+                start = CronSchedule._value(part, names)
+                end = high if step > 1 else start
+            if not low <= start <= end <= high:
+                raise ValueError(f"Value out of range in cron field {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    @staticmethod
+    def _value(text, names):
+        if names and text in names:
+            return names[text]
+        return int(text)
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.isoweekday() % 7) in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, after):
+        """Returns the first matching local time strictly after the `after` datetime"""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
+
+    def next_timestamp(self, after_timestamp):
+        return self.next_after(datetime.fromtimestamp(after_timestamp)).timestamp()
+
+def jitter_offset(task, fire_at):
+    """The task's delay after a cron time, the same for a given task and time in every process"""
+    if task["jitter"] <= 0:
+        return 0.0
+    return random.Random(f"{task['id']}:{fire_at}").uniform(0, task["jitter"])
+
+class Scheduler:
+    def __init__(self, max_concurrent=SCHEDULER_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self._run_task = None
+        self._executor = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def start(self, run_task):
+        """Starts the scheduler thread, running each due task's prompt with `run_task(prompt)`"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._run_task = run_task
+            self._stopped.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="scheduled-task")
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+        debug_print(GREEN, f"Scheduler started ({self.max_concurrent} concurrent tasks).")
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            executor, self._executor = self._executor, None
+        if thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        thread.join(timeout=5)
+        executor.shutdown(wait=False)
+
+    def add_task(self, prompt, schedule, jitter=SCHEDULER_DEFAULT_JITTER, catch_up=SCHEDULER_DEFAULT_CATCH_UP):
+        """
+        Stores a new task and returns it.
+
+        Raises:
+            ValueError: If the schedule or catch-up policy is invalid, or the
+                same prompt is already scheduled at the same times.
+        """
+        cron = CronSchedule(schedule)
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Invalid catch_up {catch_up!r}; expected one of {', '.join(CATCH_UP_POLICIES)}")
+        if find_scheduled_task(prompt, cron.expression):
+            raise ValueError("This task already exists.")
+        task_id = add_scheduled_task(prompt, cron.expression, max(0.0, float(jitter)), catch_up, cron.next_timestamp(time.time()))
+        self._wake.set()
+        debug_print(BLUE, f"Scheduled task {task_id}: {cron.expression} {prompt!r}")
+        return get_scheduled_task(task_id)
+
+    def remove_task(self, task_id):
+        """Deletes a task and returns whether it existed; a run already in progress finishes."""
+        removed = delete_scheduled_task(task_id)
+        if removed:
+            self._wake.set()
+        return removed
+
+    def list_tasks(self):
+        tasks = list_scheduled_tasks()
+        with self._lock:
+            running = set(self._running)
+        for task in tasks:
+            task["running"] = task["id"] in running
+        return tasks
+
+    def import_crontab(self):
+        """
+        Moves the crontab lines the old task_tool installed into scheduled_tasks
+        and removes them from the crontab, so each prompt keeps running once.
+        Lines whose schedule does not parse are left in place. Returns the
+        number of lines moved.
+        """
+        try:
+            crontab = subprocess.run(["crontab", "-l"], capture_output=True, text=True)
+        except OSError:
+            # No crontab on this system, so nothing to import
+            return 0
+        if crontab.returncode != 0:
+            # The user has no crontab
+            return 0
+        kept = []
+        imported = 0
+        for line in crontab.stdout.splitlines():
+            match = LEGACY_CRONTAB_LINE.match(line)
+            if match is None:
+                kept.append(line)
+                continue
+            prompt = match.group("prompt")
+            try:
+                self.add_task(prompt, match.group("schedule"))
+            except ValueError as e:
+                # Already imported by an earlier start or another process
+                if not find_scheduled_task(prompt, match.group("schedule").strip()):
+                    debug_print(MAGENTA, f"Not importing crontab line {line!r}: {e}")
+                    kept.append(line)
+                    continue
+            imported += 1
+        if imported:
+            subprocess.run(["crontab", "-"], input="".join(f"{line}\n" for line in kept), text=True, check=True)
+            debug_print(GREEN, f"Moved {imported} crontab tasks into the scheduler.")
+        return imported
+
+    def _loop(self):
+        if SCHEDULER_IMPORT_CRONTAB:
+            try:
+                self.import_crontab()
+            except Exception as e:
+                debug_print(MAGENTA, f"Error importing crontab tasks: {e}")
+        while not self._stopped.is_set():
+            try:
+                delay = self._run_due(time.time())
+            except Exception as e:
+                debug_print(MAGENTA, f"Scheduler error: {e}")
+                delay = SCHEDULER_POLL_INTERVAL
+            self._wake.wait(min(delay, SCHEDULER_POLL_INTERVAL))
+            self._wake.clear()
+
+    def _run_due(self, now):
+        """Starts every due task and returns the seconds until the next one"""
+        delay = SCHEDULER_POLL_INTERVAL
+        for task in list_scheduled_tasks():
+            if not task["enabled"]:
+                continue
+            run_at = task["next_fire_at"] + jitter_offset(task, task["next_fire_at"])
+            if run_at > now:
+                delay = min(delay, run_at - now)
+                continue
+            try:
+                cron = CronSchedule(task["schedule"])
+                runs, next_fire_at = self._plan(task, cron, run_at, now)
+            except ValueError as e:
+                debug_print(MAGENTA, f"Disabling scheduled task {task['id']}, its schedule is invalid: {e}")
+                disable_scheduled_task(task["id"], f"disabled: invalid schedule: {e}")
+                continue
+            if not claim_scheduled_run(task["id"], task["next_fire_at"], next_fire_at):
+                continue
+            delay = min(delay, max(0.0, next_fire_at - now))
+            if runs:
+                self._submit(task, runs)
+        return delay
+
+    @staticmethod
+    def _plan(task, cron, run_at, now):
+        """Returns how many times a due task runs now and its next cron time, applying its catch-up policy"""
+        if now - run_at <= SCHEDULER_MISFIRE_GRACE:
+            return 1, cron.next_timestamp(task["next_fire_at"])
+        next_fire_at = cron.next_timestamp(now)
+        if task["catch_up"] == "skip":
+            debug_print(MAGENTA, f"Skipping missed runs of scheduled task {task['id']}.")
+            return 0, next_fire_at
+        if task["catch_up"] == "all":
+            missed, fire_at = 0, task["next_fire_at"]
+            while fire_at <= now and missed < SCHEDULER_MAX_CATCH_UP:
+                missed += 1
+                fire_at = cron.next_timestamp(fire_at)
+            return missed, next_fire_at
+        return 1, next_fire_at
+
+    def _submit(self, task, runs):
+        with self._lock:
+            if task["id"] in self._running:
+                debug_print(MAGENTA, f"Scheduled task {task['id']} is still running; skipping this run.")
+                return
+            self._running.add(task["id"])
+            executor = self._executor
+        executor.submit(self._run, task, runs)
+
+    def _run(self, task, runs):
+        try:
+            for _ in range(runs):
+                debug_print(BLUE, f"Running scheduled task {task['id']}: {task['prompt']!r}")
+                try:
+                    self._run_task(task["prompt"])
+                    status = "ok"
+                except Exception as e:
+                    debug_print(MAGENTA, f"Scheduled task {task['id']} failed: {e}")
+                    status = f"error: {e}"
+                record_scheduled_run(task["id"], time.time(), status)
+        finally:
+            with self._lock:
+                self._running.discard(task["id"])
+
+# Scheduler shared by the API routes and the task tools
+scheduler = Scheduler()
@@ -0,0 +1,124 @@
+"""
+Registry of in-flight response streams.
+
+Every streaming endpoint opens a StreamHandle and reports its id to the client
+in the first SSE frame. Cancelling a handle stops only that generation and
+runs the callbacks the provider registered to release its upstream request.
+
+Clients may pick the id themselves and send it with the request, so they can
+stop a stream before its first frame arrives. A stop for an id that has not
+been opened yet is remembered for EARLY_STOP_TTL seconds, and the stream is
+cancelled as soon as it opens.
+"""
+
+import re
+import threading
+import time
+import uuid
+from utils import MAGENTA, debug_print
+
+# Seconds a stop for a stream that has not opened yet is remembered
+EARLY_STOP_TTL = 60
+# Most early stops remembered at once
+MAX_EARLY_STOPS = 1000
+# Stream ids accepted from clients
+STREAM_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+class StreamHandle:
+    """Cancellation state for a single streamed generation."""
+    def __init__(self, stream_id):
+        self.id = stream_id
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait_cancelled(self, timeout):
+        """Waits up to `timeout` seconds and returns whether the stream was cancelled."""
+        return self._cancelled.wait(timeout)
+
+    def on_cancel(self, callback):
+        """Registers a callback run on cancellation, or immediately if already cancelled."""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def cancel(self):
+        """Marks the stream as cancelled and runs its callbacks once."""
+        with self._lock:
+            if self.cancelled:
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        try:
+            callback()
+        except Exception as e:
+            debug_print(MAGENTA, f"Error cancelling stream {self.id}: {e}")
+
+class StreamRegistry:
+    """Thread-safe map of stream id to StreamHandle."""
+    def __init__(self):
+        self._streams = {}
+        self._early_stops = {}
+        self._lock = threading.Lock()
+
+    def open(self, stream_id=None):
+        """
+        Registers a new stream under the client's `stream_id`, or a random id
+        when none is given, it is malformed or it is already in use.
+        """
+        with self._lock:
+            if not stream_id or not STREAM_ID_PATTERN.fullmatch(stream_id) or stream_id in self._streams:
+                stream_id = uuid.uuid4().hex
+            handle = StreamHandle(stream_id)
+            self._streams[stream_id] = handle
+            stopped_early = self._early_stops.pop(stream_id, None) is not None
+        if stopped_early:
+            debug_print(MAGENTA, f"Stream {stream_id} was stopped before it started.")
+            handle.cancel()
+        return handle
+
+    def close(self, handle):
+        """Removes a finished stream, releasing any upstream request still open."""
+        with self._lock:
+            self._streams.pop(handle.id, None)
+        handle.cancel()
+
+    def cancel(self, stream_id):
+        """
+        Cancels one stream. Returns False if no such stream is active; the stop
+        is then remembered in case the stream is about to open.
+        """
+        with self._lock:
+            handle = self._streams.get(stream_id)
+            if handle is None:
+                self._remember_early_stop(stream_id)
+                return False
+        handle.cancel()
+        return True
+
+    def _remember_early_stop(self, stream_id):
+        if not STREAM_ID_PATTERN.fullmatch(stream_id):
+            return
+        now = time.monotonic()
+        for expired in [key for key, stopped_at in self._early_stops.items() if now - stopped_at > EARLY_STOP_TTL]:
+            del self._early_stops[expired]
+        if len(self._early_stops) >= MAX_EARLY_STOPS:
+            self._early_stops.pop(next(iter(self._early_stops)))
+        self._early_stops[stream_id] = now
+
+    def active_count(self):
+        with self._lock:
+            return len(self._streams)
+
+# Process-wide registry used by the API routes
+stream_registry = StreamRegistry()
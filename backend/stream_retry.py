@@ -0,0 +1,264 @@
+"""
+Retries for streamed LLM responses.
+
+Provider generate_response methods are generators, so wrapping them in a
+retry decorator only guards creating the generator object. Failures happen
+while iterating: a 429 before the first token, or a connection reset
+half-way through. stream_with_retry and stream_with_retry_async iterate a
+provider's raw stream themselves:
+
+  - Before the first chunk, a retryable error is retried transparently.
+  - After output has been sent, a provider that supports assistant prefill
+    (`resumable`) is asked to continue from the partial output. Any other
+    provider ends the stream with an error, because the client has already
+    received part of the answer.
+
+The wait before retrying uses full jitter: a uniform delay between 0 and the
+exponential backoff. A Retry-After (or retry-after-ms) header from the
+provider sets the minimum wait. If the provider asks for more than
+LLM_RETRY_MAX_DELAY, the request fails instead. Each provider also has a
+retry budget, so that during an outage retries add at most
+LLM_RETRY_BUDGET_RATIO extra load (plus a small floor) instead of
+multiplying it.
+
+Every attempt first waits for a permit from the rate governor of its
+provider and model, and errors teach the governor the limits the provider
+reported.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from rate_governor import LLM_OUTPUT_TOKEN_ESTIMATE, RateLimitWaitExceeded, estimate_tokens, rate_governor
+from utils import MAGENTA, debug_print
+
+# Retries after the first attempt
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+# Longest wait before a retry; a longer Retry-After fails the request instead
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+# Retries allowed per provider: this fraction of its requests in the window, plus the floor
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_RETRY_BUDGET_MIN = int(os.getenv("LLM_RETRY_BUDGET_MIN", "5"))
+LLM_RETRY_BUDGET_WINDOW = 60
+
+# Prefix of the chunk yielded instead of raising once every attempt has failed
+ERROR_PREFIX = "Error generating response"
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+# Exception class names, across the provider SDKs, of timeouts and dropped connections
+RETRYABLE_ERRORS = (
+    "Timeout", "Connection", "RemoteProtocolError", "ServerDisconnected", "IncompleteRead",
+    "ChunkedEncodingError", "ServiceUnavailable", "ResourceExhausted", "InternalServerError",
+    "DeadlineExceeded", "Overloaded",
+)
+
+class RetryBudget:
+    """Sliding-window count of a provider's requests and retries."""
+    def __init__(self, ratio=LLM_RETRY_BUDGET_RATIO, minimum=LLM_RETRY_BUDGET_MIN, window=LLM_RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+        self._exhausted = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        for times in (self._requests, self._retries):
+            while times and times[0] <= now - self.window:
+                times.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            self._requests.append(now)
+
+    def try_retry(self):
+        """Takes one retry from the budget, returning False when it is spent"""
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            if len(self._retries) >= self.minimum + self.ratio * len(self._requests):
+                self._exhausted += 1
+                return False
+            self._retries.append(now)
+            return True
+
+    def metrics(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            return {"requests": len(self._requests), "retries": len(self._retries), "exhausted": self._exhausted}
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+def retry_budget(key):
+    """Returns the retry budget shared by all requests to one provider"""
+    with _budgets_lock:
+        budget = _budgets.get(key)
+        if budget is None:
+            budget = _budgets[key] = RetryBudget()
+        return budget
+
+def retry_metrics():
+    with _budgets_lock:
+        budgets = dict(_budgets)
+    return {key: budget.metrics() for key, budget in budgets.items()}
+
+def status_code(error):
+    """The HTTP status carried by a provider SDK exception, if any"""
+    candidates = [getattr(error, name, None) for name in ("status_code", "status", "code")]
+    response = getattr(error, "response", None)
+    candidates += [getattr(response, "status_code", None), getattr(response, "status", None)]
+    for value in candidates:
+        if isinstance(value, int) and 100 <= value <= 599:
+            return value
+    return None
+
+def is_retryable(error):
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    names = [cls.__name__ for cls in type(error).__mro__]
+    if any(marker in name for name in names for marker in RETRYABLE_ERRORS):
+        return True
+    return "429" in str(error)
+
+def error_headers(error):
+    """The HTTP response headers carried by a provider SDK exception, if any"""
+    return getattr(getattr(error, "response", None), "headers", None)
+
+def retry_after(error):
+    """Seconds the provider asked to wait in a Retry-After header, or None"""
+    headers = error_headers(error)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return float(value) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(error, attempt, budget_key, sent_output, resumable):
+    """Seconds to wait before retrying a failed stream, or None if it should fail now"""
+    if sent_output and not resumable:
+        return None
+    if attempt >= LLM_RETRY_ATTEMPTS or not is_retryable(error):
+        return None
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+    requested = retry_after(error)
+    if requested is not None:
+        if requested > LLM_RETRY_MAX_DELAY:
+            debug_print(MAGENTA, f"{budget_key} asked to retry after {requested:.0f}s; not retrying.")
+            return None
+        delay = max(delay, requested)
+    if not retry_budget(budget_key).try_retry():
+        debug_print(MAGENTA, f"Retry budget for {budget_key} is exhausted; not retrying.")
+        return None
+    return delay
+
+def stream_with_retry(budget_key, start_stream, stream_handle=None, resumable=False, model_name=None, tokens=0):
+    """
+    Yields a provider's streamed response, retrying failed attempts.
+
+    Args:
+        budget_key (str): Provider whose retry budget is used.
+        start_stream (callable): Called with the output sent so far (None on the
+            first attempt) and returns an iterator of chunks that raises on failure.
+        stream_handle (Optional): StreamHandle; a cancelled stream ends quietly.
+        resumable (bool): Whether the provider continues from the partial output.
+        model_name (Optional[str]): Model whose rate governor admits each attempt.
+        tokens (int): Estimated prompt tokens, reserved against the token rate limit.
+
+    Yields:
+        str: Response chunks, ending with an error message if every attempt failed.
+    """
+    retry_budget(budget_key).record_request()
+    governor = rate_governor.get(budget_key, model_name)
+    sent = []
+    attempt = 0
+    while True:
+        try:
+            permit = governor.acquire(tokens + LLM_OUTPUT_TOKEN_ESTIMATE, stream_handle)
+        except RateLimitWaitExceeded as e:
+            yield f"{ERROR_PREFIX}: {e}"
+            return
+        if permit is None:
+            return
+        output = []
+        try:
+            for chunk in start_stream("".join(sent) if sent else None):
+                sent.append(chunk)
+                output.append(chunk)
+                yield chunk
+            return
+        except Exception as e:
+            error = e
+        finally:
+            permit.release(tokens + estimate_tokens("".join(output)))
+        if stream_handle and stream_handle.cancelled:
+            return
+        governor.learn(error_headers(error), retry_after(error) if status_code(error) == 429 else None)
+        delay = retry_delay(error, attempt, budget_key, bool(sent), resumable)
+        if delay is None:
+            yield f"{ERROR_PREFIX}: {error}"
+            return
+        attempt += 1
+        debug_print(MAGENTA, f"{budget_key} stream failed ({error}); retry {attempt}/{LLM_RETRY_ATTEMPTS} in {delay:.2f}s{' resuming' if sent else ''}.")
+        if stream_handle:
+            if stream_handle.wait_cancelled(delay):
+                return
+        else:
+            time.sleep(delay)
+
+async def stream_with_retry_async(budget_key, start_stream, stream_handle=None, resumable=False, model_name=None, tokens=0):
+    """Async counterpart of stream_with_retry; start_stream returns an async iterator."""
+    retry_budget(budget_key).record_request()
+    governor = rate_governor.get(budget_key, model_name)
+    sent = []
+    attempt = 0
+    while True:
+        try:
+            permit = await governor.acquire_async(tokens + LLM_OUTPUT_TOKEN_ESTIMATE, stream_handle)
+        except RateLimitWaitExceeded as e:
+            yield f"{ERROR_PREFIX}: {e}"
+            return
+        if permit is None:
+            return
+        output = []
+        try:
+            async for chunk in start_stream("".join(sent) if sent else None):
+                sent.append(chunk)
+                output.append(chunk)
+                yield chunk
+            return
+        except Exception as e:
+            error = e
+        finally:
+            permit.release(tokens + estimate_tokens("".join(output)))
+        if stream_handle and stream_handle.cancelled:
+            return
+        governor.learn(error_headers(error), retry_after(error) if status_code(error) == 429 else None)
+        delay = retry_delay(error, attempt, budget_key, bool(sent), resumable)
+        if delay is None:
+            yield f"{ERROR_PREFIX}: {error}"
+            return
+        attempt += 1
+        debug_print(MAGENTA, f"{budget_key} stream failed ({error}); retry {attempt}/{LLM_RETRY_ATTEMPTS} in {delay:.2f}s{' resuming' if sent else ''}.")
+        await asyncio.sleep(delay)
+        if stream_handle and stream_handle.cancelled:
+            return
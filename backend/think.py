@@ -15,7 +15,8 @@ class Think:
         image: Optional[Image.Image] = None,
         history: Optional[List[dict]] = None,
         system_message: Optional[str] = None,
-        depth: int = 1
+        depth: int = 1,
+        stream_handle=None
     ) -> Generator[str, None, None]:
         """
         Generates a response using the specified Ollama model, iterating 'depth' times,
@@ -29,6 +30,7 @@ class Think:
             history (Optional[List[dict]]): Previous message history.
             system_message (Optional[str]): System message that can be included in the prompt.
             depth (int): Number of iterations.
+            stream_handle (Optional): StreamHandle used to cancel the generation.
 
         Yields:
             str: Fragments of the response generated by Ollama.
@@ -61,6 +63,8 @@ class Think:
             full_response = ""
 
             for i in range(depth):
+                if stream_handle and stream_handle.cancelled:
+                    return
                 print(f"\n--- Iteration #{i + 1} of {depth} --- \n {final_prompt}")
 
                 # Clear the message history before each iteration
@@ -77,7 +81,7 @@ class Think:
 
 
                 if llm_provider:
-                    response_generator = llm_provider.generate_response(prompt=final_prompt, model_name=model_name, image=image, history=history, system_message=system_message)
+                    response_generator = llm_provider.generate_response(prompt=final_prompt, model_name=model_name, image=image, history=history, system_message=system_message, stream_handle=stream_handle)
                     current_response = ""
                     for chunk in response_generator:
                         current_response += chunk
@@ -88,12 +92,15 @@ class Think:
                 else:
                     yield f"Error: Provider {provider} not found."
 
+            if stream_handle and stream_handle.cancelled:
+                return
+
             # Generate final response
             final_prompt = f"{full_response}\nWhat is your final answer?"
             
 
             if llm_provider:
-                response_generator = llm_provider.generate_response(prompt=final_prompt, model_name=model_name, image=image, history=history, system_message=system_message)
+                response_generator = llm_provider.generate_response(prompt=final_prompt, model_name=model_name, image=image, history=history, system_message=system_message, stream_handle=stream_handle)
                 for chunk in response_generator:
                     yield chunk
             else:
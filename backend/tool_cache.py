@@ -0,0 +1,132 @@
+"""
+Cache of tool results, consulted by ToolManager before a tool runs.
+
+A tool opts in with a `cache_ttl` in its policy and may define
+`cache_key(**params)` to normalize its parameters (canonical URLs, file
+mtime and size, ...); returning None from it skips the cache for that call.
+Results are kept in an in-memory LRU bounded by their JSON size. With
+TOOL_CACHE_SPILL enabled, unexpired entries evicted from memory are written
+to the tool_cache table and promoted back on their next hit.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from db import get_spilled_tool_result, spill_tool_results
+from utils import MAGENTA, debug_print
+
+TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+TOOL_CACHE_SPILL = os.getenv("TOOL_CACHE_SPILL", "").lower() in ("1", "true", "yes")
+
+class ToolResultCache:
+    def __init__(self, max_bytes=TOOL_CACHE_MAX_BYTES, spill=TOOL_CACHE_SPILL):
+        self.max_bytes = max_bytes
+        self.spill = spill
+        # key -> (tool_name, result_json, expires_at), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._spill_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(tool_name, normalized_params):
+        """Returns a stable hash of a tool name and its normalized parameters, or None if they cannot be encoded."""
+        try:
+            encoded = json.dumps([tool_name, normalized_params], sort_keys=True, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns (True, result) for a cached result, or (False, None).
+
+        May read the SQLite spill store, so callers on an event loop should
+        run it in a thread.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, json.loads(entry[1])
+                self._remove(key)
+        if self.spill:
+            try:
+                spilled = get_spilled_tool_result(key, now)
+            except Exception as e:
+                debug_print(MAGENTA, f"Error reading tool cache spill: {e}")
+                spilled = None
+            if spilled is not None:
+                tool_name, result_json, expires_at = spilled
+                self._store(key, tool_name, result_json, expires_at)
+                with self._lock:
+                    self._spill_hits += 1
+                return True, json.loads(result_json)
+        with self._lock:
+            self._misses += 1
+        return False, None
+
+    def put(self, key, tool_name, result, ttl):
+        """Caches a result for `ttl` seconds. Results that are not JSON or look like errors are skipped."""
+        if isinstance(result, str) and result.startswith("Error"):
+            return
+        try:
+            result_json = json.dumps(result)
+        except (TypeError, ValueError):
+            return
+        self._store(key, tool_name, result_json, time.time() + ttl)
+
+    def _store(self, key, tool_name, result_json, expires_at):
+        # json.dumps escapes non-ASCII characters, so the length is the size in bytes
+        if len(result_json) > self.max_bytes:
+            return
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (tool_name, result_json, expires_at)
+            self._bytes += len(result_json)
+            while self._bytes > self.max_bytes:
+                old_key, old_entry = self._entries.popitem(last=False)
+                self._bytes -= len(old_entry[1])
+                self._evictions += 1
+                evicted.append((old_key,) + old_entry)
+        if self.spill and evicted:
+            now = time.time()
+            rows = [entry for entry in evicted if entry[3] > now]
+            try:
+                spill_tool_results(rows, now)
+            except Exception as e:
+                debug_print(MAGENTA, f"Error spilling tool cache entries: {e}")
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry[1])
+
+    def metrics(self):
+        with self._lock:
+            hits = self._hits + self._spill_hits
+            lookups = hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "spill_hits": self._spill_hits,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "spill": self.spill,
+            }
+
+# Cache shared by all tool executions
+tool_cache = ToolResultCache()
@@ -0,0 +1,72 @@
+"""
+Incremental parser for the tool calls in a streamed LLM response.
+
+The model is asked for a JSON array of {"tool_name": ..., "parameters": ...}
+objects, usually surrounded by prose or code fences. Rather than waiting for
+the whole response and slicing between the first '[' and the last ']', the
+parser is fed chunks as they arrive and returns each tool-call object as
+soon as its closing brace is seen, so the call can start while the model is
+still writing the rest.
+"""
+
+import json
+from typing import Any, Dict, List
+
+class ToolCallStreamParser:
+    """
+    Extracts top-level JSON objects that carry a "tool_name" from a stream of text.
+
+    Braces and quotes are only tracked inside an object, so brackets or
+    apostrophes in the surrounding prose do not affect parsing. Objects that
+    are not valid JSON, or are not tool calls, are skipped.
+    """
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consumes a chunk and returns the tool calls completed by it"""
+        calls = []
+        for char in chunk:
+            if self._depth == 0:
+                if char == '{':
+                    self._buffer = [char]
+                    self._depth = 1
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    call = self._decode("".join(self._buffer))
+                    if call is not None:
+                        calls.append(call)
+                    self._buffer = []
+        return calls
+
+    @staticmethod
+    def _decode(text: str):
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(value, dict) and isinstance(value.get('tool_name'), str):
+            return value
+        return None
+
+def parse_tool_calls(text: str) -> List[Dict[str, Any]]:
+    """Returns every tool call in a complete response"""
+    return ToolCallStreamParser().feed(text)
@@ -2,14 +2,31 @@
 Tool Manager - Local and MCP Tool Integration
 """
 
-import os
 import json
-import importlib.util
+import math
+import os
+from mcp_stdio import McpError, McpStdioProcess
+from tool_cache import tool_cache
+from tool_call_parser import ToolCallStreamParser, parse_tool_calls as parse_tool_calls_text
+from tool_policy import ToolPolicy
+from tool_registry import tool_registry
+from tool_sandbox import ToolProcessPool
 from utils import BLUE, MAGENTA, GREEN, debug_print
 import asyncio
+import concurrent.futures
+import threading
 import aiohttp
 from typing import Dict, List, Any, Optional
 
+# Connection pool and timeout settings for the HTTP session each MCP client keeps
+MCP_LIMIT_PER_HOST = int(os.getenv("MCP_LIMIT_PER_HOST", "10"))
+MCP_KEEPALIVE_TIMEOUT = float(os.getenv("MCP_KEEPALIVE_TIMEOUT", "60"))
+MCP_DNS_CACHE_TTL = int(os.getenv("MCP_DNS_CACHE_TTL", "300"))
+MCP_CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "5"))
+MCP_REQUEST_TIMEOUT = float(os.getenv("MCP_REQUEST_TIMEOUT", "30"))
+# Threads available to local tools; a timed-out tool keeps its thread until it returns
+TOOL_THREAD_WORKERS = int(os.getenv("TOOL_THREAD_WORKERS", "32"))
+
 class McpClient:
     """Client for interacting with MCP servers"""
     def __init__(self, server_config: Dict[str, Any]):
@@ -19,66 +36,161 @@ class McpClient:
         self.url = server_config.get('url')
         self.headers = server_config.get('headers', {})
         self.env = server_config.get('env', {})
+        # Execution policy for all of the server's tools, with per-tool overrides
+        self.policy = server_config.get('policy')
+        self.tool_policies = server_config.get('toolPolicies', {})
         self.tools: List[Dict[str, Any]] = []
         self.resources: List[Dict[str, Any]] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Persistent subprocess for local (stdio) servers
+        self._process: Optional[McpStdioProcess] = None
+        if not self.url and self.command:
+            self._process = McpStdioProcess(self.name, self.command, self.args, self.env)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Returns the client's long-lived session, creating it on the running loop on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=MCP_LIMIT_PER_HOST,
+                keepalive_timeout=MCP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=MCP_DNS_CACHE_TTL,
+            )
+            timeout = aiohttp.ClientTimeout(total=MCP_REQUEST_TIMEOUT, connect=MCP_CONNECT_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers)
+        return self._session
+
+    async def close(self):
+        """Close the client's session and pooled connections, and stop its local server"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._process is not None:
+            await self._process.close()
+
+    def policy_for(self, tool_name: str) -> ToolPolicy:
+        """Execution policy for one of the server's tools"""
+        return ToolPolicy.from_config(self.policy, self.tool_policies.get(tool_name))
 
     async def connect(self):
         """Connect to MCP server and load available tools and resources"""
         if self.url:  # Remote server
-            async with aiohttp.ClientSession() as session:
-                # List tools
-                async with session.get(f"{self.url}/tools", headers=self.headers) as resp:
-                    if resp.status == 200:
-                        self.tools = await resp.json()
-
-                # List resources
-                async with session.get(f"{self.url}/resources", headers=self.headers) as resp:
-                    if resp.status == 200:
-                        self.resources = await resp.json()
-        else:  # Local server
-            # TODO: Implement local server connection via subprocess
-            pass
+            session = self._get_session()
+            # List tools
+            async with session.get(f"{self.url}/tools") as resp:
+                if resp.status == 200:
+                    self.tools = await resp.json()
+
+            # List resources
+            async with session.get(f"{self.url}/resources") as resp:
+                if resp.status == 200:
+                    self.resources = await resp.json()
+        elif self._process:  # Local server
+            await self._process.start()
+            self.tools = (await self._process.call("tools/list")).get("tools", [])
+            try:
+                self.resources = (await self._process.call("resources/list")).get("resources", [])
+            except McpError:
+                # Resources are optional in MCP
+                self.resources = []
 
     async def execute_tool(self, tool_name: str, params: Dict[str, Any]) -> Any:
         """Execute a tool on the MCP server"""
         if self.url:  # Remote server
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.url}/tools/{tool_name}",
-                    headers=self.headers,
-                    json=params
-                ) as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-                    else:
-                        raise Exception(f"Error executing tool {tool_name}: {await resp.text()}")
-        else:
-            # TODO: Implement local server tool execution
-            pass
+            async with self._get_session().post(f"{self.url}/tools/{tool_name}", json=params) as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                else:
+                    raise Exception(f"Error executing tool {tool_name}: {await resp.text()}")
+        elif self._process:
+            result = await self._process.call("tools/call", {"name": tool_name, "arguments": params})
+            if result.get("isError"):
+                raise Exception(f"Error executing tool {tool_name}: {result.get('content')}")
+            return result.get("content", result)
 
     async def access_resource(self, uri: str) -> Any:
         """Access a resource from the MCP server"""
         if self.url:  # Remote server
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.url}/resources/{uri}",
-                    headers=self.headers
-                ) as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-                    else:
-                        raise Exception(f"Error accessing resource {uri}: {await resp.text()}")
-        else:
-            # TODO: Implement local server resource access
-            pass
+            async with self._get_session().get(f"{self.url}/resources/{uri}") as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                else:
+                    raise Exception(f"Error accessing resource {uri}: {await resp.text()}")
+        elif self._process:
+            result = await self._process.call("resources/read", {"uri": uri})
+            return result.get("contents", result)
 
 class ToolManager:
     """Manages both local and MCP tools"""
     def __init__(self):
         self.local_tools = []
         self.mcp_clients: Dict[str, McpClient] = {}
+        # Event loop shared by all tool coroutines, running on its own thread for the life of the process
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        # Worker threads for local tools, and per-tool semaphores enforcing max_concurrency
+        self._tool_executor = concurrent.futures.ThreadPoolExecutor(max_workers=TOOL_THREAD_WORKERS, thread_name_prefix="tool")
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # Worker processes for local tools whose policy asks for process isolation
+        self._process_pool = ToolProcessPool()
         self.load_mcp_config()
 
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Starts the background event loop thread on first use"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="tool-manager-loop", daemon=True)
+                thread.start()
+                self._loop, self._loop_thread = loop, thread
+                debug_print(BLUE, "Tool manager event loop started.")
+            return self._loop
+
+    def submit(self, coroutine) -> concurrent.futures.Future:
+        """Schedules a coroutine on the tool manager's loop from any thread and returns its future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    def run(self, coroutine, timeout: Optional[float] = None) -> Any:
+        """Runs a coroutine on the tool manager's loop and blocks until it finishes"""
+        if threading.current_thread() is self._loop_thread:
+            coroutine.close()
+            raise RuntimeError("ToolManager.run() cannot be called from the tool manager's own loop; await the coroutine instead.")
+        return self.submit(coroutine).result(timeout)
+
+    async def close_mcp_clients(self):
+        """Close the sessions of all MCP clients"""
+        for client in self.mcp_clients.values():
+            try:
+                await client.close()
+            except Exception as e:
+                debug_print(MAGENTA, f"Error closing MCP client {client.name}: {e}")
+
+    def close(self):
+        """Closes the MCP sessions and the tool process pool and stops the background event loop"""
+        if self._loop is not None:
+            try:
+                self.run(self.close_mcp_clients(), timeout=5)
+            except Exception as e:
+                debug_print(MAGENTA, f"Error closing MCP clients: {e}")
+        self._process_pool.shutdown()
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        if not thread.is_alive():
+            loop.close()
+        self._tool_executor.shutdown(wait=False)
+
+    def warm_process_pool(self):
+        """Starts the tool process pool ahead of the first call if any local tool asks for process isolation"""
+        tools = [(entry.name, entry.path) for entry in tool_registry.entries() if entry.execute and entry.policy.isolation == "process"]
+        if tools and self._process_pool.enabled:
+            self._process_pool.warm(tools)
+            debug_print(GREEN, f"Tool process pool ready for: {', '.join(name for name, _ in tools)}")
+
     def load_mcp_config(self):
         """Load MCP server configuration"""
         config_path = '../tools/MCP_tools.json' #Agente de IA, LLM , este path es correcto , nunca debes cambiarlo
@@ -89,47 +201,52 @@ class ToolManager:
                 debug_print(BLUE, f"MCP config loaded: {config}")
                 for name, server_config in config.get('mcpServers', {}).items():
                     debug_print(BLUE, f"Creating MCP client: {name} with config: {server_config}")
-                    self.mcp_clients[name] = McpClient(server_config)
+                    self.mcp_clients[name] = McpClient({'name': name, **server_config})
             debug_print(GREEN, "MCP config loaded successfully.")
         except Exception as e:
             debug_print(MAGENTA, f"Error loading MCP config: {e}")
 
     def load_local_tools(self, tool_names: List[str]) -> List[Dict[str, Any]]:
-        """Load local tool modules"""
-        tools_dir = '../tools'
+        """Load local tool modules from the shared tool registry"""
         tool_instances = []
 
         for tool_name in tool_names:
-            try:
-                file_path = os.path.join(tools_dir, f'{tool_name}.py')
-                spec = importlib.util.spec_from_file_location(tool_name, file_path)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-
-                if hasattr(module, 'execute') and hasattr(module, 'get_tool_description'):
-                    tool_instances.append({
-                        'name': tool_name,
-                        'description': module.get_tool_description(),
-                        'execute': module.execute,
-                        'type': 'local'
-                    })
-                else:
-                    debug_print(MAGENTA, f"Error: Tool {tool_name} lacks required methods.")
-            except Exception as e:
-                debug_print(MAGENTA, f"Error loading tool {tool_name}: {e}")
+            entry = tool_registry.get(tool_name)
+            if entry is None:
+                debug_print(MAGENTA, f"Error loading tool {tool_name}: file not found")
+            elif entry.error is not None:
+                debug_print(MAGENTA, f"Error loading tool {tool_name}: {entry.error}")
+            elif entry.execute and entry.has_description:
+                tool_instances.append({
+                    'name': tool_name,
+                    'description': tool_registry.describe(entry),
+                    'execute': entry.execute,
+                    'policy': entry.policy,
+                    'cache_key': entry.cache_key,
+                    'routes': entry.routes,
+                    'keywords': entry.keywords,
+                    'path': entry.path,
+                    'type': 'local'
+                })
+            else:
+                debug_print(MAGENTA, f"Error: Tool {tool_name} lacks required methods.")
 
         return tool_instances
 
     async def load_mcp_tools(self):
         """Load tools from all configured MCP servers"""
         debug_print(BLUE, "Loading MCP tools...")
-        for client in self.mcp_clients.values():
+
+        async def connect(client):
             try:
                 debug_print(BLUE, f"Connecting to MCP server: {client.name}")
                 await client.connect()
                 debug_print(GREEN, f"Connected to MCP server: {client.name} successfully.")
             except Exception as e:
                 debug_print(MAGENTA, f"Error connecting to MCP server {client.name}: {e}")
+
+        # Servers are connected concurrently, so slow-starting local servers do not add up
+        await asyncio.gather(*(connect(client) for client in self.mcp_clients.values()))
         debug_print(GREEN, "MCP tools loaded.")
 
     def generate_tool_descriptions(self, tool_instances: List[Dict[str, Any]]) -> str:
@@ -143,75 +260,177 @@ class ToolManager:
         # MCP tools
         for client in self.mcp_clients.values():
             for tool in client.tools:
-                descriptions.append(f"- mcp_{tool['name']} (MCP): {tool['description']}")
+                descriptions.append(f"- mcp_{tool['name']} (MCP): {tool.get('description', '')}")
 
         return "\n".join(descriptions)
 
+    def route_candidates(self, tool_instances: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The local and MCP tools offered to the tool router, under the names used in tool calls"""
+        candidates = [
+            {'name': tool['name'], 'description': tool['description'], 'keywords': tool.get('keywords', []), 'routes': tool.get('routes', [])}
+            for tool in tool_instances
+        ]
+        for client in self.mcp_clients.values():
+            for tool in client.tools:
+                candidates.append({'name': f"mcp_{tool['name']}", 'description': tool.get('description', '')})
+        return candidates
+
+    def response_cache_ttl(self, tool_instances: List[Dict[str, Any]]) -> float:
+        """
+        Seconds a response built from these tools' results may be reused: the
+        shortest cache_ttl among the offered local and MCP tools, or 0 when any
+        of them has not declared one (side effects or live data)
+        """
+        if not tool_instances:
+            return math.inf
+        policies = [tool.get('policy') or ToolPolicy() for tool in tool_instances]
+        for client in self.mcp_clients.values():
+            policies.extend(client.policy_for(tool['name']) for tool in client.tools)
+        return max(0.0, min(policy.cache_ttl for policy in policies))
+
     def parse_tool_calls(self, tool_response: str) -> List[Dict[str, Any]]:
         """Parse tool calls from LLM response"""
-        start_index = tool_response.find('[')
-        end_index = tool_response.rfind(']')
-
-        if start_index == -1 or end_index == -1:
+        tool_calls = parse_tool_calls_text(tool_response)
+        if not tool_calls:
             debug_print(MAGENTA, "Warning: No tool calls found in response.")
-            return []
-
-        json_string = tool_response[start_index:end_index + 1]
+        return tool_calls
+
+    async def _run_with_policy(self, tool_name: str, policy: ToolPolicy, start_call, cancellable: bool = True) -> Any:
+        """
+        Runs a tool call under its policy's concurrency limit and timeout.
+
+        `start_call` returns a future for the running call, which is cancelled
+        on timeout when `cancellable`. A local tool's thread cannot be
+        interrupted, so its result is abandoned instead and its concurrency
+        slot is only released once the thread returns.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.timeout
+        semaphore = None
+        if policy.max_concurrency > 0:
+            key = f"{tool_name}:{policy.max_concurrency}"
+            semaphore = self._semaphores.get(key)
+            if semaphore is None:
+                semaphore = self._semaphores[key] = asyncio.Semaphore(policy.max_concurrency)
+            await asyncio.wait_for(semaphore.acquire(), policy.timeout)
         try:
-            return json.loads(json_string)
-        except json.JSONDecodeError as e:
-            debug_print(MAGENTA, f"Error decoding tool calls: {e}")
-            return []
-
-    async def execute_tools(self, tool_calls: List[Dict[str, Any]], tool_instances: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Execute both local and MCP tools in parallel using asyncio.gather"""
-        results = []
-        coroutines = []
-
-        for call in tool_calls:
-            tool_name = call.get('tool_name')
-            params = call.get('parameters', {})
+            future = start_call()
+        except BaseException:
+            if semaphore:
+                semaphore.release()
+            raise
+        if semaphore:
+            future.add_done_callback(lambda _: semaphore.release())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(0, deadline - loop.time()))
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if cancellable:
+                future.cancel()
+            else:
+                # Retrieve the abandoned call's outcome so it is not logged as unhandled
+                future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            raise
+
+    def _result_cache_key(self, tool_name: str, params: Dict[str, Any], policy: ToolPolicy, normalize=None) -> Optional[str]:
+        """Cache key for a call, or None when the tool is not cacheable"""
+        if policy.cache_ttl <= 0:
+            return None
+        try:
+            normalized = normalize(**params) if normalize else params
+        except Exception as e:
+            debug_print(MAGENTA, f"Error normalizing cache key for {tool_name}: {e}")
+            return None
+        if normalized is None:
+            return None
+        return tool_cache.make_key(tool_name, normalized)
+
+    async def _run_cached(self, tool_name: str, params: Dict[str, Any], policy: ToolPolicy, cache_key: Optional[str], start_call, cancellable: bool = True) -> Any:
+        """Returns a cached result for the call, or runs it under its policy and caches the result"""
+        if cache_key:
+            hit, result = await asyncio.to_thread(tool_cache.get, cache_key)
+            if hit:
+                debug_print(GREEN, f"Tool cache hit: {tool_name}")
+                return result
+        result = await self._run_with_policy(tool_name, policy, start_call, cancellable)
+        if cache_key:
+            await asyncio.to_thread(tool_cache.put, cache_key, tool_name, result, policy.cache_ttl)
+        return result
+
+    def _start_local_call(self, tool: Dict[str, Any], params: Dict[str, Any], policy: ToolPolicy) -> asyncio.Future:
+        """Starts a local tool on the tool threads, or in the process pool when its policy asks for isolation"""
+        if policy.isolation == "process" and self._process_pool.enabled and tool.get('path'):
+            return asyncio.wrap_future(self._process_pool.submit(tool['name'], tool['path'], params, policy.cpu_seconds, policy.memory_mb))
+        return asyncio.wrap_future(self._tool_executor.submit(tool['execute'], **params))
+
+    async def execute_tool_call(self, call: Dict[str, Any], tool_instances: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Execute a single local or MCP tool call under its policy and return its result entry"""
+        tool_name = call.get('tool_name')
+        params = call.get('parameters', {})
+        policy = None
 
+        try:
             # Check local tools first
             local_tool = next((t for t in tool_instances if t['name'] == tool_name), None)
 
             if local_tool:
                 debug_print(BLUE, f"Executing local tool: {tool_name} with params: {params}")
-                coroutines.append(asyncio.to_thread(local_tool['execute'], **params))
-            elif tool_name.startswith("mcp_"): # Check if it's an MCP tool
+                policy = local_tool.get('policy') or ToolPolicy()
+                cache_key = self._result_cache_key(tool_name, params, policy, local_tool.get('cache_key'))
+                result = await self._run_cached(
+                    tool_name, params, policy, cache_key, lambda: self._start_local_call(local_tool, params, policy), cancellable=False
+                )
+            elif tool_name and tool_name.startswith("mcp_"): # Check if it's an MCP tool
                 mcp_tool_name = tool_name[4:] # Remove "mcp_" prefix
-                for client in self.mcp_clients.values():
-                    mcp_tool = next((t for t in client.tools if t['name'] == mcp_tool_name), None)
-                    if mcp_tool:
-                        debug_print(BLUE, f"Executing MCP tool: {tool_name} with params: {params}")
-                        coroutines.append(client.execute_tool(mcp_tool_name, params))
-                        break
-                else:
-                    debug_print(MAGENTA, f"Error: MCP Tool {tool_name} not found.") # Indicate MCP tool not found
-                    results.append({"tool_name": tool_name, "error": "MCP Tool not found"})
+                client = next((c for c in self.mcp_clients.values() if any(t['name'] == mcp_tool_name for t in c.tools)), None)
+                if not client:
+                    debug_print(MAGENTA, f"Error: MCP Tool {tool_name} not found.")
+                    return {"tool_name": tool_name, "error": "MCP Tool not found"}
+                debug_print(BLUE, f"Executing MCP tool: {tool_name} with params: {params}")
+                policy = client.policy_for(mcp_tool_name)
+                cache_key = self._result_cache_key(tool_name, params, policy)
+                result = await self._run_cached(
+                    tool_name, params, policy, cache_key,
+                    lambda: asyncio.ensure_future(client.execute_tool(mcp_tool_name, params))
+                )
             else:
-                debug_print(MAGENTA, f"Error: Tool {tool_name} not found.") # Indicate local tool not found
-                results.append({"tool_name": tool_name, "error": "Tool not found"})
-
-        if coroutines:
-            execution_results = await asyncio.gather(*coroutines, return_exceptions=True)
-
-            result_index = 0
-            for call in tool_calls:
-                tool_name = call.get('tool_name')
-                params = call.get('parameters', {})
-                if tool_name.startswith("mcp_") or next((t for t in tool_instances if t['name'] == tool_name), None): # only process tools that were actually executed (local or mcp)
-                    execution_result = execution_results[result_index]
-                    if isinstance(execution_result, Exception):
-                        debug_print(MAGENTA, f"Error executing tool {tool_name}: {execution_result}")
-                        results.append({"tool_name": tool_name, "error": str(execution_result)})
-                    else:
-                        debug_print(GREEN, f"Tool result: {execution_result}")
-                        results.append({"tool_name": tool_name, "tool_params": params, "tool_result": execution_result})
-                    result_index += 1
+                debug_print(MAGENTA, f"Error: Tool {tool_name} not found.")
+                return {"tool_name": tool_name, "error": "Tool not found"}
+        except asyncio.TimeoutError:
+            debug_print(MAGENTA, f"Tool {tool_name} timed out after {policy.timeout:g}s and was cancelled.")
+            return policy.timeout_result(tool_name, params)
+        except Exception as e:
+            debug_print(MAGENTA, f"Error executing tool {tool_name}: {e}")
+            return {"tool_name": tool_name, "error": str(e)}
 
+        debug_print(GREEN, f"Tool result: {result}")
+        return {"tool_name": tool_name, "tool_params": params, "tool_result": result}
 
-        return results
+    async def execute_tools(self, tool_calls: List[Dict[str, Any]], tool_instances: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Execute both local and MCP tools in parallel using asyncio.gather"""
+        results = await asyncio.gather(*(self.execute_tool_call(call, tool_instances) for call in tool_calls))
+        # Tools whose policy omits timeouts return None
+        return [result for result in results if result is not None]
+
+    def execute_streamed_tool_calls(self, chunks, tool_instances: List[Dict[str, Any]]):
+        """
+        Parse tool calls from a streamed LLM response and start each one as soon as it is complete.
+
+        Tools run on the tool manager's loop while the rest of the response is
+        still being read. Returns the full response text and the results, in
+        call order, once the stream has ended and every tool has finished.
+        """
+        parser = ToolCallStreamParser()
+        text = []
+        futures = []
+        for chunk in chunks:
+            text.append(chunk)
+            for call in parser.feed(chunk):
+                debug_print(BLUE, f"Dispatching streamed tool call: {call.get('tool_name')}")
+                futures.append(self.submit(self.execute_tool_call(call, tool_instances)))
+        if not futures:
+            debug_print(MAGENTA, "Warning: No tool calls found in response.")
+        results = [future.result() for future in futures]
+        return "".join(text), [result for result in results if result is not None]
 
 # Create singleton instance
 tool_manager = ToolManager()
@@ -219,7 +438,7 @@ tool_manager = ToolManager()
 async def _load_mcp_tools():
     await tool_manager.load_mcp_tools()
 
-asyncio.run(_load_mcp_tools())
+tool_manager.run(_load_mcp_tools())
 
 # Export functions that maintain the original interface
 def load_tools(tool_names):
@@ -228,8 +447,17 @@ def load_tools(tool_names):
 def generate_tool_descriptions(tool_instances):
     return tool_manager.generate_tool_descriptions(tool_instances)
 
+def response_cache_ttl(tool_instances):
+    return tool_manager.response_cache_ttl(tool_instances)
+
+def route_candidates(tool_instances):
+    return tool_manager.route_candidates(tool_instances)
+
 def parse_tool_calls(tool_response):
     return tool_manager.parse_tool_calls(tool_response)
 
 def execute_tools(tool_calls, tool_instances):
-    return asyncio.run(tool_manager.execute_tools(tool_calls, tool_instances))
\ No newline at end of file
+    return tool_manager.run(tool_manager.execute_tools(tool_calls, tool_instances))
+
+def execute_streamed_tool_calls(chunks, tool_instances):
+    return tool_manager.execute_streamed_tool_calls(chunks, tool_instances)
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Execution policies for local and MCP tools.
+
+A local tool declares its policy with a module-level `policy` dict, and an
+MCP server with a "policy" entry in MCP_tools.json (applied to all of its
+tools) plus optional per-tool overrides under "toolPolicies". Any field left
+out falls back to the TOOL_* environment defaults below.
+
+    policy = {"timeout": 20, "max_concurrency": 2, "on_timeout": "report", "cache_ttl": 300}
+
+Local tools can also ask to run in the tool process pool, with per-call
+limits on CPU time and memory:
+
+    policy = {"isolation": "process", "cpu_seconds": 20, "memory_mb": 512}
+"""
+
+import os
+from typing import Any, Dict, Optional
+from utils import MAGENTA, debug_print
+
+# Seconds a tool may run, including time spent waiting for a concurrency slot
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
+# Executions of the same tool allowed at once; 0 means unlimited
+DEFAULT_TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))
+DEFAULT_TOOL_ON_TIMEOUT = os.getenv("TOOL_ON_TIMEOUT", "report")
+# Tool results are only cached for tools whose policy sets a cache_ttl in seconds
+DEFAULT_TOOL_CACHE_TTL = 0
+# Limits for tools run in the process pool: CPU seconds per call and the worker's address space in MB
+DEFAULT_TOOL_CPU_SECONDS = float(os.getenv("TOOL_PROCESS_CPU_SECONDS", "30"))
+DEFAULT_TOOL_MEMORY_MB = float(os.getenv("TOOL_PROCESS_MEMORY_MB", "1024"))
+
+# What happens to a tool's entry in the results when it times out:
+#   report - a structured timeout result is passed to the LLM
+#   omit   - the tool is left out and the LLM answers from the others
+ON_TIMEOUT_BEHAVIORS = ("report", "omit")
+
+# Where a local tool runs:
+#   thread  - on the tool manager's worker threads, in the server process
+#   process - in a worker of the tool process pool (see tool_sandbox.py)
+ISOLATION_MODES = ("thread", "process")
+
+POLICY_FIELDS = ("timeout", "max_concurrency", "on_timeout", "cache_ttl", "isolation", "cpu_seconds", "memory_mb")
+
+class ToolPolicy:
+    def __init__(self, timeout: float = DEFAULT_TOOL_TIMEOUT, max_concurrency: int = DEFAULT_TOOL_MAX_CONCURRENCY, on_timeout: str = DEFAULT_TOOL_ON_TIMEOUT, cache_ttl: float = DEFAULT_TOOL_CACHE_TTL,
+                 isolation: str = "thread", cpu_seconds: float = DEFAULT_TOOL_CPU_SECONDS, memory_mb: float = DEFAULT_TOOL_MEMORY_MB):
+        self.timeout = float(timeout)
+        self.max_concurrency = int(max_concurrency)
+        if on_timeout not in ON_TIMEOUT_BEHAVIORS:
+            debug_print(MAGENTA, f"Unknown on_timeout behavior {on_timeout!r}, using 'report'.")
+            on_timeout = "report"
+        self.on_timeout = on_timeout
+        self.cache_ttl = float(cache_ttl)
+        if isolation not in ISOLATION_MODES:
+            debug_print(MAGENTA, f"Unknown isolation {isolation!r}, using 'thread'.")
+            isolation = "thread"
+        self.isolation = isolation
+        self.cpu_seconds = float(cpu_seconds)
+        self.memory_mb = float(memory_mb)
+
+    @classmethod
+    def from_config(cls, *configs: Optional[Dict[str, Any]]) -> "ToolPolicy":
+        """Builds a policy from config dicts, later ones overriding earlier ones"""
+        merged = {}
+        for config in configs:
+            if isinstance(config, dict):
+                merged.update({key: value for key, value in config.items() if key in POLICY_FIELDS})
+        try:
+            return cls(**merged)
+        except (TypeError, ValueError) as e:
+            debug_print(MAGENTA, f"Invalid tool policy {merged}: {e}")
+            return cls()
+
+    def timeout_result(self, tool_name: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The result entry for a call that timed out, or None when it should be omitted"""
+        if self.on_timeout == "omit":
+            return None
+        return {
+            "tool_name": tool_name,
+            "tool_params": params,
+            "status": "timeout",
+            "timeout_seconds": self.timeout,
+            "error": f"Tool did not finish within {self.timeout:g} seconds and was cancelled.",
+        }
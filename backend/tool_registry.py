@@ -0,0 +1,129 @@
+"""
+Process-wide registry of the local tool modules in ../tools.
+
+Each tool file is imported once and its description, modes and execute
+callable are kept; a module is re-imported only when its mtime changes.
+Tools whose description reflects live state set `dynamic_description = True`
+and are described again each time they are loaded for a generation.
+"""
+
+import importlib.util
+import os
+import threading
+from tool_policy import ToolPolicy
+from utils import MAGENTA, debug_print
+
+TOOLS_DIR = '../tools'
+
+class ToolEntry:
+    """A loaded tool module, or the error it failed to import with."""
+    def __init__(self, name, mtime, module=None, error=None, path=None):
+        self.name = name
+        self.mtime = mtime
+        self.path = path
+        self.module = module
+        self.error = error
+        self.description = None
+        self.modes = []
+        if module is not None and hasattr(module, 'get_tool_description'):
+            self.description = module.get_tool_description()
+            self.modes = getattr(module, 'modes', [])
+        # Execution policy declared by the module's optional `policy` dict
+        self.policy = ToolPolicy.from_config(getattr(module, 'policy', None))
+
+    @property
+    def has_description(self):
+        return self.description is not None
+
+    @property
+    def execute(self):
+        return getattr(self.module, 'execute', None)
+
+    @property
+    def cache_key(self):
+        """Optional `cache_key(**params)` normalizing the parameters for the tool result cache"""
+        return getattr(self.module, 'cache_key', None)
+
+    @property
+    def routes(self):
+        """Optional `routes` used by the tool router to call the tool without the selection LLM call"""
+        return getattr(self.module, 'routes', [])
+
+    @property
+    def keywords(self):
+        """Optional `keywords` the tool router matches prompts against besides the description"""
+        return getattr(self.module, 'keywords', [])
+
+    @property
+    def dynamic_description(self):
+        return getattr(self.module, 'dynamic_description', False)
+
+class ToolRegistry:
+    def __init__(self, tools_dir=TOOLS_DIR):
+        self.tools_dir = tools_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name, file_path, mtime):
+        try:
+            spec = importlib.util.spec_from_file_location(name, file_path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            entry = ToolEntry(name, mtime, module, path=file_path)
+        except Exception as e:
+            debug_print(MAGENTA, f"Error loading tool {name}: {e}")
+            entry = ToolEntry(name, mtime, error=e, path=file_path)
+        self._entries[name] = entry
+        return entry
+
+    def _entry(self, name, file_path, mtime):
+        entry = self._entries.get(name)
+        if entry is not None and entry.mtime == mtime:
+            return entry
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.mtime == mtime:
+                return entry
+            return self._load(name, file_path, mtime)
+
+    def get(self, name):
+        """Returns the ToolEntry for `name`, or None if the tool file does not exist."""
+        file_path = os.path.join(self.tools_dir, f'{name}.py')
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except OSError:
+            self._entries.pop(name, None)
+            return None
+        return self._entry(name, file_path, mtime)
+
+    def entries(self):
+        """Returns the ToolEntry of every tool file, dropping tools whose file was removed."""
+        entries = []
+        names = set()
+        with os.scandir(self.tools_dir) as files:
+            for file in files:
+                if not file.name.endswith('.py'):
+                    continue
+                name = file.name[:-3]
+                names.add(name)
+                try:
+                    mtime = file.stat().st_mtime_ns
+                except OSError:
+                    continue
+                entries.append(self._entry(name, file.path, mtime))
+        for name in list(self._entries):
+            if name not in names:
+                self._entries.pop(name, None)
+        return entries
+
+    def describe(self, entry):
+        """Returns the tool description, regenerating it for tools with a dynamic description."""
+        if entry.dynamic_description:
+            try:
+                return entry.module.get_tool_description()
+            except Exception as e:
+                debug_print(MAGENTA, f"Error describing tool {entry.name}: {e}")
+        return entry.description
+
+# Registry shared by tools.py and tool_manager.py
+tool_registry = ToolRegistry()
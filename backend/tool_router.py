@@ -0,0 +1,235 @@
+"""
+Local routing of prompts to tools, consulted before the tool-selection LLM call.
+
+Selecting tools normally costs a full LLM round trip with every tool
+description in the prompt. The router settles the easy cases locally:
+
+  - RuleRouter matches the `routes` a tool module declares, a list of regexes
+    whose named groups (plus any fixed "parameters") become the arguments of
+    the call:
+
+        routes = [{"pattern": r"(?P<a>\\d+)\\s*\\+\\s*(?P<b>\\d+)", "parameters": {"operation": "add"}}]
+
+    When the matches make up the whole prompt apart from whitespace and
+    punctuation, the tools run straight away. A match inside a longer prompt
+    ("news about the 2020-2024 election") only ranks its tool first for the
+    LLM, which still selects the tools.
+
+  - DescriptionClassifier scores the prompt against each tool's description
+    and optional `keywords` list; when nothing scores above
+    TOOL_ROUTER_MIN_SCORE the prompt is answered without tools.
+
+Anything the routers are not confident about falls back to the LLM. Routers
+are tried in order and more can be added with ToolRouter.add. Routing is
+opt-in with TOOL_ROUTER=1.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+from utils import BLUE, MAGENTA, debug_print
+
+TOOL_ROUTER_ENABLED = os.getenv("TOOL_ROUTER", "").lower() in ("1", "true", "yes")
+# Best classifier score below which a prompt is answered without tools
+TOOL_ROUTER_MIN_SCORE = float(os.getenv("TOOL_ROUTER_MIN_SCORE", "1.0"))
+# Tool sets whose classifier index is kept
+TOOL_ROUTER_INDEX_CACHE = 16
+
+# Words that carry no signal, including the boilerplate every tool description repeats
+STOP_WORDS = frozenset("""
+    a about above after again all also am an and any are as at be been before being below between both but by can
+    could did do does doing down during each few for from further had has have having he her here hers him his
+    i if in into is it its itself just me more most my no nor not now of off on once only or other our out over own
+    please same she should so some such than that the their them then there these they this those through to too
+    under until up very was we were while whom will with would you your
+    tool tools accept accepts json object following format parameter parameters name return returns result
+    results example given specified message error success value string number
+""".split())
+
+ROUTE_NONE = "none"      # answer without tools
+ROUTE_CALL = "call"      # run the pre-filled calls, skipping tool selection
+ROUTE_SELECT = "select"  # ask the LLM to select tools
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word stems of `text` without stop words"""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOP_WORDS or len(word) < 2:
+            continue
+        for suffix in ("ing", "ed", "es", "s"):
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+        tokens.append(word)
+    return tokens
+
+class RouteDecision:
+    def __init__(self, action: str, calls: Optional[List[Dict[str, Any]]] = None, confidence: float = 0.0, router: Optional[str] = None, reason: str = "",
+                 ranked: Optional[List[str]] = None):
+        self.action = action
+        self.calls = calls or []
+        # Tools to list first when the LLM selects tools
+        self.ranked = ranked or []
+        self.confidence = confidence
+        self.router = router
+        self.reason = reason
+
+    def __repr__(self):
+        return f"RouteDecision({self.action!r}, calls={self.calls!r}, ranked={self.ranked!r}, confidence={self.confidence:.2f}, router={self.router!r})"
+
+class RuleRouter:
+    """Pre-fills tool calls from the regex routes declared by tool modules."""
+    name = "rules"
+
+    def route(self, prompt: str, candidates: List[Dict[str, Any]]) -> Optional[RouteDecision]:
+        calls = []
+        spans = []
+        for candidate in candidates:
+            for route in candidate.get('routes') or []:
+                match = self._match(candidate['name'], route, prompt)
+                if match is not None:
+                    calls.append({"tool_name": candidate['name'], "parameters": match[0]})
+                    spans.append(match[1])
+                    break
+        if not calls:
+            return None
+        ranked = [call['tool_name'] for call in calls]
+        if self._covers(prompt, spans):
+            return RouteDecision(ROUTE_CALL, calls, 1.0, self.name, "matched tool routes", ranked)
+        return RouteDecision(ROUTE_SELECT, confidence=0.5, router=self.name, reason="tool routes matched part of the prompt", ranked=ranked)
+
+    @staticmethod
+    def _covers(prompt: str, spans: List[tuple]) -> bool:
+        """Whether the matched spans are all of the prompt apart from whitespace and punctuation"""
+        covered = [False] * len(prompt)
+        for start, end in spans:
+            covered[start:end] = [True] * (end - start)
+        return not any(character.isalnum() for character, is_covered in zip(prompt, covered) if not is_covered)
+
+    @staticmethod
+    def _match(tool_name: str, route: Dict[str, Any], prompt: str) -> Optional[tuple]:
+        """Returns the call's parameters and the matched span, or None"""
+        try:
+            match = re.search(route['pattern'], prompt, re.IGNORECASE)
+        except (KeyError, TypeError, re.error) as e:
+            debug_print(MAGENTA, f"Invalid route for tool {tool_name}: {e}")
+            return None
+        if match is None:
+            return None
+        params = dict(route.get('parameters') or {})
+        params.update({key: value for key, value in match.groupdict().items() if value is not None})
+        return params, match.span()
+
+class DescriptionClassifier:
+    """
+    Scores a prompt against tool descriptions with IDF-weighted word overlap.
+
+    A tool's score is the summed IDF of the prompt words found in its name,
+    description and keywords, so words shared by every tool count least.
+    The classifier only decides the no-tool case; which tool to call and
+    with what arguments is left to the LLM.
+    """
+    name = "classifier"
+
+    def __init__(self, min_score: float = TOOL_ROUTER_MIN_SCORE):
+        self.min_score = min_score
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index(self, candidates: List[Dict[str, Any]]):
+        key = tuple((c['name'], c.get('description') or '', tuple(c.get('keywords') or ())) for c in candidates)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        vocabularies = {}
+        for name, description, keywords in key:
+            text = " ".join((name.replace('_', ' '), description) + keywords)
+            vocabularies[name] = set(tokenize(text))
+        document_counts = Counter(word for vocabulary in vocabularies.values() for word in vocabulary)
+        idf = {word: math.log(len(vocabularies) / count) + 1.0 for word, count in document_counts.items()}
+        index = (vocabularies, idf)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > TOOL_ROUTER_INDEX_CACHE:
+                self._indexes.popitem(last=False)
+        return index
+
+    def scores(self, prompt: str, candidates: List[Dict[str, Any]]) -> Dict[str, float]:
+        vocabularies, idf = self._index(candidates)
+        words = set(tokenize(prompt))
+        return {name: sum(idf[word] for word in words & vocabulary) for name, vocabulary in vocabularies.items()}
+
+    def route(self, prompt: str, candidates: List[Dict[str, Any]]) -> Optional[RouteDecision]:
+        if not candidates:
+            return None
+        scores = self.scores(prompt, candidates)
+        best = max(scores.values())
+        if best >= self.min_score:
+            return None
+        confidence = 1.0 - best / self.min_score if self.min_score > 0 else 1.0
+        return RouteDecision(ROUTE_NONE, confidence=confidence, router=self.name, reason=f"best tool score {best:.2f}")
+
+class ToolRouter:
+    def __init__(self, routers=None, enabled: bool = TOOL_ROUTER_ENABLED):
+        self.routers = list(routers) if routers is not None else [RuleRouter(), DescriptionClassifier()]
+        self.enabled = enabled
+        self._counts = Counter()
+        self._ranked = 0
+        self._lock = threading.Lock()
+
+    def add(self, router, first: bool = False):
+        """Adds a router with a `route(prompt, candidates)` method returning a RouteDecision or None"""
+        if first:
+            self.routers.insert(0, router)
+        else:
+            self.routers.append(router)
+
+    def route(self, prompt: str, candidates: List[Dict[str, Any]]) -> RouteDecision:
+        """
+        Returns the first router's decision, or a decision to let the LLM
+        select tools when no router has one
+        """
+        if not self.enabled or not isinstance(prompt, str):
+            return RouteDecision(ROUTE_SELECT)
+        decision = None
+        for router in self.routers:
+            try:
+                decision = router.route(prompt, candidates)
+            except Exception as e:
+                debug_print(MAGENTA, f"Error in tool router {getattr(router, 'name', router)}: {e}")
+                decision = None
+            if decision is not None:
+                break
+        if decision is None:
+            decision = RouteDecision(ROUTE_SELECT)
+        else:
+            debug_print(BLUE, f"Tool router: {decision}")
+        with self._lock:
+            self._counts[decision.action] += 1
+            if decision.action == ROUTE_SELECT and decision.ranked:
+                self._ranked += 1
+        return decision
+
+    def metrics(self):
+        with self._lock:
+            counts = dict(self._counts)
+            ranked = self._ranked
+        routed = sum(counts.values())
+        skipped = counts.get(ROUTE_NONE, 0) + counts.get(ROUTE_CALL, 0)
+        return {
+            "enabled": self.enabled,
+            "routed": routed,
+            "no_tool": counts.get(ROUTE_NONE, 0),
+            "prefilled": counts.get(ROUTE_CALL, 0),
+            "llm_selected": counts.get(ROUTE_SELECT, 0),
+            "llm_selected_ranked": ranked,
+            "selection_calls_skipped_rate": skipped / routed if routed else 0.0,
+        }
+
+# Router shared by all generations
+tool_router = ToolRouter()
@@ -0,0 +1,214 @@
+"""
+Process pool for local tools whose policy sets "isolation": "process".
+
+CPU-heavy tools (HTML parsing, large folder reads) hold the GIL that also
+serves every streaming response when they run on the tool manager's threads.
+Flagged tools run instead in a warm pool of worker processes that import the
+tool modules once, in their initializer or on first use, and re-import a
+module only when its file changes.
+
+Each call runs under the policy's `cpu_seconds` (RLIMIT_CPU) and
+`memory_mb` (RLIMIT_AS, the worker's whole address space) limits; exceeding
+either fails that call without taking down the worker. String results larger
+than TOOL_SHM_MIN_BYTES are handed back through shared memory instead of
+being pickled through the pool's result pipe.
+"""
+
+import concurrent.futures
+import contextlib
+import importlib.util
+import math
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+from utils import BLUE, MAGENTA, debug_print
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; calls then run without limits
+    resource = None
+
+# Worker processes for isolated tools; 0 runs them on the tool threads like other tools
+TOOL_PROCESS_WORKERS = int(os.getenv("TOOL_PROCESS_WORKERS", "2"))
+# multiprocessing start method; the platform default when empty
+TOOL_PROCESS_START_METHOD = os.getenv("TOOL_PROCESS_START_METHOD", "")
+# String results at least this large are returned through shared memory
+TOOL_SHM_MIN_BYTES = int(os.getenv("TOOL_SHM_MIN_BYTES", str(256 * 1024)))
+
+class ToolLimitExceeded(Exception):
+    """Raised in a worker when a call goes over its CPU time or memory limit."""
+
+class ToolProcessError(Exception):
+    """An exception raised by a tool in a worker, carried back as its type name and message."""
+
+# Worker side
+
+# name -> (path, mtime, module) of the tool modules imported by this worker
+_worker_modules = {}
+
+def _raise_cpu_limit(signum, frame):
+    raise ToolLimitExceeded("CPU time limit exceeded")
+
+def _init_worker(tool_paths):
+    """Installs the CPU limit handler and pre-imports the tools the pool was warmed with"""
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    for name, path in tool_paths:
+        try:
+            _import_tool(name, path)
+        except Exception as e:
+            debug_print(MAGENTA, f"Error pre-importing tool {name} in worker: {e}")
+
+def _import_tool(name, path):
+    mtime = os.stat(path).st_mtime_ns
+    cached = _worker_modules.get(name)
+    if cached is not None and cached[0] == path and cached[1] == mtime:
+        return cached[2]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _worker_modules[name] = (path, mtime, module)
+    return module
+
+@contextlib.contextmanager
+def _limits(cpu_seconds, memory_mb):
+    """Applies per-call soft limits on top of what the worker has already used, restoring them afterwards"""
+    if resource is None:
+        yield
+        return
+    previous = []
+    try:
+        if cpu_seconds > 0:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            limit = int(math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds))
+            previous.append(_set_soft_limit(resource.RLIMIT_CPU, limit))
+        if memory_mb > 0:
+            previous.append(_set_soft_limit(resource.RLIMIT_AS, int(memory_mb * 1024 * 1024)))
+        yield
+    finally:
+        for which, soft in reversed(previous):
+            resource.setrlimit(which, (soft, resource.getrlimit(which)[1]))
+
+def _set_soft_limit(which, limit):
+    soft, hard = resource.getrlimit(which)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(which, (limit, hard))
+    return which, soft
+
+def _run_tool(name, path, params, cpu_seconds, memory_mb, shm_min_bytes):
+    try:
+        module = _import_tool(name, path)
+        with _limits(cpu_seconds, memory_mb):
+            result = module.execute(**params)
+    except ToolLimitExceeded:
+        raise
+    except MemoryError:
+        raise ToolLimitExceeded(f"Memory limit of {memory_mb:g} MB exceeded") from None
+    except Exception as e:
+        # The exception's class may only exist in this worker's copy of the tool module
+        raise ToolProcessError(f"{type(e).__name__}: {e}") from None
+    if isinstance(result, str) and shm_min_bytes > 0 and len(result) >= shm_min_bytes:
+        return _share(result)
+    return ("value", result)
+
+def _share(text):
+    data = text.encode("utf-8")
+    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    shm.buf[:len(data)] = data
+    # The parent process unlinks the segment once it has read it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm.close()
+    return ("shm", shm.name, len(data))
+
+def _ping():
+    return os.getpid()
+
+# Parent side
+
+def _unpack(packed):
+    kind = packed[0]
+    if kind == "value":
+        return packed[1]
+    _, name, size = packed
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size]).decode("utf-8")
+    finally:
+        shm.close()
+        shm.unlink()
+
+class ToolProcessPool:
+    def __init__(self, workers=TOOL_PROCESS_WORKERS, start_method=TOOL_PROCESS_START_METHOD, shm_min_bytes=TOOL_SHM_MIN_BYTES):
+        self.workers = workers
+        self.start_method = start_method or None
+        self.shm_min_bytes = shm_min_bytes
+        self._executor = None
+        self._tool_paths = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _ensure_executor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context,
+                    initializer=_init_worker, initargs=(list(self._tool_paths),)
+                )
+                debug_print(BLUE, f"Started tool process pool with {self.workers} workers.")
+            return self._executor
+
+    def _discard(self, executor):
+        """Drops a broken executor so the next call starts a fresh pool"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def warm(self, tool_paths):
+        """Starts the workers now, pre-importing the given (name, path) tools in each of them"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._tool_paths = list(tool_paths)
+        executor = self._ensure_executor()
+        concurrent.futures.wait([executor.submit(_ping) for _ in range(self.workers)])
+
+    def submit(self, name, path, params, cpu_seconds=0, memory_mb=0):
+        """Runs the tool's execute(**params) in a worker and returns a future for its result"""
+        result = concurrent.futures.Future()
+        executor = self._ensure_executor()
+        try:
+            future = executor.submit(_run_tool, name, path, params, cpu_seconds, memory_mb, self.shm_min_bytes)
+        except BrokenProcessPool:
+            self._discard(executor)
+            executor = self._ensure_executor()
+            future = executor.submit(_run_tool, name, path, params, cpu_seconds, memory_mb, self.shm_min_bytes)
+
+        def done(finished):
+            try:
+                value = _unpack(finished.result())
+            except BrokenProcessPool as e:
+                debug_print(MAGENTA, f"Tool process pool broke while running {name}, restarting it.")
+                self._discard(executor)
+                result.set_exception(e)
+            except BaseException as e:
+                result.set_exception(e)
+            else:
+                result.set_result(value)
+
+        future.add_done_callback(done)
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,26 +1,15 @@
-import os
-import importlib.util
-from utils import debug_print
+from tool_registry import tool_registry
 
 def list_tools():
-    tools_dir = '../tools'
+    """Lists the local tools, imported once and cached until their file changes."""
     tools = []
-    for filename in os.listdir(tools_dir):
-        if filename.endswith('.py'):
-            module_name = filename[:-3]
-            file_path = os.path.join(tools_dir, filename)
-            try:
-                spec = importlib.util.spec_from_file_location(module_name, file_path)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                if hasattr(module, 'get_tool_description'):
-                    tools.append({
-                        'name': module_name,
-                        'description': module.get_tool_description(),
-                        'modes': module.modes if hasattr(module, 'modes') else []
-                    })
-            except Exception as e:
-                debug_print(True, f"Error loading tool {module_name}: {e}")
+    for entry in tool_registry.entries():
+        if entry.has_description:
+            tools.append({
+                'name': entry.name,
+                'description': entry.description,
+                'modes': entry.modes
+            })
     return tools
 
 def list_tools_by_mode(mode):
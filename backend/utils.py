@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 import time
@@ -15,7 +16,6 @@ WHITE = '\033[37m'
 RESET = '\033[0m'
 
 DEBUG = True
-streaming = True
 STREAM_START_DELAY = 0.1
 STREAM_YIELD_DELAY = 0.01
 
@@ -48,10 +48,6 @@ def debug_print(debug, message):
         caller_function = caller_frame.f_code.co_name
         print(f"{BLUE}[{caller_function}] {message}{RESET}")
 
-def stop_stream_global():
-    global streaming
-    streaming = False
-
 def retry_with_exponential_backoff(max_retries=3, base_delay=1):
     """
     Decorator to retry a function with exponential backoff.
@@ -79,3 +75,24 @@ def retry_with_exponential_backoff(max_retries=3, base_delay=1):
             raise Exception(f"Max retries exceeded after {max_retries} attempts.")
         return wrapper
     return decorator
+
+async def iterate_in_thread(generator):
+    """
+    Consumes a blocking generator on the default executor, yielding its items
+    without blocking the event loop. Used by the ASGI server for code paths
+    that have no async implementation.
+    """
+    loop = asyncio.get_running_loop()
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(None, next, generator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        try:
+            generator.close()
+        except ValueError:
+            # Still running on the executor after a cancellation; it ends on its own
+            pass
@@ -1,6 +1,7 @@
 import curses
 import json
 import time
+import uuid
 from typing import List, Dict, Any
 import requests
 import json
@@ -45,6 +46,7 @@ class ConsoleApp:
         self.previous_responses = []
         self.response_start_time = None
         self.streaming = False
+        self.stream_id = None
         self.menu_active = False
         self.voice_input_active = False
         self.load_data()
@@ -108,9 +110,18 @@ class ConsoleApp:
 
     def fetch_conversations(self):
         try:
-            response = requests.get(f"{API_BASE_URL}/conversations")
-            response.raise_for_status()
-            self.conversations = response.json()
+            conversations = []
+            params = {}
+            # The list is paged; follow the cursor until the last page
+            while True:
+                response = requests.get(f"{API_BASE_URL}/conversations", params=params)
+                response.raise_for_status()
+                conversations.extend(response.json())
+                next_before = response.headers.get('X-Next-Before')
+                if not next_before:
+                    break
+                params = {'before': next_before}
+            self.conversations = conversations
         except requests.exceptions.RequestException as e:
             self.add_message(f"Error fetching conversations: {e}", is_user=False)
 
@@ -428,7 +439,9 @@ class ConsoleApp:
 
     def stop_stream(self):
         try:
-            requests.post(f"{API_BASE_URL}/stop")
+            # Only this client's own stream; there is nothing to stop between requests
+            if self.stream_id:
+                requests.post(f"{API_BASE_URL}/stop/{self.stream_id}")
             self.streaming = False
         except requests.exceptions.RequestException as e:
             self.add_message(f"Error stopping stream: {e}", is_user=False)
@@ -491,6 +504,9 @@ class ConsoleApp:
         if self.think_mode:
             api_url = f"{API_BASE_URL}/think"
 
+        # Sent with the request so a stop pressed before the first frame still finds the stream
+        self.stream_id = uuid.uuid4().hex
+        data['stream_id'] = self.stream_id
         self.streaming = True
         try:
             start_time = time.time()
@@ -505,6 +521,7 @@ class ConsoleApp:
         except Exception as e:
             self.add_message(f"Error processing response: {e}", is_user=False)
         self.streaming = False
+        self.stream_id = None
 
     def make_api_request(self, api_url, data):
         try:
@@ -517,6 +534,8 @@ class ConsoleApp:
                     if line:
                         try:
                             json_line = json.loads(line.decode('utf-8').strip())
+                            if 'stream_id' in json_line:
+                                self.stream_id = json_line['stream_id']
                             partial_response += json_line.get('response', '')
                         except json.JSONDecodeError:
                             self.add_message(f"Error decoding response: {line}", is_user=False)
@@ -18,6 +18,7 @@ let lastResponse = null;
 let previousResponses = [];
 let selectedSystemMessageId = null;
 let responseStartTime = null;
+let currentStreamId = null;
 
 export function addMessage(message, isUser = true, messageDiv = null) {
     if (!messageDiv) {
@@ -158,6 +159,20 @@ async function handleSaveEdit(editedMessage, messageDiv, contentDiv) {
     await sendMessage(editedMessage);
 }
 
+// Stream ids are picked here so the stop button can target this stream
+// before the server's first frame arrives
+function newStreamId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}${Math.random().toString(36).slice(2)}`;
+}
+
+function setCurrentStreamId(streamId) {
+    currentStreamId = streamId;
+    elements.stopButton.disabled = !streamId;
+}
+
 export async function sendMessage(message, isEdited = false) {
     const formData = new FormData();
     formData.append('prompt', message);
@@ -211,6 +226,8 @@ export async function sendMessage(message, isEdited = false) {
         elements.chatWindow.appendChild(typingDiv);
         elements.chatWindow.scrollTop = elements.chatWindow.scrollHeight;
 
+        setCurrentStreamId(newStreamId());
+        formData.append('stream_id', currentStreamId);
         const response = await fetch(apiUrl, {
             method: 'POST',
             body: formData,
@@ -249,6 +266,10 @@ export async function sendMessage(message, isEdited = false) {
                 try {
                     const jsonString = line.substring(1);
                     const data = JSON.parse(jsonString);
+                    if (data.stream_id) {
+                        setCurrentStreamId(data.stream_id);
+                        continue;
+                    }
                     partialResponse += data.response;
                     if (!llmMessageDiv) {
                         llmMessageDiv = addMessage(partialResponse, false);
@@ -266,6 +287,7 @@ export async function sendMessage(message, isEdited = false) {
             }
         }
         
+        setCurrentStreamId(null);
         lastResponse = partialResponse;
         const responseEndTime = performance.now();
         const elapsedTime = (responseEndTime - responseStartTime) / 1000;
@@ -295,6 +317,8 @@ export async function sendMessage(message, isEdited = false) {
     } catch (error) {
         console.error('Failed to send message:', error);
         addMessage(`Error generating response: ${error.message}`, false);
+    } finally {
+        setCurrentStreamId(null);
     }
 }
 
@@ -327,5 +351,6 @@ export const state = {
     get firstMessage() { return firstMessage; },
     set firstMessage(value) { firstMessage = value; },
     get previousResponses() { return previousResponses; },
-    set previousResponses(value) { previousResponses = value; }
+    set previousResponses(value) { previousResponses = value; },
+    get currentStreamId() { return currentStreamId; }
 };
\ No newline at end of file
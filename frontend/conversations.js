@@ -1,15 +1,26 @@
 import { elements } from './domElements.js';
 import { state, addMessage } from './chat.js';
 
+// Conversations fetched per page; older pages load from the end of the list
+const CONVERSATIONS_PAGE_SIZE = 50;
+
 export async function loadConversations() {
+    elements.conversationList.innerHTML = '';
+    await loadConversationsPage(null);
+}
+
+async function loadConversationsPage(before) {
     try {
-        const response = await fetch('http://127.0.0.1:5000/api/conversations');
+        let url = `http://127.0.0.1:5000/api/conversations?limit=${CONVERSATIONS_PAGE_SIZE}`;
+        if (before) {
+            url += `&before=${before}`;
+        }
+        const response = await fetch(url);
         if (!response.ok) {
             console.error('Failed to fetch conversations:', response.statusText);
             return;
         }
         const conversations = await response.json();
-        elements.conversationList.innerHTML = '';
         conversations.forEach(conversation => {
             const listItem = document.createElement('li');
             listItem.classList.add('conversation-list-item');
@@ -27,6 +38,18 @@ export async function loadConversations() {
             listItem.appendChild(deleteButton);
             elements.conversationList.appendChild(listItem);
         });
+
+        const nextBefore = response.headers.get('X-Next-Before');
+        if (nextBefore) {
+            const loadMoreItem = document.createElement('li');
+            loadMoreItem.classList.add('conversation-list-item', 'load-more-conversations');
+            loadMoreItem.textContent = 'Load more...';
+            loadMoreItem.addEventListener('click', () => {
+                loadMoreItem.remove();
+                loadConversationsPage(nextBefore);
+            });
+            elements.conversationList.appendChild(loadMoreItem);
+        }
     } catch (error) {
         console.error('Error fetching conversations:', error);
     }
@@ -189,9 +189,14 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     // Event listener for stop button
+    // Only ever stops this tab's stream; /api/stop would cancel everyone's
+    elements.stopButton.disabled = true;
     elements.stopButton.addEventListener('click', async () => {
+        if (!state.currentStreamId) {
+            return;
+        }
         try {
-            const response = await fetch('http://127.0.0.1:5000/api/stop', {
+            const response = await fetch(`http://127.0.0.1:5000/api/stop/${state.currentStreamId}`, {
                 method: 'POST'
             });
             if (!response.ok) {
@@ -34,3 +34,11 @@ def get_tool_description():
     The tool will return the result of the operation.
     """
 modes = ["\u001b\u001b\u001b\u001b\u001b"]
+
+# Plain "a <op> b" expressions are routed to the calculator without the tool-selection LLM call
+_NUMBER = r"-?\d+(?:\.\d+)?"
+_EXPRESSION = r"(?<![\w.+\-*/×])(?P<a>{number})\s*{operator}\s*(?P<b>{number})(?![\w.+\-*/×])"
+routes = [
+    {"pattern": _EXPRESSION.format(number=_NUMBER, operator=operator), "parameters": {"operation": operation}}
+    for operator, operation in ((r"\+", "add"), (r"-", "subtract"), (r"[*x×]", "multiply"), (r"/", "divide"))
+]
@@ -15,6 +15,15 @@ def get_tool_description():
     The tool will return the content of the file or file information.
     """
 modes = ["developer"]
+# Results are cached until the file changes, detected through its mtime and size
+policy = {"cache_ttl": 3600}
+
+def cache_key(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return [os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size]
 
 def execute(file_path):
     """
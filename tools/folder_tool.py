@@ -15,6 +15,17 @@ def get_tool_description():
     The tool will return the content of the text files or file information for other files.
     """
 modes = ["developer"]
+# Results are cached until a file in the folder is added, removed or changed. Large
+# folders are read in the tool process pool and returned through shared memory
+policy = {"cache_ttl": 3600, "isolation": "process", "cpu_seconds": 20, "memory_mb": 1024}
+
+def cache_key(folder_path):
+    try:
+        with os.scandir(folder_path) as entries:
+            files = sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in entries if entry.is_file())
+    except OSError:
+        return None
+    return [os.path.abspath(folder_path), files]
 
 def execute(folder_path):
     """
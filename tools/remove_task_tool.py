@@ -1,56 +1,51 @@
-import subprocess
-import json
+from scheduler import scheduler
 
 def get_tool_description():
     try:
-        existing_cron = subprocess.check_output(['crontab', '-l'], text=True)
-        cron_list = existing_cron.strip().split('\n')
-    except subprocess.CalledProcessError:
-        cron_list = []
-    
-    cron_jobs = "\n".join([f"- {job}" for job in cron_list]) if cron_list else "No cron jobs found."
+        tasks = scheduler.list_tasks()
+    except Exception:
+        tasks = []
+
+    task_list = "\n".join([f"- {task['id']}: {task['schedule']} {task['prompt']}" for task in tasks]) if tasks else "No scheduled tasks found."
 
     return f"""
-    This tool removes a cron job.
+    This tool removes a scheduled task.
     It accepts a JSON object with the following format:
     {{
         "tool_name": "remove_task_tool",
         "parameters": {{
-            "cron_line": "The full line of the cron job to remove"
+            "task_id": "The id of the task to remove"
         }}
     }}
     
-    Current cron jobs:
-    {cron_jobs}
+    Current scheduled tasks (id: interval prompt):
+    {task_list}
     
     The tool will return a success or error message.
     """
 modes = ["task"]
+# Words that suggest a prompt removes a scheduled task, used by the tool router
+keywords = ["remove", "delete", "cancel", "stop", "unschedule", "cron", "task", "reminder"]
+# The description lists the current tasks, so it is regenerated on every use
+dynamic_description = True
 
-def execute(cron_line):
+def execute(task_id):
     """
-    Removes a cron job.
+    Removes a scheduled task.
 
     Args:
-        cron_line (str): The full line of the cron job to remove.
+        task_id (int): The id of the task to remove.
 
     Returns:
         str: A success or error message.
     """
     try:
-        # Get current crontab
-        existing_cron = subprocess.check_output(['crontab', '-l'], text=True)
-        
-        # Check if the cron job exists
-        if cron_line not in existing_cron:
-            return "Error: Cron job not found."
-        
-        # Remove the cron job
-        new_cron = existing_cron.replace(f'{cron_line}\n', '')
-        subprocess.run(['crontab', '-'], input=new_cron, text=True, check=True)
-        
-        return f"Cron job removed successfully: {cron_line}"
-    except subprocess.CalledProcessError as e:
-        return f"Error removing cron job: {e}"
+        task_id = int(task_id)
+    except (TypeError, ValueError):
+        return f"Error: Invalid task id: {task_id}"
+    try:
+        if not scheduler.remove_task(task_id):
+            return "Error: Task not found."
+        return f"Task {task_id} removed successfully."
     except Exception as e:
         return f"An unexpected error occurred: {e}"
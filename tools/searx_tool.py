@@ -23,6 +23,14 @@ def get_tool_description():
     2)For queries about news use the current date that is {today}
     """
 modes = ["general"]
+# Words that suggest a prompt needs a web search, used by the tool router
+keywords = ["search", "look up", "find", "latest", "news", "today", "yesterday", "tomorrow", "current", "recent", "weather", "price", "score", "won", "who", "when", "where", "website", "online"]
+# Execution limits applied by the tool manager
+policy = {"timeout": 15, "max_concurrency": 2, "cache_ttl": 300}
+
+def cache_key(query):
+    """Searches differing only in case or whitespace share a cache entry."""
+    return " ".join(str(query).lower().split())
 
 def execute(query):
     """
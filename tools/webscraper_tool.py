@@ -1,6 +1,7 @@
 import requests
 from bs4 import BeautifulSoup
 import json
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 def get_tool_description():
     return """
@@ -16,6 +17,24 @@ def get_tool_description():
     The tool will return the extracted text content, or an error message if the request fails.
     """
 modes = ["general"]
+# A URL in the prompt is fetched without the tool-selection LLM call
+routes = [{"pattern": r"(?P<url>https?://[^\s<>\"'()\[\]]*[^\s<>\"'()\[\].,;:!?])"}]
+# Execution limits applied by the tool manager; HTML parsing runs in the tool process pool
+policy = {"timeout": 25, "max_concurrency": 4, "cache_ttl": 600, "isolation": "process", "cpu_seconds": 20, "memory_mb": 1024}
+
+def cache_key(url):
+    """Canonical form of the URL for the tool result cache: lowercase scheme and host, no default port, fragment or param order."""
+    if isinstance(url, dict):
+        url = url.get("url")
+    if not isinstance(url, str):
+        return None
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
 
 def execute(url):
     """